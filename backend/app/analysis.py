@@ -0,0 +1,90 @@
+"""向量化预警推理：把所有站点的最新读数装进列数组，按规则集批量计算等级"""
+from datetime import datetime
+from typing import List, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from . import crud, schemas
+from .features import feature_store
+
+GREEN, ORANGE, RED = 0, 1, 2
+LEVEL_NAMES = np.array(["GREEN", "ORANGE", "RED"])
+
+
+def evaluate_levels(
+    temperature: np.ndarray, chlorophyll: np.ndarray, rules: schemas.WarningRuleSet,
+    temperature_slope: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """对整列数据一次性计算预警等级，返回 int8 等级编码数组 (temperature_slope 缺失值为 NaN)"""
+    red = (temperature > rules.red_temperature) & (chlorophyll > rules.red_chlorophyll)
+    orange = (temperature > rules.orange_temperature) & (
+        chlorophyll > rules.orange_chlorophyll
+    )
+    if rules.orange_temperature_slope is not None and temperature_slope is not None:
+        orange |= temperature_slope > rules.orange_temperature_slope
+    return np.select([red, orange], [RED, ORANGE], default=GREEN).astype(np.int8)
+
+
+def _message(level: int, temperature: float, chlorophyll: float, threshold_hit: bool,
+             slope: Optional[float], rules: schemas.WarningRuleSet) -> str:
+    """按实际触发的条件生成说明：ORANGE 可能只由水温斜率触发"""
+    if level == RED:
+        return f"监测到高温({temperature}℃)与富营养化，爆发概率极高！"
+    if level == ORANGE:
+        reasons = []
+        if threshold_hit:
+            reasons.append(f"水温({temperature}℃)与叶绿素({chlorophyll})偏高")
+        if slope is not None:
+            reasons.append(f"24 小时水温斜率({slope:.2f}℃/小时)超过阈值({rules.orange_temperature_slope})")
+        return f"{'，'.join(reasons)}，存在爆发风险，请加强监测。"
+    return "当前环境指标正常，暂无爆发风险。"
+
+
+def _feature(zone_id: int, name: str) -> float:
+    vector = feature_store.get(zone_id)
+    value = vector[name] if vector is not None else None
+    return np.nan if value is None else value
+
+
+def predict_all_zones(db: Session, rules: schemas.WarningRuleSet) -> List[dict]:
+    """对所有有数据的站点打分，每个站点返回一条 WarningResult"""
+    rows = crud.get_latest_readings(db)
+    if not rows:
+        return []
+    zone_ids, names, _times, temperature, chlorophyll = zip(*rows)
+    temperature = np.asarray(temperature, dtype=np.float64)
+    chlorophyll = np.asarray(chlorophyll, dtype=np.float64)
+    slope = None
+    if rules.orange_temperature_slope is not None:
+        # 趋势特征直接读特征库，不再扫描历史数据
+        slope = np.array([_feature(zone_id, "temperature_slope") for zone_id in zone_ids], dtype=np.float64)
+    levels = evaluate_levels(temperature, chlorophyll, rules, slope)
+    return warning_results(zone_ids, names, temperature, chlorophyll, levels, rules, slope)
+
+
+def warning_results(zone_ids, names, temperature: np.ndarray, chlorophyll: np.ndarray, levels: np.ndarray,
+                    rules: Optional[schemas.WarningRuleSet] = None,
+                    temperature_slope: Optional[np.ndarray] = None) -> List[dict]:
+    """已算好等级的列数组 -> WarningResult 字典列表 (共享内存快照也走这里，规则为默认值)"""
+    rules = rules or schemas.WarningRuleSet()
+    now = datetime.now()
+    level_names = LEVEL_NAMES[levels].tolist()
+    # 与 evaluate_levels 相同的条件，用于说明 ORANGE 由哪些条件触发
+    threshold_hit = ((temperature > rules.orange_temperature) & (chlorophyll > rules.orange_chlorophyll)).tolist()
+    slope_hit = [False] * len(levels)
+    if rules.orange_temperature_slope is not None and temperature_slope is not None:
+        slope_hit = (temperature_slope > rules.orange_temperature_slope).tolist()
+        temperature_slope = temperature_slope.tolist()
+    levels, temperature, chlorophyll = levels.tolist(), temperature.tolist(), chlorophyll.tolist()
+    return [
+        {
+            "level": level_names[i],
+            "zone_id": zone_ids[i],
+            "zone_name": names[i] or str(zone_ids[i]),
+            "message": _message(levels[i], temperature[i], chlorophyll[i], threshold_hit[i],
+                                temperature_slope[i] if slope_hit[i] else None, rules),
+            "timestamp": now,
+        }
+        for i in range(len(levels))
+    ]
@@ -0,0 +1,230 @@
+"""
+写入路径上的在线异常检测：每个站点每个指标维护 EWMA 均值与方差，新读数的 z-score 超过阈值即记为异常
+(如盐度剧变、溶解氧骤降)。状态为 (站点数 × 指标数) 的 NumPy 数组，每个站点约 100 字节；
+异常事件经后台线程批量写入 anomaly_events 表，不阻塞上传请求
+
+状态在进程内，只由本进程的写入 (ingest 监听器) 更新；启动时用每个站点最近 ANOMALY_SEED_ROWS 条读数建立基线。
+同一站点的读数应由同一个进程写入 (单个 ingest 进程，或网关按站点固定路由到 worker)，
+否则各 worker 的基线只包含部分读数，检测结果会偏差
+"""
+import logging
+import os
+import queue
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import desc, insert, select, true, tuple_
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+ANOMALY_ALPHA = float(os.getenv("ANOMALY_ALPHA", "0.1"))
+ANOMALY_Z = float(os.getenv("ANOMALY_Z", "4.0"))
+# 每个站点前若干条读数只用于建立基线，不报警
+ANOMALY_WARMUP = int(os.getenv("ANOMALY_WARMUP", "12"))
+# 各指标标准差下限，避免长期平稳的指标因微小波动被判为异常
+MIN_STD = np.array([0.2, 0.1, 0.05, 0.05, 0.1, 0.05])  # 顺序同 models.SENSOR_METRICS
+# 启动时每个站点用于建立基线的最近读数条数
+ANOMALY_SEED_ROWS = int(os.getenv("ANOMALY_SEED_ROWS", "48"))
+# 待写入事件队列上限，超出丢弃并计数
+EVENT_QUEUE_SIZE = 10_000
+
+_METRICS = models.SENSOR_METRICS
+
+
+class AnomalyDetector:
+    def __init__(self, alpha: float = ANOMALY_ALPHA, threshold: float = ANOMALY_Z, warmup: int = ANOMALY_WARMUP):
+        self.alpha = alpha
+        self.threshold = threshold
+        self.warmup = warmup
+        self._lock = threading.Lock()
+        self._index: Dict[int, int] = {}  # zone_id -> 行号
+        capacity = 1024
+        self.mean = np.zeros((capacity, len(_METRICS)))
+        self.var = np.zeros((capacity, len(_METRICS)))
+        self.count = np.zeros(capacity, dtype=np.int32)
+        self.last_time = np.full(capacity, np.datetime64("NaT"), dtype="datetime64[us]")
+
+    def _row(self, zone_id: int) -> int:
+        row = self._index.get(zone_id)
+        if row is None:
+            row = self._index[zone_id] = len(self._index)
+            if row == len(self.count):  # 容量翻倍
+                self.mean = np.concatenate([self.mean, np.zeros_like(self.mean)])
+                self.var = np.concatenate([self.var, np.zeros_like(self.var)])
+                self.count = np.concatenate([self.count, np.zeros_like(self.count)])
+                self.last_time = np.concatenate([self.last_time, np.full_like(self.last_time, np.datetime64("NaT"))])
+        return row
+
+    def observe(self, rows: List[dict]) -> List[dict]:
+        """更新状态并返回异常事件；乱序到达的旧读数不参与更新"""
+        events = []
+        with self._lock:
+            for reading in rows:
+                r = self._row(reading["zone_id"])
+                record_time = np.datetime64(reading["record_time"], "us")
+                if not np.isnat(self.last_time[r]) and record_time < self.last_time[r]:
+                    continue
+                self.last_time[r] = record_time
+                x = np.array([reading[m] for m in _METRICS], dtype=np.float64)
+
+                if self.count[r] == 0:
+                    self.mean[r] = x
+                    self.count[r] = 1
+                    continue
+                diff = x - self.mean[r]
+                z = diff / np.maximum(np.sqrt(self.var[r]), MIN_STD)
+                if self.count[r] >= self.warmup:
+                    for i in np.flatnonzero(np.abs(z) > self.threshold).tolist():
+                        events.append({
+                            "zone_id": reading["zone_id"],
+                            "log_id": reading["id"],
+                            "record_time": reading["record_time"],
+                            "metric": _METRICS[i],
+                            "value": float(x[i]),
+                            "expected": float(self.mean[r, i]),
+                            "zscore": float(z[i]),
+                        })
+                # EWMA 均值 / 方差
+                incr = self.alpha * diff
+                self.mean[r] += incr
+                self.var[r] = (1 - self.alpha) * (self.var[r] + diff * incr)
+                self.count[r] += 1
+        return events
+
+    def seed(self, rows: List[dict]):
+        """用历史读数 (按站点、时间排序) 建立基线，不产生事件；已有状态的站点跳过"""
+        with self._lock:
+            known = set(self._index)
+        self.observe([r for r in rows if r["zone_id"] not in known])
+
+    @property
+    def zone_count(self) -> int:
+        return len(self._index)
+
+
+def _recent_stmt(limit: int):
+    """每个站点最近 limit 条读数 (LATERAL 子查询逐站点走 (zone_id, record_time) 索引)"""
+    log, latest = models.SensorLog, models.ZoneLatest
+    recent = (
+        select(log.id, log.zone_id, log.record_time, *[getattr(log, m) for m in _METRICS])
+        .where(log.zone_id == latest.zone_id)
+        .order_by(desc(log.record_time), desc(log.id))
+        .limit(limit)
+        .lateral()
+    )
+    return select(recent).select_from(latest).join(recent, true())
+
+
+def seed_detector(db: Session, limit: int = ANOMALY_SEED_ROWS):
+    """启动时从 sensor_logs 恢复各站点的 EWMA 状态，避免重启后每个站点重新经历 warmup"""
+    rows = [dict(r._mapping) for r in db.execute(_recent_stmt(limit))]
+    rows.sort(key=lambda r: (r["zone_id"], r["record_time"], r["id"]))
+    detector.seed(rows)
+
+
+def record_events(db: Session, events: List[dict]):
+    if not events:
+        return
+    detected_at = datetime.now()
+    db.execute(insert(models.AnomalyEvent), [dict(e, detected_at=detected_at) for e in events])
+    db.commit()
+
+
+_STOP = object()
+
+
+class EventWriter:
+    """后台线程批量写入异常事件 (首次有事件时启动，stop 时写完队列中的事件后退出)"""
+
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+        self._queue: queue.Queue = queue.Queue(maxsize=EVENT_QUEUE_SIZE)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.dropped = 0
+
+    def submit(self, events: List[dict]):
+        for event in events:
+            try:
+                self._queue.put_nowait(event)
+            except queue.Full:
+                self.dropped += 1
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="anomaly-events", daemon=True)
+                    self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        with self._start_lock:
+            thread = self._thread
+        if thread is None:
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.warning("anomaly event queue still full after %ss, pending events are lost", timeout)
+            return
+        thread.join(timeout)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            while len(batch) < 1000:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if _STOP in batch:
+                stopping = True
+                batch = [e for e in batch if e is not _STOP]
+            if not batch:
+                continue
+            db = self.session_factory()
+            try:
+                record_events(db, batch)
+            except Exception:
+                logger.exception("failed to record %d anomaly events", len(batch))
+            finally:
+                db.close()
+        with self._start_lock:
+            self._thread = None
+
+
+detector = AnomalyDetector()
+event_writer = EventWriter()
+
+
+def on_ingest(rows: List[dict]):
+    """ingest 监听器：检测在请求线程内完成，事件写库交给后台线程"""
+    events = detector.observe(rows)
+    if events:
+        event_writer.submit(events)
+
+
+def _alerts_stmt(zone_id=None, metric=None, start=None, end=None, limit: int = 100, after=None):
+    event = models.AnomalyEvent
+    stmt = select(event)
+    if zone_id is not None:
+        stmt = stmt.where(event.zone_id == zone_id)
+    if metric is not None:
+        stmt = stmt.where(event.metric == metric)
+    if start is not None:
+        stmt = stmt.where(event.record_time >= start)
+    if end is not None:
+        stmt = stmt.where(event.record_time < end)
+    if after is not None:
+        stmt = stmt.where(tuple_(event.record_time, event.id) < tuple_(*after))
+    return stmt.order_by(desc(event.record_time), desc(event.id)).limit(limit)
+
+
+def get_alerts(db: Session, zone_id=None, metric=None, start=None, end=None, limit: int = 100, after=None):
+    """按时间倒序的异常事件，after 为上一页最后一条的 (record_time, id)"""
+    return db.scalars(_alerts_stmt(zone_id, metric, start, end, limit, after)).all()
@@ -0,0 +1,211 @@
+"""
+预警规则回测：把站点历史读数按列读入，对一组 (水温阈值 × 叶绿素阈值) 规则一次性做数组运算，
+以 horizon 小时内是否出现密度超过 outbreak_density 的读数为真值，统计 precision / recall / 提前量。
+站点分块后可分散到进程池，每个进程自己读库、自己计算，只回传计数。
+读数按站点流式读取、逐站点打分，规则矩阵按块计算，内存只与单个站点的读数量有关。
+"""
+from concurrent.futures import FIRST_COMPLETED, Executor, wait
+from itertools import product
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import models, schemas
+from .database import SessionLocal, engine
+
+# 每个进程任务处理的站点数
+BACKTEST_CHUNK_ZONES = 200
+# 单次计算的 (规则数 × 读数数) 上限，规则按块计算，控制预警矩阵的大小
+BACKTEST_MAX_CELLS = 4_000_000
+_HOUR = np.timedelta64(1, "h")
+
+
+def _rule_grid(config: schemas.BacktestRequest):
+    pairs = list(product(config.temperature_thresholds, config.chlorophyll_thresholds))
+    return np.array([p[0] for p in pairs]), np.array([p[1] for p in pairs])
+
+
+def _zone_ids_stmt():
+    return select(models.ZoneLatest.zone_id).order_by(models.ZoneLatest.zone_id)
+
+
+def _readings_stmt(zone_ids: List[int], start=None, end=None):
+    log = models.SensorLog
+    stmt = select(log.zone_id, log.record_time, log.temperature, log.chlorophyll, log.jellyfish_density).where(
+        log.zone_id.in_(zone_ids)
+    )
+    if start is not None:
+        stmt = stmt.where(log.record_time >= start)
+    if end is not None:
+        stmt = stmt.where(log.record_time < end)
+    return stmt.order_by(log.zone_id, log.record_time, log.id)
+
+
+def _columns(batch):
+    zone, times, temperature, chlorophyll, density = zip(*batch)
+    return (
+        np.asarray(zone, dtype=np.int64),
+        np.asarray(times, dtype="datetime64[us]"),
+        np.asarray(temperature, dtype=np.float64),
+        np.asarray(chlorophyll, dtype=np.float64),
+        np.asarray(density, dtype=np.float64),
+    )
+
+
+def iter_zone_columns(db: Session, zone_ids: List[int], start=None, end=None,
+                      batch_size: int = 50_000) -> Iterator[List[np.ndarray]]:
+    """服务端游标分批读取，按站点逐个产出 (times, temperature, chlorophyll, density)，内存中只保留一批读数和一个站点"""
+    pending = []  # 当前站点已读到的列块
+    result = db.execute(
+        _readings_stmt(zone_ids, start, end).execution_options(stream_results=True, yield_per=batch_size)
+    )
+    for batch in result.partitions():
+        zone, *columns = _columns(batch)
+        bounds = np.flatnonzero(np.diff(zone)) + 1
+        for lo, hi in zip(np.concatenate(([0], bounds)), np.concatenate((bounds, [len(zone)]))):
+            if pending and pending[-1][0] != zone[lo]:
+                yield [np.concatenate(cols) for cols in zip(*(p[1] for p in pending))]
+                pending = []
+            pending.append((zone[lo], [c[lo:hi] for c in columns]))
+    if pending:
+        yield [np.concatenate(cols) for cols in zip(*(p[1] for p in pending))]
+
+
+def _empty_totals(n_rules: int) -> Dict[str, np.ndarray]:
+    totals = {k: np.zeros(n_rules, dtype=np.int64) for k in ("tp", "fp", "fn", "detected")}
+    totals["lead_hours"] = np.zeros(n_rules, dtype=np.float64)
+    totals["readings"] = totals["outbreaks"] = totals["positives"] = 0
+    return totals
+
+
+def score_zone(times, temperature, chlorophyll, density, rule_t, rule_c, outbreak_density, horizon_hours):
+    """
+    单个站点 (按时间排序) 的全部规则打分
+    - 读数为正例：其后 horizon 小时内 (不含当前) 出现密度 >= outbreak_density 的读数
+    - 爆发起点：密度由低于阈值变为不低于阈值的读数；提前量 = 起点时间 - 起点前 horizon 小时内最早的预警时间
+    """
+    n = len(times)
+    horizon = np.timedelta64(horizon_hours, "h")
+    over = density >= outbreak_density
+    outbreak_times = times[over]
+    nxt = np.searchsorted(outbreak_times, times, side="right")
+    actual = np.zeros(n, dtype=bool)
+    has_next = nxt < len(outbreak_times)
+    actual[has_next] = outbreak_times[nxt[has_next]] <= times[has_next] + horizon
+
+    onsets = np.flatnonzero(over & ~np.concatenate(([False], over[:-1])))
+    window_start = np.searchsorted(times, times[onsets] - horizon, side="left")
+    # 规则按块计算，(规则数, 读数数) 的矩阵不超过 BACKTEST_MAX_CELLS
+    block = max(1, BACKTEST_MAX_CELLS // max(n, 1))
+    parts = [
+        _score_rules(times, temperature, chlorophyll, actual, onsets, window_start,
+                     rule_t[i:i + block], rule_c[i:i + block])
+        for i in range(0, len(rule_t), block)
+    ]
+    scores = {key: np.concatenate([p[key] for p in parts]) for key in ("tp", "fp", "fn", "detected", "lead_hours")}
+    scores.update(readings=n, outbreaks=len(onsets), positives=int(actual.sum()))
+    return scores
+
+
+def _score_rules(times, temperature, chlorophyll, actual, onsets, window_start, rule_t, rule_c) -> dict:
+    n = len(times)
+    # (规则数, 读数数) 的预警矩阵
+    warn = (temperature[None, :] > rule_t[:, None]) & (chlorophyll[None, :] > rule_c[:, None])
+    tp = (warn & actual).sum(axis=1)
+    fp = (warn & ~actual).sum(axis=1)
+    fn = (~warn & actual).sum(axis=1)
+
+    detected = np.zeros(len(rule_t), dtype=np.int64)
+    lead = np.zeros(len(rule_t))
+    if len(onsets):
+        # next_warn[r, i]: 位置 i 及之后第一个预警的位置 (没有则为 n)
+        idx = np.where(warn, np.arange(n), n)
+        next_warn = np.minimum.accumulate(idx[:, ::-1], axis=1)[:, ::-1]
+        next_warn = np.concatenate([next_warn, np.full((len(rule_t), 1), n)], axis=1)
+        first = next_warn[:, window_start]  # (规则数, 起点数)
+        hit = first <= onsets[None, :]
+        detected = hit.sum(axis=1)
+        first_times = times[np.minimum(first, n - 1)]
+        lead_hours = (times[onsets][None, :] - first_times) / _HOUR
+        lead = np.where(hit, lead_hours, 0).sum(axis=1)
+    return {"tp": tp, "fp": fp, "fn": fn, "detected": detected, "lead_hours": lead}
+
+
+def _score_zones(zones, config: schemas.BacktestRequest) -> dict:
+    rule_t, rule_c = _rule_grid(config)
+    totals = _empty_totals(len(rule_t))
+    for times, temperature, chlorophyll, density in zones:
+        scores = score_zone(times, temperature, chlorophyll, density, rule_t, rule_c,
+                            config.outbreak_density, config.horizon_hours)
+        for key in totals:
+            totals[key] = totals[key] + scores[key]
+    return totals
+
+
+def _score_chunk(zone_ids: List[int], config: schemas.BacktestRequest) -> dict:
+    """进程池任务：独立连接读库并打分"""
+    engine.dispose(close=False)  # 子进程不能复用父进程的连接 (forkserver 启动时连接池本就为空)
+    db = SessionLocal()
+    try:
+        return _score_zones(iter_zone_columns(db, zone_ids, config.start, config.end), config)
+    finally:
+        db.close()
+
+
+def _map_bounded(executor: Executor, chunks: List[List[int]], config: schemas.BacktestRequest, limit: int):
+    """共享进程池上同时最多提交 limit 个任务，结果顺序不影响累加"""
+    pending, parts = set(), []
+    for chunk in chunks:
+        if len(pending) >= limit:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            parts.extend(f.result() for f in done)
+        pending.add(executor.submit(_score_chunk, chunk, config))
+    parts.extend(f.result() for f in wait(pending).done)
+    return parts
+
+
+def run_backtest(db: Session, config: schemas.BacktestRequest, executor: Optional[Executor] = None) -> dict:
+    zone_ids = config.zone_ids or list(db.scalars(_zone_ids_stmt()))
+    chunks = [zone_ids[i:i + BACKTEST_CHUNK_ZONES] for i in range(0, len(zone_ids), BACKTEST_CHUNK_ZONES)]
+    if executor is None:
+        parts = [_score_zones(iter_zone_columns(db, chunk, config.start, config.end), config) for chunk in chunks]
+    else:
+        parts = _map_bounded(executor, chunks, config, config.workers)
+
+    rule_t, rule_c = _rule_grid(config)
+    totals = _empty_totals(len(rule_t))
+    for part in parts:
+        for key in totals:
+            totals[key] = totals[key] + part[key]
+
+    tp, fp, fn, detected = totals["tp"], totals["fp"], totals["fn"], totals["detected"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(tp + fp > 0, tp / (tp + fp), np.nan)
+        recall = np.where(tp + fn > 0, tp / (tp + fn), np.nan)
+        lead = np.where(detected > 0, totals["lead_hours"] / detected, np.nan)
+
+    def _value(x):
+        return None if np.isnan(x) else round(float(x), 4)
+
+    return {
+        "zones": len(zone_ids),
+        "readings": int(totals["readings"]),
+        "positives": int(totals["positives"]),
+        "outbreaks": int(totals["outbreaks"]),
+        "results": [
+            {
+                "temperature": float(rule_t[i]),
+                "chlorophyll": float(rule_c[i]),
+                "true_positives": int(tp[i]),
+                "false_positives": int(fp[i]),
+                "false_negatives": int(fn[i]),
+                "precision": _value(precision[i]),
+                "recall": _value(recall[i]),
+                "detected_outbreaks": int(detected[i]),
+                "mean_lead_hours": _value(lead[i]),
+            }
+            for i in range(len(rule_t))
+        ],
+    }
@@ -0,0 +1,154 @@
+"""crud 的异步版本 (AsyncSession + asyncpg)，SQL 语句与同步实现共用"""
+import asyncio
+from typing import List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import schemas
+from .spatial import SpatialFilter
+from .crud import (
+    _accumulate_rollups_stmts,
+    _edge_to_dict,
+    _edges_stmt,
+    _existing_zone_ids_stmt,
+    _history_rows_stmt,
+    _history_stmt,
+    _kg_changes,
+    _kg_changes_stmts,
+    _kg_version_stmt,
+    _insert_sensor_rows_stmt,
+    _latest_logs_stmt,
+    _latest_readings_stmt,
+    _log_to_dict,
+    _new_sensor_log,
+    _node_to_dict,
+    _nodes_stmt,
+    _notify_ingest,
+    _rebuild_rollups_stmts,
+    _rebuild_zone_latest_stmt,
+    _rollup_history_stmt,
+    _rollup_to_dict,
+    _zone_latest_params,
+    _zone_latest_upsert_stmt,
+    _zones_stmt,
+)
+
+
+async def get_zones(db: AsyncSession, spatial: Optional[SpatialFilter] = None):
+    return (await db.scalars(_zones_stmt(spatial))).all()
+
+
+async def get_latest_logs(db: AsyncSession, spatial: Optional[SpatialFilter] = None):
+    """获取每个 Zone 最新的一条数据 (单次查询，读 zone_latest 快照)"""
+    return (await db.scalars(_latest_logs_stmt(spatial))).all()
+
+
+async def get_latest_rows(db: AsyncSession, spatial: Optional[SpatialFilter] = None):
+    return (await db.execute(_latest_logs_stmt(spatial, rows=True))).all()
+
+
+async def get_latest_readings(db: AsyncSession):
+    return (await db.execute(_latest_readings_stmt())).all()
+
+
+async def rebuild_zone_latest(db: AsyncSession):
+    await db.execute(_rebuild_zone_latest_stmt())
+    await db.commit()
+
+
+async def get_history_logs(
+    db: AsyncSession, zone_id: int, start=None, end=None, limit: int = 100, after=None
+):
+    return (await db.scalars(_history_stmt(zone_id, start, end, limit, after))).all()
+
+
+async def get_history_rows(
+    db: AsyncSession, zone_id: int, start=None, end=None, limit: int = 100, after=None
+):
+    return (await db.execute(_history_stmt(zone_id, start, end, limit, after, rows=True))).all()
+
+
+async def stream_history_rows(
+    db: AsyncSession, zone_id: int, start=None, end=None, batch_size: int = 5000
+):
+    """通过服务端游标按批次产出历史数据 (列元组)"""
+    result = await db.stream(_history_rows_stmt(zone_id, start, end))
+    async for batch in result.partitions(batch_size):
+        yield batch
+
+
+async def rebuild_rollups(db: AsyncSession, start=None, end=None):
+    for stmt in _rebuild_rollups_stmts(start, end):
+        await db.execute(stmt)
+    await db.commit()
+
+
+async def get_rollup_history(
+    db: AsyncSession, zone_id: int, resolution: str, start=None, end=None
+):
+    rows = await db.scalars(_rollup_history_stmt(zone_id, resolution, start, end))
+    return [_rollup_to_dict(r) for r in rows]
+
+
+async def create_sensor_log(db: AsyncSession, log: schemas.SensorLogCreate):
+    db_log = _new_sensor_log(log)
+    db.add(db_log)
+    await db.flush()
+    await db.execute(
+        _zone_latest_upsert_stmt(),
+        [{"zone_id": db_log.zone_id, "log_id": db_log.id, "record_time": db_log.record_time}],
+    )
+    for stmt in _accumulate_rollups_stmts([{"id": db_log.id, "record_time": db_log.record_time}]):
+        await db.execute(stmt)
+    await db.commit()
+    # 异步会话不能懒加载，refresh 时一并加载 zone 关系供响应序列化
+    await db.refresh(db_log, ["zone"])
+    _notify_ingest([_log_to_dict(db_log)])
+    return db_log
+
+
+async def get_existing_zone_ids(db: AsyncSession, zone_ids) -> set:
+    return set(await db.scalars(_existing_zone_ids_stmt(zone_ids)))
+
+
+async def _insert_sensor_rows(db: AsyncSession, rows: List[dict]) -> List[dict]:
+    if not rows:
+        return []
+    ids = (await db.execute(_insert_sensor_rows_stmt(), rows)).scalars().all()
+    inserted = [dict(row, id=log_id) for row, log_id in zip(rows, ids)]
+    await db.execute(_zone_latest_upsert_stmt(), _zone_latest_params(inserted))
+    for stmt in _accumulate_rollups_stmts(inserted):
+        await db.execute(stmt)
+    return inserted
+
+
+async def bulk_create_sensor_logs(db: AsyncSession, rows: List[dict]) -> List[dict]:
+    inserted = await _insert_sensor_rows(db, rows)
+    await db.commit()
+    # 整批的监听器 (特征、实时推送、异常检测) 是 CPU 操作，在线程中执行
+    await asyncio.to_thread(_notify_ingest, inserted)
+    return inserted
+
+
+# --- KG CRUD ---
+
+
+async def get_all_nodes(db: AsyncSession):
+    return [_node_to_dict(r) for r in await db.execute(_nodes_stmt())]
+
+
+async def get_all_edges(db: AsyncSession):
+    return [_edge_to_dict(r) for r in await db.execute(_edges_stmt())]
+
+
+async def get_kg_version(db: AsyncSession) -> int:
+    return await db.scalar(_kg_version_stmt())
+
+
+async def get_kg_changes(db: AsyncSession, since: int) -> dict:
+    nodes_stmt, edges_stmt, deletions_stmt = _kg_changes_stmts(since)
+    version = await get_kg_version(db)
+    return _kg_changes(
+        version, since,
+        await db.execute(nodes_stmt), await db.execute(edges_stmt), await db.execute(deletions_stmt),
+    )
@@ -0,0 +1,128 @@
+"""
+历史数据流式导出：逐批从服务端游标读取并编码，边查边发
+arrow / parquet 为列式格式，每个游标批次直接转成一个 RecordBatch (parquet 为一个 row group)，
+客户端可用 pyarrow 零拷贝读取后转成 pandas
+"""
+import csv
+import io
+import json
+from typing import Iterator, List
+
+from sqlalchemy.orm import Session
+
+from . import crud, models
+
+EXPORT_COLUMNS = ["id", "zone_id", "record_time", *models.SENSOR_METRICS]
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+FILE_EXTENSIONS = {"ndjson": "ndjson", "csv": "csv", "arrow": "arrows", "parquet": "parquet"}
+
+
+def iter_ndjson(db: Session, zone_id: int, start=None, end=None) -> Iterator[bytes]:
+    for batch in crud.stream_history_rows(db, zone_id, start, end):
+        lines = [
+            json.dumps(dict(zip(EXPORT_COLUMNS, row)), default=_default, separators=(",", ":"))
+            for row in batch
+        ]
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def iter_csv(db: Session, zone_id: int, start=None, end=None) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for batch in crud.stream_history_rows(db, zone_id, start, end):
+        writer.writerows(batch)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def arrow_schema():
+    import pyarrow as pa  # 可选依赖，只有列式导出才需要
+
+    return pa.schema(
+        [("id", pa.int64()), ("zone_id", pa.int32()), ("record_time", pa.timestamp("us"))]
+        + [(metric, pa.float64()) for metric in models.SENSOR_METRICS]
+    )
+
+
+def _record_batches(db: Session, zone_id, start=None, end=None):
+    import pyarrow as pa
+
+    schema = arrow_schema()
+    for batch in crud.stream_history_rows(db, zone_id, start, end):
+        columns = zip(*batch)
+        yield pa.RecordBatch.from_arrays(
+            [pa.array(col, type=field.type) for col, field in zip(columns, schema)], schema=schema
+        )
+
+
+class _ChunkSink(io.RawIOBase):
+    """只追加的输出流：写入的字节由生成器随时取走，tell() 仍返回累计偏移 (parquet 元数据依赖它)"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._offset = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_arrow(db: Session, zone_id, start=None, end=None) -> Iterator[bytes]:
+    """Arrow IPC 流格式 (pyarrow.ipc.open_stream 读取)"""
+    import pyarrow as pa
+
+    sink = _ChunkSink()
+    with pa.ipc.new_stream(sink, arrow_schema()) as writer:
+        for batch in _record_batches(db, zone_id, start, end):
+            writer.write_batch(batch)
+            yield sink.drain()
+    yield sink.drain()
+
+
+def iter_parquet(db: Session, zone_id, start=None, end=None) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, arrow_schema(), compression="zstd") as writer:
+        for batch in _record_batches(db, zone_id, start, end):
+            writer.write_table(pa.Table.from_batches([batch]))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def _default(value):
+    # record_time 为 datetime
+    return value.isoformat()
+
+
+EXPORTERS = {
+    "ndjson": iter_ndjson,
+    "csv": iter_csv,
+    "arrow": iter_arrow,
+    "parquet": iter_parquet,
+}
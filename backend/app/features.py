@@ -0,0 +1,294 @@
+"""
+按站点增量维护的滚动特征 (最近 24 个整点小时桶)：
+每个小时桶只保存累加和与桶内首末读数，读数到达时 O(1) 更新所属的桶，窗口按整桶滑出，预测时直接读取特征向量
+
+每个 worker 只收到自己写入的读数，进程内的状态是不完整的；zone_features 快照因此由 refresh_snapshot
+在数据库侧推进 (多个 worker 中只有一个执行)：与 sensor_rollups_hourly 的样本数比较找出变化的桶，
+只对这些桶从 sensor_logs 重算，再只写回变化的站点。小时汇总与读数在同一事务中提交，
+晚提交的写入也会在提交后的下一轮被发现，不依赖读数 id 的顺序。各 worker 再用 reload 把变化的站点换入进程内状态
+"""
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+FEATURE_WINDOW = timedelta(hours=24)
+# reload 按 updated_at 取变化的站点，向前重叠这么久以覆盖加载时尚未提交的快照事务 (重复加载只是覆盖)
+FEATURE_RELOAD_OVERLAP = timedelta(minutes=5)
+# 每条重算语句最多包含的 (站点, 小时桶) 数
+FEATURE_RECOMPUTE_CHUNK = int(os.getenv("FEATURE_RECOMPUTE_CHUNK", "5000"))
+
+# refresh_snapshot 的 pg_try_advisory_xact_lock 键
+SNAPSHOT_LOCK_KEY = 7_301_003
+
+# 桶内 t 为距桶起点的小时数；rows 含指标缺失的读数，用于与小时汇总的 sample_count 比较
+_BUCKET_KEYS = (
+    "rows", "n", "st", "stt", "temp", "t_temp", "chl", "density",
+    "first_t", "first_chl", "first_density", "last_t", "last_chl", "last_density",
+)
+
+_RECOMPUTE_SQL = text("""
+    SELECT l.zone_id, l.bucket, count(*) AS rows, max(l.id) AS last_log_id,
+           count(*) FILTER (WHERE l.valid) AS n,
+           sum(l.t) FILTER (WHERE l.valid) AS st,
+           sum(l.t * l.t) FILTER (WHERE l.valid) AS stt,
+           sum(l.temperature) FILTER (WHERE l.valid) AS temp,
+           sum(l.t * l.temperature) FILTER (WHERE l.valid) AS t_temp,
+           sum(l.chlorophyll) FILTER (WHERE l.valid) AS chl,
+           sum(l.jellyfish_density) FILTER (WHERE l.valid) AS density,
+           (array_agg(l.t ORDER BY l.record_time, l.id) FILTER (WHERE l.valid))[1] AS first_t,
+           (array_agg(l.chlorophyll ORDER BY l.record_time, l.id) FILTER (WHERE l.valid))[1] AS first_chl,
+           (array_agg(l.jellyfish_density ORDER BY l.record_time, l.id) FILTER (WHERE l.valid))[1] AS first_density,
+           (array_agg(l.t ORDER BY l.record_time DESC, l.id DESC) FILTER (WHERE l.valid))[1] AS last_t,
+           (array_agg(l.chlorophyll ORDER BY l.record_time DESC, l.id DESC) FILTER (WHERE l.valid))[1] AS last_chl,
+           (array_agg(l.jellyfish_density ORDER BY l.record_time DESC, l.id DESC) FILTER (WHERE l.valid))[1]
+               AS last_density
+    FROM (
+        SELECT c.zone_id, c.bucket, s.id, s.record_time, s.temperature, s.chlorophyll, s.jellyfish_density,
+               extract(epoch FROM s.record_time - c.bucket)::float8 / 3600 AS t,
+               (s.temperature IS NOT NULL AND s.chlorophyll IS NOT NULL AND s.jellyfish_density IS NOT NULL)
+                   AS valid
+        FROM unnest(CAST(:zone_ids AS integer[]), CAST(:buckets AS timestamp[])) AS c (zone_id, bucket)
+        JOIN sensor_logs s
+          ON s.zone_id = c.zone_id AND s.record_time >= c.bucket AND s.record_time < c.bucket + interval '1 hour'
+    ) AS l
+    GROUP BY l.zone_id, l.bucket
+""")
+
+
+def _hour(record_time: datetime) -> datetime:
+    return record_time.replace(minute=0, second=0, microsecond=0)
+
+
+def _empty_bucket() -> dict:
+    return dict.fromkeys(_BUCKET_KEYS, 0.0)
+
+
+class ZoneFeatures:
+    """单个站点的窗口状态：整点小时 -> 桶内累加和与首末读数，只保留最新的 24 个小时桶"""
+
+    def __init__(self):
+        self.buckets: Dict[datetime, dict] = {}
+        self.last_log_id = 0
+
+    def _evict(self):
+        cutoff = max(self.buckets) - FEATURE_WINDOW
+        for hour in [h for h in self.buckets if h <= cutoff]:
+            del self.buckets[hour]
+
+    def add(self, row: dict):
+        hour = _hour(row["record_time"])
+        if self.buckets and hour <= max(self.buckets) - FEATURE_WINDOW:
+            return  # 早于窗口的迟到数据不影响特征
+        self.last_log_id = max(self.last_log_id, row["id"])
+        b = self.buckets.setdefault(hour, _empty_bucket())
+        b["rows"] += 1
+        values = (row["temperature"], row["chlorophyll"], row["jellyfish_density"])
+        if None not in values:
+            temp, chl, density = values
+            t = (row["record_time"] - hour).total_seconds() / 3600
+            b["n"] += 1
+            b["st"] += t
+            b["stt"] += t * t
+            b["temp"] += temp
+            b["t_temp"] += t * temp
+            b["chl"] += chl
+            b["density"] += density
+            if b["n"] == 1 or t < b["first_t"]:
+                b["first_t"], b["first_chl"], b["first_density"] = t, chl, density
+            if b["n"] == 1 or t >= b["last_t"]:
+                b["last_t"], b["last_chl"], b["last_density"] = t, chl, density
+        self._evict()
+
+    def set_bucket(self, hour: datetime, bucket: dict, last_log_id: int = 0):
+        """用数据库重算的结果替换一个桶"""
+        self.buckets[hour] = bucket
+        self.last_log_id = max(self.last_log_id, last_log_id)
+        self._evict()
+
+    def vector(self, zone_id: int) -> Optional[dict]:
+        hours = sorted(h for h, b in self.buckets.items() if b["n"] > 0)
+        if not hours:
+            return None
+        # 各桶的累加和平移到以最早一桶为原点的时间轴上再合并
+        origin = hours[0]
+        s = dict.fromkeys(("n", "t", "tt", "temp", "t_temp", "chl", "density"), 0.0)
+        for hour in hours:
+            b = self.buckets[hour]
+            d = (hour - origin).total_seconds() / 3600
+            s["n"] += b["n"]
+            s["t"] += b["st"] + b["n"] * d
+            s["tt"] += b["stt"] + 2 * d * b["st"] + b["n"] * d * d
+            s["temp"] += b["temp"]
+            s["t_temp"] += b["t_temp"] + d * b["temp"]
+            s["chl"] += b["chl"]
+            s["density"] += b["density"]
+        first, last = self.buckets[hours[0]], self.buckets[hours[-1]]
+        last_t = (hours[-1] - origin).total_seconds() / 3600 + last["last_t"]
+        span_hours = last_t - first["first_t"]
+        n = int(s["n"])
+        denom = s["n"] * s["tt"] - s["t"] ** 2
+        return {
+            "zone_id": zone_id,
+            "record_time": hours[-1] + timedelta(hours=last["last_t"]),
+            "sample_count": n,
+            "temperature_avg_24h": s["temp"] / n,
+            "chlorophyll_avg_24h": s["chl"] / n,
+            "density_avg_24h": s["density"] / n,
+            # 最小二乘斜率 (℃/小时)
+            "temperature_slope": (s["n"] * s["t_temp"] - s["t"] * s["temp"]) / denom if n > 1 and denom > 0 else None,
+            # 窗口首尾的叶绿素变化率 (每小时)
+            "chlorophyll_rate": (last["last_chl"] - first["first_chl"]) / span_hours if span_hours > 0 else None,
+            "density_growth_ratio": (
+                last["last_density"] / first["first_density"] if n > 1 and first["first_density"] > 0 else None
+            ),
+        }
+
+    def to_state(self) -> dict:
+        return {
+            "buckets": [
+                [hour.isoformat()] + [b[k] for k in _BUCKET_KEYS] for hour, b in sorted(self.buckets.items())
+            ],
+        }
+
+    @classmethod
+    def from_state(cls, state: dict, last_log_id: int) -> "ZoneFeatures":
+        zone = cls()
+        zone.last_log_id = last_log_id
+        # 旧格式 (逐条读数的窗口) 的快照按空状态加载，下一轮 refresh_snapshot 会整窗重算
+        for entry in state.get("buckets", []):
+            zone.buckets[datetime.fromisoformat(entry[0])] = dict(zip(_BUCKET_KEYS, entry[1:]))
+        return zone
+
+
+class FeatureStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._zones: Dict[int, ZoneFeatures] = {}
+        self._loaded_at: Optional[datetime] = None  # 上次 reload 时的数据库时间
+
+    def update(self, rows: List[dict]):
+        """ingest 监听器：每条读数只更新所属站点的一个小时桶"""
+        with self._lock:
+            for row in rows:
+                zone = self._zones.get(row["zone_id"])
+                if zone is None:
+                    zone = self._zones[row["zone_id"]] = ZoneFeatures()
+                zone.add(row)
+
+    def get(self, zone_id: int) -> Optional[dict]:
+        with self._lock:
+            zone = self._zones.get(zone_id)
+            return zone.vector(zone_id) if zone is not None else None
+
+    def all(self) -> List[dict]:
+        with self._lock:
+            vectors = [z.vector(zone_id) for zone_id, z in sorted(self._zones.items())]
+        return [v for v in vectors if v is not None]
+
+    def stale_buckets(self, counts: Iterable[Tuple[int, datetime, int]]) -> List[Tuple[int, datetime]]:
+        """(站点, 小时桶, 小时汇总的样本数) 中与进程内状态不一致的桶"""
+        stale = []
+        with self._lock:
+            for zone_id, hour, count in counts:
+                zone = self._zones.get(zone_id)
+                bucket = zone.buckets.get(hour) if zone is not None else None
+                if bucket is None or bucket["rows"] != count:
+                    stale.append((zone_id, hour))
+        return stale
+
+    def recompute(self, db: Session, stale: List[Tuple[int, datetime]]) -> Set[int]:
+        """从 sensor_logs 重算这些桶并替换进程内状态，返回涉及的站点"""
+        for i in range(0, len(stale), FEATURE_RECOMPUTE_CHUNK):
+            chunk = stale[i:i + FEATURE_RECOMPUTE_CHUNK]
+            rows = db.execute(_RECOMPUTE_SQL, {
+                "zone_ids": [zone_id for zone_id, _ in chunk],
+                "buckets": [hour for _, hour in chunk],
+            }).mappings().all()
+            found = {(r["zone_id"], r["bucket"]): r for r in rows}
+            with self._lock:
+                for key in chunk:
+                    r = found.get(key)
+                    # 小时汇总有样本但读数已不存在 (如被手工删除) 时记为空桶，避免每轮重复重算
+                    bucket = {k: r[k] or 0.0 for k in _BUCKET_KEYS} if r is not None else _empty_bucket()
+                    zone = self._zones.get(key[0])
+                    if zone is None:
+                        zone = self._zones[key[0]] = ZoneFeatures()
+                    zone.set_bucket(key[1], bucket, r["last_log_id"] if r is not None else 0)
+        return {zone_id for zone_id, _ in stale}
+
+    def save(self, db: Session, zone_ids: Iterable[int]):
+        """把指定站点的窗口状态写入 zone_features 快照表 (不提交)"""
+        with self._lock:
+            values = [
+                {"zone_id": zone_id, "last_log_id": self._zones[zone_id].last_log_id,
+                 "state": self._zones[zone_id].to_state(), "updated_at": func.localtimestamp()}
+                for zone_id in sorted(zone_ids) if zone_id in self._zones
+            ]
+        if not values:
+            return
+        stmt = insert(models.ZoneFeatureSnapshot).values(values)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[models.ZoneFeatureSnapshot.zone_id],
+            set_={"last_log_id": stmt.excluded.last_log_id, "state": stmt.excluded.state,
+                  "updated_at": stmt.excluded.updated_at},
+        ))
+
+    def load(self, db: Session):
+        """从快照表加载全部站点，替换进程内状态"""
+        self._loaded_at = None
+        self.reload(db)
+
+    def reload(self, db: Session) -> int:
+        """
+        把上次加载之后更新过的站点快照换入进程内状态，返回站点数。
+        快照由数据库中的读数推进，包含其他 worker 的写入；本进程在快照之后写入的读数
+        会被暂时覆盖，下一轮快照中又会出现
+        """
+        snap = models.ZoneFeatureSnapshot
+        now = db.scalar(select(func.localtimestamp()))
+        stmt = select(snap)
+        if self._loaded_at is not None:
+            stmt = stmt.where(snap.updated_at >= self._loaded_at - FEATURE_RELOAD_OVERLAP)
+        zones = {s.zone_id: ZoneFeatures.from_state(s.state, s.last_log_id) for s in db.scalars(stmt)}
+        with self._lock:
+            if self._loaded_at is None:
+                self._zones = zones
+            else:
+                self._zones.update(zones)
+        self._loaded_at = now
+        return len(zones)
+
+
+def refresh_snapshot(db: Session, store: Optional[FeatureStore] = None) -> bool:
+    """
+    把 zone_features 推进到最新并提交：只重算样本数与小时汇总不一致的桶，只写回变化的站点；
+    store (默认为全局特征库) 同时得到更新。只有拿到事务级 advisory lock 的 worker 执行 (提交时释放)，
+    其余直接返回 False
+    """
+    if not db.scalar(select(func.pg_try_advisory_xact_lock(SNAPSHOT_LOCK_KEY))):
+        db.rollback()
+        return False
+    store = store if store is not None else feature_store
+    rollup, latest = models.SensorRollupHourly, models.ZoneLatest
+    counts = db.execute(
+        select(rollup.zone_id, rollup.bucket, rollup.sample_count)
+        .join(latest, latest.zone_id == rollup.zone_id)
+        .where(rollup.bucket > func.date_trunc("hour", latest.record_time) - FEATURE_WINDOW)
+    ).all()
+    changed = store.recompute(db, store.stale_buckets(counts))
+    store.save(db, changed)
+    db.commit()
+    return True
+
+
+feature_store = FeatureStore()
@@ -0,0 +1,136 @@
+"""
+水母密度预测：复用 init_data 中的机理增长模型，由后台任务定时在进程池中为所有站点推算未来 72 小时的密度，
+结果写入 density_forecasts 表，接口只读表，不在请求路径上计算
+
+多个 worker 都运行定时任务，但只有拿到 advisory lock 的一个计算 (见 try_lock)，进程池也只在该 worker 中创建；
+趋势取自特征库，各 worker 的特征库定期从数据库快照同步 (见 features.refresh_snapshot)
+"""
+import logging
+import os
+from concurrent.futures import Executor
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import numpy as np
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from . import crud, models
+from .features import feature_store
+
+logger = logging.getLogger(__name__)
+
+# 适宜温度 (18~26℃) 且叶绿素 > 1.5 时每小时增长 5%，高温 (>28℃) 每小时衰减 10%
+GROWTH_RATE = 1.05
+DECAY_RATE = 0.90
+FORECAST_HOURS = 72
+# 趋势外推的最大水温变化 (℃)，避免短期斜率在 72 小时上被无限放大
+MAX_TEMPERATURE_DELTA = 5.0
+FORECAST_INTERVAL_SECONDS = int(os.getenv("FORECAST_INTERVAL_SECONDS", "900"))
+FORECAST_WORKERS = int(os.getenv("FORECAST_WORKERS", "2"))
+# 每个进程任务处理的站点数
+FORECAST_CHUNK_ZONES = 1000
+# try_lock 的 pg_try_advisory_xact_lock 键
+FORECAST_LOCK_KEY = 7_301_004
+
+
+def growth_factors(temperature: np.ndarray, chlorophyll: np.ndarray, neutral=1.0) -> np.ndarray:
+    """逐点的每小时增长倍数；neutral 为其余情况下的倍数 (模拟数据时传入随机波动)"""
+    growth = np.where((temperature > 18) & (temperature < 26) & (chlorophyll > 1.5), GROWTH_RATE, neutral)
+    return np.where(temperature > 28, DECAY_RATE, growth)
+
+
+def project_density(density, temperature, chlorophyll, temperature_slope, chlorophyll_rate,
+                    hours: int = FORECAST_HOURS) -> np.ndarray:
+    """
+    按站点向量化推算：水温 / 叶绿素沿 24 小时趋势线性外推 (水温变化有上限)，密度按增长倍数累乘
+    输入均为长度 = 站点数的一维数组，返回 (站点数, hours) 的密度矩阵
+    """
+    h = np.arange(1, hours + 1)
+    delta = np.clip(temperature_slope[:, None] * h, -MAX_TEMPERATURE_DELTA, MAX_TEMPERATURE_DELTA)
+    temperature = temperature[:, None] + delta
+    chlorophyll = np.maximum(chlorophyll[:, None] + chlorophyll_rate[:, None] * h, 0)
+    return density[:, None] * np.cumprod(growth_factors(temperature, chlorophyll), axis=1)
+
+
+def _inputs_stmt():
+    log = models.SensorLog
+    return (
+        select(log.zone_id, log.record_time, log.temperature, log.chlorophyll, log.jellyfish_density)
+        .join(models.ZoneLatest, crud._latest_log_onclause())
+        .order_by(log.zone_id)
+    )
+
+
+def _trend(zone_id: int, name: str) -> float:
+    vector = feature_store.get(zone_id)
+    value = vector[name] if vector is not None else None
+    return 0.0 if value is None else value
+
+
+def try_lock(db: Session) -> bool:
+    """在 db 的当前事务中取得计算预测的锁，run_forecasts 提交时释放；已被其他 worker 持有时返回 False"""
+    if db.scalar(select(func.pg_try_advisory_xact_lock(FORECAST_LOCK_KEY))):
+        return True
+    db.rollback()
+    return False
+
+
+def run_forecasts(db: Session, executor: Optional[Executor] = None) -> int:
+    """为所有有最新读数的站点生成预测并覆盖写入结果表，返回站点数"""
+    rows = db.execute(_inputs_stmt()).all()
+    if not rows:
+        return 0
+    zone_ids, base_times, temperature, chlorophyll, density = zip(*rows)
+    slope = np.array([_trend(z, "temperature_slope") for z in zone_ids])
+    rate = np.array([_trend(z, "chlorophyll_rate") for z in zone_ids])
+    arrays = [np.asarray(a, dtype=np.float64) for a in (density, temperature, chlorophyll)] + [slope, rate]
+
+    chunks = [
+        [a[i:i + FORECAST_CHUNK_ZONES] for a in arrays]
+        for i in range(0, len(zone_ids), FORECAST_CHUNK_ZONES)
+    ]
+    if executor is None:
+        results = [project_density(*chunk) for chunk in chunks]
+    else:
+        results = list(executor.map(project_density, *zip(*chunks)))
+    projected = np.round(np.concatenate(results), 4).tolist()
+
+    issued_at = datetime.now()
+    values = [
+        {"zone_id": zone_id, "issued_at": issued_at, "base_time": base_time, "density": points}
+        for zone_id, base_time, points in zip(zone_ids, base_times, projected)
+    ]
+    stmt = insert(models.DensityForecast)
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[models.DensityForecast.zone_id],
+            set_={"issued_at": stmt.excluded.issued_at, "base_time": stmt.excluded.base_time,
+                  "density": stmt.excluded.density},
+        ),
+        values,
+    )
+    # 已没有最新读数的站点不再保留旧预测
+    db.execute(delete(models.DensityForecast).where(models.DensityForecast.issued_at < issued_at))
+    db.commit()
+    return len(values)
+
+
+def _forecast_to_dict(f: models.DensityForecast, hours: int) -> dict:
+    return {
+        "zone_id": f.zone_id,
+        "issued_at": f.issued_at,
+        "base_time": f.base_time,
+        "points": [
+            {"time": f.base_time + timedelta(hours=i + 1), "density": value}
+            for i, value in enumerate(f.density[:hours])
+        ],
+    }
+
+
+def get_forecasts(db: Session, hours: int = FORECAST_HOURS, zone_id: Optional[int] = None) -> List[dict]:
+    stmt = select(models.DensityForecast).order_by(models.DensityForecast.zone_id)
+    if zone_id is not None:
+        stmt = stmt.where(models.DensityForecast.zone_id == zone_id)
+    return [_forecast_to_dict(f, hours) for f in db.scalars(stmt)]
@@ -0,0 +1,255 @@
+"""
+最近读数的内存热窗口：每个站点一个固定容量的 NumPy 环形缓冲区，启动时从数据库填充，写入时追加。
+最新读数与落在窗口内的历史查询直接由内存回答，超出窗口的查询透明地回落到数据库。
+
+每个站点占用 HOT_WINDOW_CAPACITY × (id + 时间 + 6 个指标) × 8 字节，与数据量无关。
+缓冲区只能看到本进程的写入 (ingest 监听器)，多进程部署时各 worker 需共享同一写入路径，否则不要开启。
+"""
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import crud, crud_async, models
+from .spatial import SpatialFilter
+
+HOT_WINDOW_ENABLED = os.getenv("HOT_WINDOW", "0") == "1"
+HOT_WINDOW_HOURS = int(os.getenv("HOT_WINDOW_HOURS", "72"))
+# 每个站点最多保留的读数条数
+HOT_WINDOW_CAPACITY = int(os.getenv("HOT_WINDOW_CAPACITY", "1024"))
+
+_METRICS = models.SENSOR_METRICS
+_ONE_US = np.timedelta64(1, "us")
+_MIN_TIME = np.datetime64(datetime.min, "us")
+
+
+def _zones_stmt():
+    return select(*[getattr(models.MarineZone, f) for f in crud.ZONE_ROW_FIELDS])
+
+
+def _dt64(value: datetime) -> np.datetime64:
+    return np.datetime64(value, "us")
+
+
+class ZoneRing:
+    """按 (record_time, id) 有序的环形缓冲区；covered_from 之后 (含) 的该站点数据全部在缓冲区中"""
+
+    def __init__(self, capacity: int, covered_from: np.datetime64):
+        self.capacity = capacity
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.times = np.zeros(capacity, dtype="datetime64[us]")
+        self.values = np.zeros((capacity, len(_METRICS)), dtype=np.float64)
+        self.start = 0
+        self.size = 0
+        self.covered_from = covered_from
+
+    def _slot(self, i: int) -> int:
+        return (self.start + i) % self.capacity
+
+    def _ordered(self):
+        """逻辑顺序 (旧 -> 新) 的数组视图/拷贝"""
+        idx = (self.start + np.arange(self.size)) % self.capacity
+        return self.ids[idx], self.times[idx], self.values[idx]
+
+    def _evict_oldest(self):
+        self.covered_from = max(self.covered_from, self.times[self.start] + _ONE_US)
+        self.start = (self.start + 1) % self.capacity
+        self.size -= 1
+
+    def append(self, log_id: int, record_time: np.datetime64, values: np.ndarray):
+        if record_time < self.covered_from:
+            return  # 窗口之外的迟到数据，由数据库回答
+        last = self._slot(self.size - 1) if self.size else None
+        if last is not None and (record_time, log_id) < (self.times[last], self.ids[last]):
+            self._insert_sorted(log_id, record_time, values)
+        else:
+            if self.size == self.capacity:
+                self._evict_oldest()
+            slot = self._slot(self.size)
+            self.ids[slot], self.times[slot], self.values[slot] = log_id, record_time, values
+            self.size += 1
+        self.trim(self.times[self._slot(self.size - 1)] - np.timedelta64(HOT_WINDOW_HOURS, "h"))
+
+    def _insert_sorted(self, log_id, record_time, values):
+        """少见的乱序写入：整理成连续数组后插入 (O(capacity))"""
+        ids, times, vals = self._ordered()
+        pos = int(np.searchsorted(times, record_time, side="right"))
+        ids = np.insert(ids, pos, log_id)
+        times = np.insert(times, pos, record_time)
+        vals = np.insert(vals, pos, values, axis=0)
+        self.load(ids, times, vals)
+
+    def load(self, ids, times, vals):
+        if len(ids) > self.capacity:
+            drop = len(ids) - self.capacity
+            self.covered_from = max(self.covered_from, times[drop - 1] + _ONE_US)
+            ids, times, vals = ids[drop:], times[drop:], vals[drop:]
+        n = len(ids)
+        self.ids[:n], self.times[:n], self.values[:n] = ids, times, vals
+        self.start, self.size = 0, n
+
+    def trim(self, cutoff: np.datetime64):
+        while self.size and self.times[self.start] < cutoff:
+            self._evict_oldest()
+        self.covered_from = max(self.covered_from, cutoff)
+
+    def latest(self):
+        slot = self._slot(self.size - 1)
+        return self.ids[slot], self.times[slot], self.values[slot]
+
+    def history(self, start=None, end=None, limit: int = 100, after=None):
+        """与 crud.get_history_rows 相同的语义 (倒序 + keyset)，窗口无法完整回答时返回 None"""
+        ids, times, vals = self._ordered()
+        mask = np.ones(self.size, dtype=bool)
+        if start is not None:
+            mask &= times >= _dt64(start)
+        if end is not None:
+            mask &= times < _dt64(end)
+        if after is not None:
+            after_time, after_id = _dt64(after[0]), after[1]
+            mask &= (times < after_time) | ((times == after_time) & (ids < after_id))
+        selected = np.flatnonzero(mask)[::-1][:limit]
+        if len(selected) == limit:
+            # 返回的最旧一条之后的数据都在窗口内即可
+            if limit and times[selected[-1]] < self.covered_from:
+                return None
+        elif start is None or _dt64(start) < self.covered_from:
+            return None
+        return ids[selected], times[selected], vals[selected]
+
+
+def _rows(zone_id: int, ids, times, vals, zone: tuple) -> List[tuple]:
+    """组装成与 crud.get_history_rows / get_latest_rows 相同的列元组"""
+    return [
+        (log_id, zone_id, record_time, *metrics, *zone)
+        for log_id, record_time, metrics in zip(ids.tolist(), times.astype(object).tolist(), vals.tolist())
+    ]
+
+
+class HotWindow:
+    def __init__(self, capacity: int = HOT_WINDOW_CAPACITY):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._rings: Dict[int, ZoneRing] = {}
+        self._zones: Dict[int, tuple] = {}  # zone_id -> ZONE_ROW_FIELDS 元组
+        self.hits = 0
+        self.misses = 0
+
+    def _load_zones(self, db: Session):
+        self._zones = {row[0]: tuple(row) for row in db.execute(_zones_stmt())}
+
+    async def load_zones_async(self, db: AsyncSession, zone_ids=None):
+        """异步接口读内存前补齐缺少的站点信息 (默认为窗口中的全部站点)，之后读取不再访问数据库"""
+        with self._lock:
+            missing = [z for z in (self._rings if zone_ids is None else zone_ids) if z not in self._zones]
+        if missing:
+            self._zones = {row[0]: tuple(row) for row in await db.execute(_zones_stmt())}
+
+    def fill(self, db: Session):
+        """启动时从数据库加载每个站点最新读数之前 HOT_WINDOW_HOURS 小时内的数据"""
+        window = timedelta(hours=HOT_WINDOW_HOURS)
+        log, latest = models.SensorLog, models.ZoneLatest
+        cutoffs = {zone_id: record_time - window for zone_id, record_time in
+                   db.execute(select(latest.zone_id, latest.record_time))}
+        stmt = (
+            select(log.id, log.zone_id, log.record_time, *[getattr(log, m) for m in _METRICS])
+            .join(latest, latest.zone_id == log.zone_id)
+            .where(log.record_time >= latest.record_time - window)
+            .order_by(log.zone_id, log.record_time, log.id)
+        )
+        rows = db.execute(stmt).all()
+        rings = {}
+        if rows:
+            ids, zone_ids, times, *metrics = zip(*rows)
+            zone_ids = np.asarray(zone_ids, dtype=np.int64)
+            ids = np.asarray(ids, dtype=np.int64)
+            times = np.asarray(times, dtype="datetime64[us]")
+            vals = np.column_stack([np.asarray(m, dtype=np.float64) for m in metrics])
+            # 按站点切分 (结果已按 zone_id 排序)
+            bounds = np.flatnonzero(np.diff(zone_ids)) + 1
+            for part in np.split(np.arange(len(ids)), bounds):
+                zone_id = int(zone_ids[part[0]])
+                ring = ZoneRing(self.capacity, _dt64(cutoffs[zone_id]))
+                ring.load(ids[part], times[part], vals[part])
+                rings[zone_id] = ring
+        with self._lock:
+            self._load_zones(db)
+            self._rings = rings
+
+    def update(self, rows: List[dict]):
+        """ingest 监听器"""
+        with self._lock:
+            for row in rows:
+                ring = self._rings.get(row["zone_id"])
+                if ring is None:
+                    # 启动时没有数据的站点：之后的写入都经过这里，窗口完整
+                    ring = self._rings[row["zone_id"]] = ZoneRing(self.capacity, _MIN_TIME)
+                ring.append(row["id"], _dt64(row["record_time"]), [row[m] for m in _METRICS])
+
+    def _zone(self, db: Optional[Session], zone_id: int) -> tuple:
+        zone = self._zones.get(zone_id)
+        if zone is None and db is not None:
+            self._load_zones(db)  # 新建的站点
+            zone = self._zones.get(zone_id, (zone_id, None, None, None, None))
+        return zone
+
+    def latest_rows(self, db: Optional[Session]) -> List[tuple]:
+        with self._lock:
+            self.hits += 1
+            result = []
+            for zone_id in sorted(self._rings):
+                ring = self._rings[zone_id]
+                if ring.size:
+                    log_id, record_time, vals = ring.latest()
+                    result += _rows(zone_id, np.array([log_id]), np.array([record_time]),
+                                    vals[None, :], self._zone(db, zone_id))
+            return result
+
+    def history_rows(self, db: Optional[Session], zone_id: int, start=None, end=None, limit=100, after=None):
+        with self._lock:
+            ring = self._rings.get(zone_id)
+            found = ring.history(start, end, limit, after) if ring is not None else None
+            if found is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return _rows(zone_id, *found, self._zone(db, zone_id))
+
+
+hot_window = HotWindow()
+
+
+def get_latest_rows(db: Session, spatial: Optional[SpatialFilter] = None):
+    """热窗口开启且没有空间过滤时读内存，否则读数据库"""
+    if HOT_WINDOW_ENABLED and spatial is None:
+        return hot_window.latest_rows(db)
+    return crud.get_latest_rows(db, spatial=spatial)
+
+
+def get_history_rows(db: Session, zone_id: int, start=None, end=None, limit: int = 100, after=None):
+    if HOT_WINDOW_ENABLED:
+        rows = hot_window.history_rows(db, zone_id, start, end, limit, after)
+        if rows is not None:
+            return rows
+    return crud.get_history_rows(db, zone_id, start=start, end=end, limit=limit, after=after)
+
+
+async def get_latest_rows_async(db: AsyncSession, spatial: Optional[SpatialFilter] = None):
+    if HOT_WINDOW_ENABLED and spatial is None:
+        await hot_window.load_zones_async(db)
+        return hot_window.latest_rows(None)
+    return await crud_async.get_latest_rows(db, spatial=spatial)
+
+
+async def get_history_rows_async(db: AsyncSession, zone_id: int, start=None, end=None, limit: int = 100, after=None):
+    if HOT_WINDOW_ENABLED:
+        await hot_window.load_zones_async(db, [zone_id])
+        rows = hot_window.history_rows(None, zone_id, start, end, limit, after)
+        if rows is not None:
+            return rows
+    return await crud_async.get_history_rows(db, zone_id, start=start, end=end, limit=limit, after=after)
@@ -0,0 +1,122 @@
+"""批量上传：解析 JSON 数组 / NDJSON，逐行校验后单事务写入"""
+import asyncio
+import json
+from datetime import datetime
+from typing import Any, AsyncIterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import crud_async, schemas
+
+# 单次请求最多接收的行数，防止一次上传占满内存
+MAX_BULK_ROWS = 100_000
+# 请求体的字节上限 (每行按不超过 MAX_BULK_ROW_BYTES 估算)，在解析之前拒绝过大的上传
+MAX_BULK_ROW_BYTES = 1024
+MAX_BULK_BYTES = MAX_BULK_ROWS * MAX_BULK_ROW_BYTES
+
+
+class BulkTooLarge(Exception):
+    """上传超过 MAX_BULK_ROWS 行或 MAX_BULK_BYTES 字节"""
+
+
+class _ParseError:
+    def __init__(self, detail: str):
+        self.detail = detail
+
+
+def check_content_length(value: Optional[str]):
+    """声明的请求体长度超过上限时不读取请求体，直接拒绝"""
+    if value is not None and value.isdigit() and int(value) > MAX_BULK_BYTES:
+        raise BulkTooLarge()
+
+
+async def _limit_bytes(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """没有 Content-Length (分块传输) 时边读边计数，超过上限立即停止读取"""
+    total = 0
+    async for chunk in chunks:
+        total += len(chunk)
+        if total > MAX_BULK_BYTES:
+            raise BulkTooLarge()
+        yield chunk
+
+
+async def read_json_array(chunks: AsyncIterator[bytes]) -> List[Any]:
+    """请求体不是 JSON 数组时抛出 ValueError"""
+    items = json.loads(b"".join([chunk async for chunk in _limit_bytes(chunks)]))
+    if not isinstance(items, list):
+        raise ValueError("not a JSON array")
+    if len(items) > MAX_BULK_ROWS:
+        raise BulkTooLarge()
+    return items
+
+
+async def read_ndjson(chunks: AsyncIterator[bytes]) -> List[Any]:
+    """按行解析流式 NDJSON，无法解析的行记为 _ParseError 以便逐行报错；超过 MAX_BULK_ROWS 行时停止读取"""
+    items: List[Any] = []
+    pending = b""
+    async for chunk in _limit_bytes(chunks):
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            _append_ndjson_line(items, line)
+        if len(items) > MAX_BULK_ROWS:
+            raise BulkTooLarge()
+    _append_ndjson_line(items, pending)
+    return items
+
+
+def _append_ndjson_line(items: List[Any], line: bytes):
+    line = line.strip()
+    if not line:
+        return
+    try:
+        items.append(json.loads(line))
+    except ValueError as e:
+        items.append(_ParseError(f"invalid JSON: {e}"))
+
+
+def validate_rows(items: List[Any]) -> Tuple[List[Tuple[int, dict]], List[schemas.BulkRowError]]:
+    """一次遍历完成校验，返回 (行号, 行数据) 列表与逐行错误"""
+    rows = []
+    errors = []
+    now = datetime.now()
+    for index, item in enumerate(items):
+        if isinstance(item, _ParseError):
+            errors.append(schemas.BulkRowError(index=index, detail=item.detail))
+            continue
+        try:
+            row = schemas.SensorLogCreate.model_validate(item).model_dump()
+        except ValidationError as e:
+            errors.append(schemas.BulkRowError(index=index, detail=_format_error(e)))
+            continue
+        if row["record_time"] is None:
+            row["record_time"] = now
+        rows.append((index, row))
+    return rows, errors
+
+
+def _format_error(e: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(p) for p in err['loc']) or 'row'}: {err['msg']}" for err in e.errors()
+    )
+
+
+async def ingest_rows(db: AsyncSession, items: List[Any]) -> schemas.BulkUploadResult:
+    # 逐行校验是 CPU 操作，放到线程中执行，不卡住事件循环
+    rows, errors = await asyncio.to_thread(validate_rows, items)
+
+    # 未知站点在写入前剔除，避免外键错误让整批回滚
+    known = await crud_async.get_existing_zone_ids(db, {row["zone_id"] for _, row in rows})
+    valid = []
+    for index, row in rows:
+        if row["zone_id"] in known:
+            valid.append(row)
+        else:
+            errors.append(
+                schemas.BulkRowError(index=index, detail=f"unknown zone_id {row['zone_id']}")
+            )
+
+    await crud_async.bulk_create_sensor_logs(db, valid)
+    errors.sort(key=lambda err: err.index)
+    return schemas.BulkUploadResult(accepted=len(valid), rejected=len(errors), errors=errors)
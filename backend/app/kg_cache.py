@@ -0,0 +1,132 @@
+"""知识图谱响应缓存：缓存序列化后的 JSON 字节，数据库中的图谱版本变化时失效"""
+import hashlib
+import json
+import os
+import threading
+import time
+from itertools import chain
+from typing import Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import crud, crud_async, models
+
+_KG_MODELS = (models.KGNode, models.KGEdge)
+_KG_TABLES = {models.KGNode.__table__, models.KGEdge.__table__}
+# 其他进程的写入只能通过数据库中的图谱版本感知，最多每隔这么多秒检查一次
+KG_VERSION_CHECK_SECONDS = float(os.getenv("KG_VERSION_CHECK_SECONDS", "5"))
+
+
+class GraphCache:
+    """
+    进程内缓存，以数据库中的图谱版本 (kg_versions) 为准：任何写入图谱的事务都由触发器生成新版本 (见迁移 7)，
+    其他 worker、脚本与手写 SQL 的写入都能被感知。版本最多每 KG_VERSION_CHECK_SECONDS 秒查询一次；
+    本进程提交了图谱写入时立即重新查询 (TRUNCATE 不经过触发器，之后需重启或等待下一次写入)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entry: Optional[Tuple[int, str, bytes]] = None  # (kg_version, etag, body)
+        self.kg_version: Optional[int] = None  # 最近一次查询到的数据库图谱版本
+        self._checked_at = float("-inf")
+
+    def expire(self):
+        """下一个请求立即查询数据库版本"""
+        self._checked_at = float("-inf")
+
+    def _check_due(self) -> bool:
+        now = time.monotonic()
+        if now - self._checked_at < KG_VERSION_CHECK_SECONDS:
+            return False
+        self._checked_at = now
+        return True
+
+    def sync(self, db: Session) -> int:
+        if self._check_due() or self.kg_version is None:
+            self.kg_version = crud.get_kg_version(db)
+        return self.kg_version
+
+    async def sync_async(self, db: AsyncSession) -> int:
+        if self._check_due() or self.kg_version is None:
+            self.kg_version = await crud_async.get_kg_version(db)
+        return self.kg_version
+
+    def get(self) -> Optional[Tuple[str, bytes]]:
+        entry = self._entry
+        if entry is not None and entry[0] == self.kg_version:
+            return entry[1], entry[2]
+        return None
+
+    def get_or_load(self, db: Session) -> Tuple[str, bytes]:
+        # 先确定版本再查库：查询期间提交的写入版本更大，下一次检查时会重新加载
+        version = self.sync(db)
+        cached = self.get()
+        if cached is not None:
+            return cached
+        return self._store(version, crud.get_all_nodes(db), crud.get_all_edges(db))
+
+    async def get_or_load_async(self, db: AsyncSession) -> Tuple[str, bytes]:
+        version = await self.sync_async(db)
+        cached = self.get()
+        if cached is not None:
+            return cached
+        return self._store(version, await crud_async.get_all_nodes(db), await crud_async.get_all_edges(db))
+
+    def _store(self, version: int, nodes, links) -> Tuple[str, bytes]:
+        graph = {"nodes": nodes, "links": links}
+        body = json.dumps(graph, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        # 用内容哈希做 ETag，数据库重建后版本号重新开始也不会误判
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        with self._lock:
+            if version == self.kg_version:
+                self._entry = (version, etag, body)
+        return etag, body
+
+
+graph_cache = GraphCache()
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+# --- 本进程通过 Session 提交图谱写入后立即检查版本 ---
+
+
+@event.listens_for(Session, "after_flush")
+def _track_kg_flush(session, flush_context):
+    if any(
+        isinstance(obj, _KG_MODELS)
+        for obj in chain(session.new, session.dirty, session.deleted)
+    ):
+        session.info["kg_dirty"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_kg_statement(orm_execute_state):
+    # 覆盖 session.execute(insert/update/delete(KGNode)) 这类批量语句
+    if not (
+        orm_execute_state.is_insert
+        or orm_execute_state.is_update
+        or orm_execute_state.is_delete
+    ):
+        return
+    table = getattr(orm_execute_state.statement, "table", None)
+    if table in _KG_TABLES:
+        orm_execute_state.session.info["kg_dirty"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _expire_kg_version(session):
+    if session.info.pop("kg_dirty", False):
+        graph_cache.expire()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_kg_changes(session):
+    session.info.pop("kg_dirty", None)
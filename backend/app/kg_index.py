@@ -0,0 +1,279 @@
+"""
+知识图谱内存邻接索引 (CSR)：出边 / 入边各一份，同一节点的边按关系类型分组排列，
+支持邻居查询、k 跳子图与按 weight / prob 加权的最可能路径
+"""
+import heapq
+import math
+import threading
+from typing import List, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from . import crud, kg_cache
+
+
+def _edge_arrays(edges: List[dict]):
+    """(边 id, 源节点 id, 目标节点 id, 权重)"""
+    n = len(edges)
+    return (
+        np.fromiter((e["id"] for e in edges), dtype=np.int64, count=n),
+        np.fromiter((e["source"] for e in edges), dtype=np.int64, count=n),
+        np.fromiter((e["target"] for e in edges), dtype=np.int64, count=n),
+        np.fromiter((_edge_weight(e["properties"]) for e in edges), dtype=np.float64, count=n),
+    )
+
+
+def _edge_weight(properties: dict) -> float:
+    """边权重取 weight，没有时取 prob，都没有视为 1.0"""
+    value = properties.get("weight", properties.get("prob", 1.0))
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 1.0
+
+
+class GraphIndex:
+    """
+    节点 id 有序存放；边保存为 (边 id, 端点 id, 关系编码, 权重) 数组，CSR 由这些数组生成。
+    apply_changes 在上一个索引的数组上打补丁得到新索引：只解析变更的行，不重新读取全量图谱
+    """
+
+    def __init__(self, nodes: List[dict], edges: List[dict], version: int):
+        relations, rel = np.unique(np.array([e["relation"] for e in edges], dtype=str), return_inverse=True)
+        self._build(
+            version,
+            {n["id"]: n for n in nodes},
+            np.unique(np.fromiter((n["id"] for n in nodes), dtype=np.int64, count=len(nodes))),
+            {e["id"]: e for e in edges},
+            _edge_arrays(edges),
+            relations,
+            rel.astype(np.int32),
+        )
+
+    def _build(self, version, nodes_by_id, node_ids, edges_by_id, edge_arrays, relations, rel):
+        self.version = version
+        self.nodes_by_id = nodes_by_id
+        self.edges_by_id = edges_by_id
+        self.node_ids = node_ids
+        self.relations = relations
+        # 包含悬空边的完整数组，端点节点之后写入时可以直接生效
+        self._all_edges = edge_arrays
+        self._all_rel = rel
+
+        edge_ids, src, dst, weight = edge_arrays
+        src_idx = self._positions(src)
+        dst_idx = self._positions(dst)
+        # 丢弃端点不存在的悬空边
+        valid = (src_idx >= 0) & (dst_idx >= 0)
+        self.edge_ids = edge_ids[valid]
+        self.src = src_idx[valid]
+        self.dst = dst_idx[valid]
+        self.rel = rel[valid]
+        self.weight = weight[valid]
+
+        # CSR: indptr[i]:indptr[i+1] 为节点 i 的边在 order 中的区间，区间内按关系类型排序
+        n = len(node_ids)
+        self.csr = {
+            "out": self._build_csr(self.src, n),
+            "in": self._build_csr(self.dst, n),
+        }
+
+    def apply_changes(self, changes: dict) -> "GraphIndex":
+        """
+        应用 crud.get_kg_changes 的结果 (since 为本索引的版本)，新索引的版本为 changes["version"]；
+        返回新索引，本索引不变 (正在进行的查询不受影响)。
+        重复应用同一批变更的结果相同，因此变更中混入了该版本之后提交的行也没有问题
+        """
+        nodes_by_id = dict(self.nodes_by_id)
+        nodes_by_id.update((n["id"], n) for n in changes["nodes"])
+        for node_id in changes["deleted_nodes"]:
+            nodes_by_id.pop(node_id, None)
+        node_ids = np.setdiff1d(
+            np.union1d(self.node_ids, np.array([n["id"] for n in changes["nodes"]], dtype=np.int64)),
+            np.array(changes["deleted_nodes"], dtype=np.int64),
+        )
+
+        edges = changes["links"]
+        edges_by_id = dict(self.edges_by_id)
+        edges_by_id.update((e["id"], e) for e in edges)
+        for edge_id in changes["deleted_links"]:
+            edges_by_id.pop(edge_id, None)
+        # 修改过的边先删除再按新内容追加
+        gone = np.array([e["id"] for e in edges] + list(changes["deleted_links"]), dtype=np.int64)
+        keep = ~np.isin(self._all_edges[0], gone)
+        new_names = np.array([e["relation"] for e in edges], dtype=str)
+        relations = np.union1d(self.relations, new_names)
+        old_rel = np.searchsorted(relations, self.relations).astype(np.int32)[self._all_rel[keep]]
+        added = _edge_arrays(edges)
+
+        index = object.__new__(GraphIndex)
+        index._build(
+            changes["version"],
+            nodes_by_id,
+            node_ids,
+            edges_by_id,
+            tuple(np.concatenate((old[keep], new)) for old, new in zip(self._all_edges, added)),
+            relations,
+            np.concatenate((old_rel, np.searchsorted(relations, new_names).astype(np.int32))),
+        )
+        return index
+
+    def _build_csr(self, endpoint: np.ndarray, n: int):
+        order = np.lexsort((self.rel, endpoint))
+        counts = np.bincount(endpoint, minlength=n)
+        indptr = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        return indptr, order.astype(np.int64)
+
+    def _positions(self, ids: np.ndarray) -> np.ndarray:
+        """节点 id -> 数组下标，不存在返回 -1"""
+        if len(self.node_ids) == 0:
+            return np.full(len(ids), -1, dtype=np.int64)
+        pos = np.searchsorted(self.node_ids, ids)
+        pos = np.minimum(pos, len(self.node_ids) - 1)
+        return np.where(self.node_ids[pos] == ids, pos, -1)
+
+    def position(self, node_id: int) -> int:
+        return int(self._positions(np.array([node_id], dtype=np.int64))[0])
+
+    def relation_code(self, relation: Optional[str]) -> Optional[int]:
+        if relation is None:
+            return None
+        matches = np.flatnonzero(self.relations == relation)
+        return int(matches[0]) if len(matches) else -1
+
+    def _gather(self, direction: str, idx: np.ndarray) -> np.ndarray:
+        """一次取出一组节点在某方向上的全部边下标 (向量化拼接多个 CSR 区间)"""
+        indptr, order = self.csr[direction]
+        starts = indptr[idx]
+        lengths = indptr[idx + 1] - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64)
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return order[offsets + np.arange(total)]
+
+    def _expand(self, idx: np.ndarray, direction: str, rel_code: Optional[int]):
+        """返回 (边下标, 对端节点下标)"""
+        edge_parts, neighbor_parts = [], []
+        for d in ("out", "in") if direction == "both" else (direction,):
+            e = self._gather(d, idx)
+            if rel_code is not None:
+                e = e[self.rel[e] == rel_code]
+            edge_parts.append(e)
+            neighbor_parts.append(self.dst[e] if d == "out" else self.src[e])
+        return np.concatenate(edge_parts), np.concatenate(neighbor_parts)
+
+    def _nodes(self, node_idx) -> List[dict]:
+        return [self.nodes_by_id[i] for i in self.node_ids[node_idx].tolist()]
+
+    def _edges(self, edge_idx) -> List[dict]:
+        return [self.edges_by_id[i] for i in self.edge_ids[edge_idx].tolist()]
+
+    def _graph(self, node_idx, edge_idx) -> dict:
+        return {"nodes": self._nodes(np.unique(node_idx)), "links": self._edges(np.unique(edge_idx))}
+
+    def neighbors(self, node_id: int, direction: str = "out", relation: Optional[str] = None) -> Optional[dict]:
+        start = self.position(node_id)
+        if start < 0:
+            return None
+        edges, neighbors = self._expand(np.array([start]), direction, self.relation_code(relation))
+        return self._graph(np.append(neighbors, start), edges)
+
+    def subgraph(self, node_id: int, depth: int, direction: str = "out",
+                 relation: Optional[str] = None) -> Optional[dict]:
+        """从 node_id 出发 depth 跳内可达的节点及途经的边 (逐层 BFS，每层一次向量化展开)"""
+        start = self.position(node_id)
+        if start < 0:
+            return None
+        rel_code = self.relation_code(relation)
+        visited = np.zeros(len(self.node_ids), dtype=bool)
+        visited[start] = True
+        frontier = np.array([start])
+        edge_parts = []
+        for _ in range(depth):
+            if len(frontier) == 0:
+                break
+            edges, neighbors = self._expand(frontier, direction, rel_code)
+            edge_parts.append(edges)
+            frontier = np.unique(neighbors[~visited[neighbors]])
+            visited[frontier] = True
+        edges = np.concatenate(edge_parts) if edge_parts else np.empty(0, dtype=np.int64)
+        return self._graph(np.flatnonzero(visited), edges)
+
+    def most_probable_path(self, source_id: int, target_id: int,
+                           relation: Optional[str] = None) -> Optional[dict]:
+        """
+        沿出边寻找权重乘积最大的路径 (Dijkstra，代价为 -log(weight))
+        权重大于 1 按 1 处理，权重不大于 0 的边不可通行
+        """
+        source, target = self.position(source_id), self.position(target_id)
+        if source < 0 or target < 0:
+            return None
+        rel_code = self.relation_code(relation)
+        indptr, order = self.csr["out"]
+        best = {source: 0.0}
+        via = {}  # 节点 -> 到达它的边下标
+        heap = [(0.0, source)]
+        while heap:
+            cost, node = heapq.heappop(heap)
+            if node == target:
+                break
+            if cost > best.get(node, math.inf):
+                continue
+            for e in order[indptr[node]:indptr[node + 1]].tolist():
+                if rel_code is not None and self.rel[e] != rel_code:
+                    continue
+                w = self.weight[e]
+                if w <= 0:
+                    continue
+                nxt = int(self.dst[e])
+                new_cost = cost - math.log(min(w, 1.0))
+                if new_cost < best.get(nxt, math.inf):
+                    best[nxt] = new_cost
+                    via[nxt] = e
+                    heapq.heappush(heap, (new_cost, nxt))
+        if target not in best:
+            return None
+
+        path_edges = []
+        node = target
+        while node != source:
+            e = via[node]
+            path_edges.append(e)
+            node = int(self.src[e])
+        path_edges.reverse()
+        path_nodes = [source] + [int(self.dst[e]) for e in path_edges]
+        return {
+            "nodes": self._nodes(np.array(path_nodes, dtype=np.int64)),
+            "links": self._edges(np.array(path_edges, dtype=np.int64)),
+            "probability": math.exp(-best[target]),
+        }
+
+
+class GraphIndexCache:
+    """
+    按数据库图谱版本 (kg_cache.graph_cache.kg_version) 缓存索引。版本前进时读取 version 大于索引版本的
+    节点 / 边与 kg_deletions，在原索引上打补丁，代价与变更行数及数组长度 (向量化复制) 相关，不重新读取全量图谱；
+    只有第一次加载或数据库版本倒退 (库被重建) 时全量构建
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index: Optional[GraphIndex] = None
+
+    def get(self, db: Session) -> GraphIndex:
+        version = kg_cache.graph_cache.sync(db)
+        index = self._index
+        if index is not None and index.version == version:
+            return index
+        with self._lock:
+            index = self._index
+            if index is None or index.version > version:
+                self._index = GraphIndex(crud.get_all_nodes(db), crud.get_all_edges(db), version)
+            elif index.version < version:
+                self._index = index.apply_changes(dict(crud.get_kg_changes(db, index.version), version=version))
+            return self._index
+
+
+graph_index = GraphIndexCache()
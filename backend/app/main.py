@@ -1,16 +1,253 @@
-from fastapi import FastAPI, Depends, HTTPException
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, WebSocket
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
-from datetime import datetime
+from typing import List, Literal, Optional, Union
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
 
 # 导入本地模块
-from . import models, schemas, crud
-from .database import SessionLocal, engine
+from . import models, schemas, crud, crud_async, ingest, analysis, kg_cache, kg_index, pagination, export, realtime, metrics, spatial, features, forecast, write_buffer, serialize, hot_window, anomaly, backtest, shared_snapshot, migrations, partitions, kg_import
+from .database import SessionLocal, engine, get_async_sessionmaker, warm_pool
 
-# 创建数据库表 (生产环境推荐使用 Alembic 迁移)
-models.Base.metadata.create_all(bind=engine)
+# 导入时不访问数据库；表结构由 scripts/migrate.py 维护，启动时的预热见 lifespan
 
-app = FastAPI(title="Jellyfish Warning System API")
+logger = logging.getLogger(__name__)
+
+# 特征库快照间隔 (秒)
+FEATURE_SNAPSHOT_SECONDS = 60
+
+async def _snapshot_features(app: FastAPI):
+    """定时推进特征快照 (多个 worker 中同一时刻只有一个在执行)，再把变化的站点换入本进程的特征库"""
+    while True:
+        await asyncio.sleep(FEATURE_SNAPSHOT_SECONDS)
+        if not app.state.ready:
+            continue
+        try:
+            await run_in_threadpool(_save_features)
+            await run_in_threadpool(_reload_features)
+        except Exception:
+            features.logger.exception("feature snapshot failed")
+
+def _save_features():
+    db = SessionLocal()
+    try:
+        features.refresh_snapshot(db)
+    finally:
+        db.close()
+
+def _load_features():
+    db = SessionLocal()
+    try:
+        features.feature_store.load(db)
+    finally:
+        db.close()
+
+def _reload_features():
+    db = SessionLocal()
+    try:
+        features.feature_store.reload(db)
+    finally:
+        db.close()
+
+def _seed_anomaly_detector():
+    db = SessionLocal()
+    try:
+        anomaly.seed_detector(db)
+    finally:
+        db.close()
+
+def _fill_hot_window():
+    db = SessionLocal()
+    try:
+        hot_window.hot_window.fill(db)
+    finally:
+        db.close()
+
+def _process_pool(max_workers: int) -> ProcessPoolExecutor:
+    """
+    长期复用的进程池。worker 进程里有多个线程 (线程池、后台任务)，fork 会把其他线程持有的锁
+    原样复制到子进程，因此用 forkserver 启动子进程
+    """
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("forkserver"))
+
+def _run_forecasts(app: FastAPI):
+    db = SessionLocal()
+    try:
+        if not forecast.try_lock(db):
+            return
+        if app.state.forecast_executor is None:
+            app.state.forecast_executor = _process_pool(forecast.FORECAST_WORKERS)
+        forecast.run_forecasts(db, app.state.forecast_executor)
+    finally:
+        db.close()
+
+async def _schedule_forecasts(app: FastAPI):
+    """
+    定时刷新密度预测；多个 worker 中同一时刻只有一个在计算，进程池在第一次拿到锁时创建。
+    失败只记录日志，下一轮重试
+    """
+    while True:
+        try:
+            await run_in_threadpool(_run_forecasts, app)
+        except Exception:
+            forecast.logger.exception("density forecast failed")
+        await asyncio.sleep(forecast.FORECAST_INTERVAL_SECONDS)
+
+async def _maintain_partitions():
+    """定时建未来的月度分区并执行数据保留；多个 worker 中同一时刻只有一个在执行"""
+    while True:
+        try:
+            await run_in_threadpool(partitions.run_maintenance, engine)
+        except Exception:
+            partitions.logger.exception("partition maintenance failed")
+        await asyncio.sleep(partitions.PARTITION_MAINTENANCE_SECONDS)
+
+# 回测共享进程池的大小，单个请求的 workers 只决定同时占用其中几个进程
+BACKTEST_WORKERS = int(os.getenv("BACKTEST_WORKERS", "4"))
+_backtest_executor_lock = threading.Lock()
+
+def _backtest_executor() -> ProcessPoolExecutor:
+    with _backtest_executor_lock:
+        if getattr(app.state, "backtest_executor", None) is None:
+            app.state.backtest_executor = _process_pool(BACKTEST_WORKERS)
+        return app.state.backtest_executor
+
+# 预热失败 (如数据库尚未就绪) 后的重试间隔 (秒)
+WARM_UP_RETRY_SECONDS = 5
+
+def _warm_up():
+    """
+    启动时需要访问数据库的步骤都在这里：预建连接池中的连接、确认表结构已是最新版本、
+    从快照恢复滚动特征、建立异常检测基线、填充热窗口、重放写后缓冲日志，并加载知识图谱缓存。
+    每一步都可以重复执行，失败后整体重试
+    """
+    warm_pool()
+    db = SessionLocal()
+    try:
+        version = migrations.current_version(db.connection())
+        if version < migrations.head():
+            raise RuntimeError(f"database schema is at version {version}, expected {migrations.head()}")
+    finally:
+        db.close()
+    _load_features()
+    _seed_anomaly_detector()
+    if hot_window.HOT_WINDOW_ENABLED:
+        _fill_hot_window()
+    if write_buffer.INGEST_BUFFER_ENABLED:
+        write_buffer.write_buffer.start()
+    db = SessionLocal()
+    try:
+        kg_cache.graph_cache.get_or_load(db)
+        kg_index.graph_index.get(db)
+    finally:
+        db.close()
+
+async def _warm_up_until_ready(app: FastAPI):
+    while True:
+        try:
+            await run_in_threadpool(_warm_up)
+            app.state.ready = True
+            return
+        except Exception:
+            logger.exception("warm-up failed, retrying in %ss", WARM_UP_RETRY_SECONDS)
+            await asyncio.sleep(WARM_UP_RETRY_SECONDS)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 启动时不访问数据库：预热 (含特征恢复、热窗口、写后缓冲重放) 在后台进行并在失败时重试，
+    # 完成前 /readyz 返回 503，负载均衡不会把请求转发到本 worker
+    app.state.ready = False
+    if shared_snapshot.SHARED_SNAPSHOT_ENABLED:
+        shared_snapshot.snapshot_service.start()
+    app.state.forecast_executor = None
+    app.state.backtest_executor = None
+    tasks = [
+        asyncio.create_task(_warm_up_until_ready(app)),
+        asyncio.create_task(_snapshot_features(app)),
+        asyncio.create_task(_schedule_forecasts(app)),
+        asyncio.create_task(_maintain_partitions()),
+    ]
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        if app.state.forecast_executor is not None:
+            app.state.forecast_executor.shutdown(wait=False, cancel_futures=True)
+        if app.state.backtest_executor is not None:
+            app.state.backtest_executor.shutdown(wait=False, cancel_futures=True)
+        if write_buffer.INGEST_BUFFER_ENABLED:
+            await run_in_threadpool(write_buffer.write_buffer.stop)
+        # 写后缓冲的最后一批写入也会产生异常事件，之后再停止事件写入线程
+        await run_in_threadpool(anomaly.event_writer.stop)
+        if shared_snapshot.SHARED_SNAPSHOT_ENABLED:
+            await run_in_threadpool(shared_snapshot.snapshot_service.stop)
+        if app.state.ready:
+            await run_in_threadpool(_save_features)
+
+app = FastAPI(title="Jellyfish Warning System API", lifespan=lifespan)
+
+# 新数据写入后推送给实时订阅者，并增量更新特征库
+crud.register_ingest_listener(realtime.hub.publish_logs)
+crud.register_ingest_listener(features.feature_store.update)
+crud.register_ingest_listener(anomaly.on_ingest)
+metrics.registry.register_gauge(
+    "anomaly_events_dropped_total", "Anomaly events dropped because the writer queue was full",
+    lambda: anomaly.event_writer.dropped,
+)
+if hot_window.HOT_WINDOW_ENABLED:
+    crud.register_ingest_listener(hot_window.hot_window.update)
+    metrics.registry.register_gauge("hot_window_hits_total", "Queries answered from the hot window",
+                                    lambda: hot_window.hot_window.hits)
+    metrics.registry.register_gauge("hot_window_misses_total", "History queries that fell through to the database",
+                                    lambda: hot_window.hot_window.misses)
+metrics.registry.register_gauge(
+    "realtime_subscribers", "Connected realtime subscribers", lambda: realtime.hub.subscriber_count
+)
+if write_buffer.INGEST_BUFFER_ENABLED:
+    _buffer = write_buffer.write_buffer
+    for _name, _help, _fn in [
+        ("ingest_buffer_depth", "Readings buffered but not yet committed", lambda: _buffer.depth),
+        ("ingest_buffer_flushed_total", "Readings committed by the write buffer", lambda: _buffer.flushed_total),
+        ("ingest_buffer_rejected_total", "Uploads rejected because the buffer was full", lambda: _buffer.rejected_total),
+        ("ingest_buffer_flush_failures_total", "Failed write buffer flushes", lambda: _buffer.flush_failures),
+        ("ingest_buffer_last_flush_seconds", "Duration of the last write buffer flush", lambda: _buffer.last_flush_seconds),
+    ]:
+        metrics.registry.register_gauge(_name, _help, _fn)
+
+# 记录每个路由的延迟；被抽样的请求额外统计 SQL 次数与耗时
+app.add_middleware(metrics.MetricsMiddleware)
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def read_metrics():
+    """Prometheus 格式的指标"""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/healthz", include_in_schema=False)
+def liveness():
+    """存活探针：进程能处理请求即可，不访问数据库"""
+    return {"status": "ok"}
+
+@app.get("/readyz", include_in_schema=False)
+def readiness(request: Request):
+    """就绪探针：预热完成且数据库可达时返回 200"""
+    if not getattr(request.app.state, "ready", False):
+        return JSONResponse({"status": "warming"}, status_code=503)
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+    except Exception as e:
+        return JSONResponse({"status": "database unavailable", "detail": str(e)}, status_code=503)
+    return {"status": "ready"}
 
 # 依赖项：获取数据库会话
 def get_db():
@@ -20,64 +257,368 @@ def get_db():
     finally:
         db.close()
 
+# 异步依赖项：配合 crud_async 在事件循环内访问数据库，不占用线程池。
+# async def 接口只能用它；仍使用 get_db 的接口都是普通 def，由 FastAPI 放到线程池执行
+async def get_async_db():
+    async with get_async_sessionmaker()() as db:
+        yield db
+
 # ================= Monitor Routers =================
 
+def spatial_filter(
+    bbox: Optional[str] = Query(None, description="minLon,minLat,maxLon,maxLat"),
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lon: Optional[float] = Query(None, ge=-180, le=180),
+    radius_km: Optional[float] = Query(None, gt=0),
+    nearest: Optional[int] = Query(None, ge=1, le=1000, description="离 (lat, lon) 最近的 N 个站点"),
+) -> Optional[spatial.SpatialFilter]:
+    """空间过滤参数：bbox 矩形范围、lat/lon + radius_km 半径范围、lat/lon + nearest 最近 N 个"""
+    try:
+        return spatial.SpatialFilter.parse(bbox, lat, lon, radius_km, nearest)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/api/monitor/zones", response_model=List[schemas.MarineZoneResponse])
-def read_zones(db: Session = Depends(get_db)):
-    """获取所有海域监测点"""
-    return crud.get_zones(db)
+async def read_zones(
+    area: Optional[spatial.SpatialFilter] = Depends(spatial_filter), db: AsyncSession = Depends(get_async_db)
+):
+    """获取海域监测点 (含经纬度)，可按空间范围过滤"""
+    return await crud_async.get_zones(db, spatial=area)
+
+async def _latest_rows(db: AsyncSession, area: Optional[spatial.SpatialFilter]):
+    """最新读数依次尝试：跨 worker 共享内存快照 -> 本进程热窗口 / 数据库"""
+    if shared_snapshot.SHARED_SNAPSHOT_ENABLED and area is None:
+        data = shared_snapshot.snapshot_service.read()
+        if data is not None:
+            return shared_snapshot.latest_rows(data)
+    return await hot_window.get_latest_rows_async(db, spatial=area)
+
+# rows: 每条记录一个对象 (与 SensorLogResponse 相同)；columns: 每个字段一个数组
+Layout = Literal["rows", "columns"]
 
 @app.get("/api/monitor/realtime", response_model=List[schemas.SensorLogResponse])
-def read_realtime_data(db: Session = Depends(get_db)):
-    """获取仪表盘实时数据"""
-    return crud.get_latest_logs(db)
+async def read_realtime_data(
+    area: Optional[spatial.SpatialFilter] = Depends(spatial_filter),
+    layout: Layout = "rows",
+    db: AsyncSession = Depends(get_async_db),
+):
+    """获取仪表盘实时数据，可按空间范围只取地图可见区域内的站点；layout=columns 按列返回"""
+    return serialize.log_response(await _latest_rows(db, area), layout)
+
+@app.get(
+    "/api/monitor/history/{zone_id}",
+    response_model=Union[List[schemas.SensorLogResponse], List[schemas.SensorRollupResponse]],
+)
+async def read_history_data(
+    zone_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    resolution: Literal["auto", "raw", "hour", "day"] = "auto",
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    layout: Layout = "rows",
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    获取特定站点的历史数据
+    resolution=raw 返回原始读数 (按时间倒序分页，下一页游标在 X-Next-Cursor 响应头中)，
+    hour/day 返回预聚合数据，auto 按 start~end 的跨度自动选择；layout=columns 按列返回
+    """
+    if resolution == "auto":
+        resolution = "raw" if cursor else _auto_resolution(start, end)
+    if resolution != "raw":
+        rollups = await crud_async.get_rollup_history(db, zone_id, resolution, start=start, end=end)
+        return serialize.FastJSONResponse(serialize.rollup_columns(rollups) if layout == "columns" else rollups)
+
+    try:
+        after = pagination.decode_cursor(cursor) if cursor else None
+    except pagination.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    rows = await hot_window.get_history_rows_async(db, zone_id=zone_id, start=start, end=end, limit=limit, after=after)
+    headers = {}
+    if len(rows) == limit:
+        last_id, _zone_id, last_time = rows[-1][:3]  # 列顺序见 crud.LOG_ROW_FIELDS
+        headers["X-Next-Cursor"] = pagination.encode_cursor(last_time, last_id)
+    return serialize.log_response(rows, layout, headers)
+
+ExportFormat = Literal["ndjson", "csv", "arrow", "parquet"]
 
-@app.get("/api/monitor/history/{zone_id}", response_model=List[schemas.SensorLogResponse])
-def read_history_data(zone_id: int, db: Session = Depends(get_db)):
-    """获取特定站点的历史数据"""
-    return crud.get_history_logs(db, zone_id=zone_id)
+def _export_response(db: Session, zone_id, start, end, format: str, filename: str):
+    rows = export.EXPORTERS[format](db, zone_id, start, end)
+    return StreamingResponse(
+        rows,
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{export.FILE_EXTENSIONS[format]}"'},
+    )
 
-@app.post("/api/monitor/upload", response_model=schemas.SensorLogResponse)
-def upload_sensor_data(log: schemas.SensorLogCreate, db: Session = Depends(get_db)):
-    """IoT 设备上传数据接口"""
-    return crud.create_sensor_log(db, log=log)
+@app.get("/api/monitor/history/{zone_id}/export")
+def export_history_data(
+    zone_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    format: ExportFormat = "ndjson",
+    db: Session = Depends(get_db),
+):
+    """流式导出站点全部历史数据 (按时间正序)，内存占用恒定；arrow / parquet 为列式格式"""
+    return _export_response(db, zone_id, start, end, format, f"sensor_logs_{zone_id}")
+
+@app.get("/api/monitor/export")
+def export_sensor_data(
+    zone_id: List[int] = Query(..., description="可重复，导出多个站点"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    format: ExportFormat = "arrow",
+    db: Session = Depends(get_db),
+):
+    """多站点 + 时间范围的批量导出，默认 Arrow IPC 流"""
+    return _export_response(db, zone_id, start, end, format, "sensor_logs")
+
+def _auto_resolution(start: Optional[datetime], end: Optional[datetime]) -> str:
+    if start is None:
+        return "raw"
+    span = (end or datetime.now()) - start
+    if span <= timedelta(days=2):
+        return "raw"
+    if span <= timedelta(days=90):
+        return "hour"
+    return "day"
+
+@app.post(
+    "/api/monitor/upload",
+    response_model=schemas.SensorLogResponse,
+    responses={202: {"description": "写后缓冲模式：已写入本地日志，稍后批量入库"}, 429: {"description": "缓冲区已满"}},
+)
+async def upload_sensor_data(log: schemas.SensorLogCreate, db: AsyncSession = Depends(get_async_db)):
+    """IoT 设备上传数据接口 (INGEST_BUFFER=1 时走写后缓冲，返回 202 与日志序号)"""
+    if write_buffer.INGEST_BUFFER_ENABLED:
+        try:
+            # 追加日志要等 fsync，在线程池中等待
+            seq = await run_in_threadpool(write_buffer.write_buffer.submit, log)
+        except write_buffer.BufferFull:
+            raise HTTPException(status_code=429, detail="Ingest buffer full", headers={"Retry-After": "1"})
+        return JSONResponse(status_code=202, content={"status": "queued", "sequence": seq})
+    return await crud_async.create_sensor_log(db, log=log)
+
+@app.post("/api/monitor/upload/bulk", response_model=schemas.BulkUploadResult)
+async def upload_sensor_data_bulk(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """
+    网关批量上传接口:
+    body 为 JSON 数组，或 Content-Type: application/x-ndjson 的逐行 JSON
+    """
+    # 先按 Content-Length 拒绝，读取中超过字节数 / 行数上限时立即停止，不把过大的请求体整个读进内存
+    try:
+        ingest.check_content_length(request.headers.get("content-length"))
+        if "ndjson" in request.headers.get("content-type", ""):
+            items = await ingest.read_ndjson(request.stream())
+        else:
+            items = await ingest.read_json_array(request.stream())
+    except ingest.BulkTooLarge:
+        raise HTTPException(
+            status_code=413, detail=f"At most {ingest.MAX_BULK_ROWS} rows ({ingest.MAX_BULK_BYTES} bytes) per request"
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be a JSON array")
+    return await ingest.ingest_rows(db, items)
+
+# SSE 保活注释的发送间隔 (秒)，防止代理断开空闲连接
+SSE_KEEPALIVE_SECONDS = 15
+
+@app.websocket("/ws/monitor/realtime")
+async def realtime_websocket(websocket: WebSocket, zone_id: Optional[List[int]] = Query(None)):
+    """实时推送 (WebSocket)：新读数 (type=reading) 与预警等级变化 (type=warning)，可按 zone_id 过滤"""
+    await websocket.accept()
+    sub = realtime.hub.subscribe(set(zone_id) if zone_id else None)
+
+    async def pump():
+        while True:
+            await websocket.send_text(await sub.queue.get())
+
+    sender = asyncio.create_task(pump())
+    try:
+        # 客户端无需发送数据，这里只用于感知断开
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    finally:
+        sender.cancel()
+        realtime.hub.unsubscribe(sub)
+
+@app.get("/api/monitor/stream")
+async def realtime_stream(request: Request, zone_id: Optional[List[int]] = Query(None)):
+    """实时推送 (Server-Sent Events)，消息格式与 WebSocket 相同"""
+    sub = realtime.hub.subscribe(set(zone_id) if zone_id else None)
+
+    async def events():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    message = await asyncio.wait_for(sub.queue.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"data: {message}\n\n"
+        finally:
+            realtime.hub.unsubscribe(sub)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 # ================= KG Routers =================
 
 @app.get("/api/kg/graph", response_model=schemas.GraphData)
-def read_knowledge_graph(db: Session = Depends(get_db)):
-    """获取知识图谱全量数据 (Nodes + Links)"""
-    nodes = crud.get_all_nodes(db)
-    links = crud.get_all_edges(db)
-    return {"nodes": nodes, "links": links}
+async def read_knowledge_graph(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """
+    获取知识图谱全量数据 (Nodes + Links)
+    响应体按图谱版本缓存，客户端带 If-None-Match 且未变化时返回 304
+    """
+    etag, body = await kg_cache.graph_cache.get_or_load_async(db)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    # 不大于响应内容对应的版本，可作为 /api/kg/changes 的 since
+    if kg_cache.graph_cache.kg_version is not None:
+        headers["X-KG-Version"] = str(kg_cache.graph_cache.kg_version)
+    if kg_cache.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.post("/api/kg/import", response_model=schemas.KGImportResult)
+def import_knowledge_graph(graph: schemas.KGImportRequest, db: Session = Depends(get_db)):
+    """
+    批量导入完整图谱：节点按名称、边按 (source, target, relation) 与当前图谱比较，
+    新增 / 修改 / 删除在一个事务内生效并生成新的图谱版本
+    """
+    nodes = [n.model_dump() for n in graph.nodes]
+    edges = [e.model_dump() for e in graph.edges]
+    errors = kg_import.validate_graph(nodes, edges)
+    if errors:
+        raise HTTPException(status_code=400, detail=errors)
+    return kg_import.import_graph(db, nodes, edges, source=graph.source)
+
+@app.get("/api/kg/changes", response_model=schemas.KGChanges)
+def read_kg_changes(since: int = Query(0, ge=0), db: Session = Depends(get_db)):
+    """since 版本之后的节点 / 边变更与删除；客户端保存返回的 version 作为下一次的 since"""
+    return crud.get_kg_changes(db, since)
+
+@app.get("/api/kg/nodes/{node_id}/neighbors", response_model=schemas.GraphData)
+def read_kg_neighbors(
+    node_id: int,
+    direction: Literal["out", "in", "both"] = "out",
+    relation: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """节点的直接邻居，可按方向与关系类型过滤"""
+    graph = kg_index.graph_index.get(db).neighbors(node_id, direction, relation)
+    if graph is None:
+        raise HTTPException(status_code=404, detail="Node not found")
+    return graph
+
+@app.get("/api/kg/nodes/{node_id}/subgraph", response_model=schemas.GraphData)
+def read_kg_subgraph(
+    node_id: int,
+    depth: int = Query(2, ge=1, le=10),
+    direction: Literal["out", "in", "both"] = "out",
+    relation: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """k 跳子图，例如从“海水温度”沿出边查询其导致的全部后果"""
+    graph = kg_index.graph_index.get(db).subgraph(node_id, depth, direction, relation)
+    if graph is None:
+        raise HTTPException(status_code=404, detail="Node not found")
+    return graph
+
+@app.get("/api/kg/path", response_model=schemas.KGPathResponse)
+def read_kg_path(
+    source: int,
+    target: int,
+    relation: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """两个节点之间按边权重 (weight / prob) 乘积最大的因果路径"""
+    path = kg_index.graph_index.get(db).most_probable_path(source, target, relation)
+    if path is None:
+        raise HTTPException(status_code=404, detail="No path found")
+    return path
 
 # ================= Analysis Routers =================
 
-@app.post("/api/analysis/predict", response_model=schemas.WarningResult)
-def predict_outbreak(db: Session = Depends(get_db)):
+@app.get("/api/analysis/features", response_model=List[schemas.ZoneFeatureVector])
+def read_features():
+    """所有站点最近 24 小时的滚动特征 (内存中增量维护，不查询数据库)"""
+    return features.feature_store.all()
+
+@app.get("/api/analysis/features/{zone_id}", response_model=schemas.ZoneFeatureVector)
+def read_zone_features(zone_id: int):
+    vector = features.feature_store.get(zone_id)
+    if vector is None:
+        raise HTTPException(status_code=404, detail="No features for zone")
+    return vector
+
+@app.get("/api/analysis/forecast", response_model=List[schemas.DensityForecastResponse])
+def read_forecasts(
+    hours: int = Query(forecast.FORECAST_HOURS, ge=1, le=forecast.FORECAST_HOURS),
+    db: Session = Depends(get_db),
+):
+    """所有站点未来 hours 小时的密度预测 (读取后台任务最近一次的结果)"""
+    return forecast.get_forecasts(db, hours)
+
+@app.get("/api/analysis/forecast/{zone_id}", response_model=schemas.DensityForecastResponse)
+def read_zone_forecast(
+    zone_id: int,
+    hours: int = Query(forecast.FORECAST_HOURS, ge=1, le=forecast.FORECAST_HOURS),
+    db: Session = Depends(get_db),
+):
+    results = forecast.get_forecasts(db, hours, zone_id=zone_id)
+    if not results:
+        raise HTTPException(status_code=404, detail="No forecast for zone")
+    return results[0]
+
+@app.get("/api/analysis/alerts", response_model=List[schemas.AnomalyEventResponse])
+def read_alerts(
+    response: Response,
+    zone_id: Optional[int] = None,
+    metric: Optional[Literal[models.SENSOR_METRICS]] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+):
+    """在线检测到的异常事件 (按时间倒序分页，下一页游标在 X-Next-Cursor 响应头中)"""
+    try:
+        after = pagination.decode_cursor(cursor) if cursor else None
+    except pagination.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    events = anomaly.get_alerts(db, zone_id, metric, start, end, limit, after)
+    if len(events) == limit:
+        last = events[-1]
+        response.headers["X-Next-Cursor"] = pagination.encode_cursor(last.record_time, last.id)
+    return events
+
+@app.post("/api/analysis/backtest", response_model=schemas.BacktestResult)
+def run_backtest(config: schemas.BacktestRequest, db: Session = Depends(get_db)):
+    """
+    用历史读数回测一组预警阈值：horizon_hours 内出现密度 >= outbreak_density 的读数为正例，
+    返回每组阈值的 precision / recall 与爆发前的平均提前量
+    """
+    if config.workers == 1:
+        return backtest.run_backtest(db, config)
+    return backtest.run_backtest(db, config, _backtest_executor())
+
+@app.post("/api/analysis/predict", response_model=List[schemas.WarningResult])
+def predict_outbreak(
+    rules: Optional[schemas.WarningRuleSet] = None, db: Session = Depends(get_db)
+):
     """
-    简易推理逻辑 Demo:
-    检查最新数据，如果水温 > 25度且叶绿素 > 1.5，则发出红色预警
+    对所有站点的最新数据批量推理:
+    水温与叶绿素同时超过 red_* 阈值为红色预警，超过 orange_* 阈值为橙色预警；
+    设置 orange_temperature_slope 时，24 小时升温斜率超过该值的站点也为橙色预警。
+    可在 body 中传入 WarningRuleSet 覆盖默认阈值。
     """
-    logs = crud.get_latest_logs(db)
-    if not logs:
+    results = None
+    if shared_snapshot.SHARED_SNAPSHOT_ENABLED and rules is None:
+        # 默认规则的等级由快照更新者预先算好
+        data = shared_snapshot.snapshot_service.read()
+        if data is not None:
+            results = analysis.warning_results(*shared_snapshot.predict_inputs(data))
+    if results is None:
+        results = analysis.predict_all_zones(db, rules or schemas.WarningRuleSet())
+    if not results:
         raise HTTPException(status_code=404, detail="No sensor data found")
-    
-    # 选取第一个监测点作为示例
-    target_log = logs[0] 
-    
-    # 简单的规则引擎
-    if target_log.temperature > 25.0 and target_log.chlorophyll > 1.5:
-        return {
-            "level": "RED",
-            "zone_name": str(target_log.zone_id), # 实际应查 Zone Name
-            "message": f"监测到高温({target_log.temperature}℃)与富营养化，爆发概率极高！",
-            "timestamp": datetime.now()
-        }
-    else:
-        return {
-            "level": "GREEN",
-            "zone_name": str(target_log.zone_id),
-            "message": "当前环境指标正常，暂无爆发风险。",
-            "timestamp": datetime.now()
-        }
\ No newline at end of file
+    return results
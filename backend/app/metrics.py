@@ -0,0 +1,196 @@
+"""
+请求级指标：按路由统计延迟直方图，抽样统计每个请求的 SQL 次数与耗时，
+以 Prometheus 文本格式通过 /metrics 暴露
+"""
+import bisect
+import os
+import random
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+
+# 抽样比例：只有被抽中的请求才统计 SQL 明细，降低高负载下的开销
+METRICS_SAMPLE_RATE = float(os.getenv("METRICS_SAMPLE_RATE", "0.1"))
+# 为抽样请求添加 Server-Timing 响应头 (浏览器开发者工具可直接查看)
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个为 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestStats:
+    """单个请求的 SQL 统计，通过 ContextVar 传递到线程池中的处理函数"""
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+_current_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency: Dict[Tuple[str, str], Histogram] = {}
+        self.responses: Dict[Tuple[str, str, int], int] = {}
+        # 抽样请求的 SQL 统计: (method, route) -> [请求数, 查询数, DB 秒数]
+        self.db: Dict[Tuple[str, str], List[float]] = {}
+        self.queries_total = 0
+        self._gauges: Dict[str, Tuple[str, Callable[[], float]]] = {}
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float,
+                        stats: Optional[RequestStats]):
+        key = (method, route)
+        with self._lock:
+            hist = self.latency.get(key)
+            if hist is None:
+                hist = self.latency[key] = Histogram()
+            hist.observe(seconds)
+            status_key = (method, route, status)
+            self.responses[status_key] = self.responses.get(status_key, 0) + 1
+            if stats is not None:
+                db = self.db.setdefault(key, [0, 0, 0.0])
+                db[0] += 1
+                db[1] += stats.queries
+                db[2] += stats.db_seconds
+
+    def register_gauge(self, name: str, help_text: str, fn: Callable[[], float]):
+        """注册在抓取时求值的 gauge (如队列深度、订阅数)"""
+        self._gauges[name] = (help_text, fn)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            lines += [
+                "# HELP http_request_duration_seconds Request latency by route",
+                "# TYPE http_request_duration_seconds histogram",
+            ]
+            for (method, route), hist in sorted(self.latency.items()):
+                labels = f'method="{method}",route="{route}"'
+                cumulative = 0
+                for bound, count in zip(hist.buckets, hist.counts):
+                    cumulative += count
+                    lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {hist.count}')
+                lines.append(f"http_request_duration_seconds_sum{{{labels}}} {hist.sum}")
+                lines.append(f"http_request_duration_seconds_count{{{labels}}} {hist.count}")
+
+            lines += [
+                "# HELP http_responses_total Responses by route and status code",
+                "# TYPE http_responses_total counter",
+            ]
+            for (method, route, status), count in sorted(self.responses.items()):
+                lines.append(f'http_responses_total{{method="{method}",route="{route}",status="{status}"}} {count}')
+
+            lines += [
+                "# HELP http_sampled_requests_total Requests sampled for SQL statistics",
+                "# TYPE http_sampled_requests_total counter",
+                "# HELP http_request_db_queries_total SQL statements issued by sampled requests",
+                "# TYPE http_request_db_queries_total counter",
+                "# HELP http_request_db_seconds_total Time spent in SQL by sampled requests",
+                "# TYPE http_request_db_seconds_total counter",
+            ]
+            for (method, route), (sampled, queries, seconds) in sorted(self.db.items()):
+                labels = f'method="{method}",route="{route}"'
+                lines.append(f"http_sampled_requests_total{{{labels}}} {sampled}")
+                lines.append(f"http_request_db_queries_total{{{labels}}} {queries}")
+                lines.append(f"http_request_db_seconds_total{{{labels}}} {seconds}")
+
+            lines += [
+                "# HELP db_queries_total SQL statements executed by this process",
+                "# TYPE db_queries_total counter",
+                f"db_queries_total {self.queries_total}",
+            ]
+        for name, (help_text, fn) in sorted(self._gauges.items()):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {fn()}"]
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def start_request() -> Tuple[float, Optional[RequestStats]]:
+    stats = RequestStats() if random.random() < METRICS_SAMPLE_RATE else None
+    _current_stats.set(stats)
+    return time.perf_counter(), stats
+
+
+def server_timing(seconds: float, stats: RequestStats) -> str:
+    return (
+        f"app;dur={seconds * 1000:.2f}, "
+        f'db;dur={stats.db_seconds * 1000:.2f};desc="{stats.queries} queries"'
+    )
+
+
+class MetricsMiddleware:
+    """
+    纯 ASGI 中间件：记录每个路由的延迟与状态码，被抽样的请求额外统计 SQL 次数与耗时。
+    不经过 BaseHTTPMiddleware，流式响应不被缓冲；处理中抛出异常、没有发出响应的请求在 finally 中记为 500
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start, stats = start_request()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if stats is not None and SERVER_TIMING:
+                    MutableHeaders(scope=message).append(
+                        "Server-Timing", server_timing(time.perf_counter() - start, stats)
+                    )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            # 路由匹配后 Router 把 route 写回同一个 scope
+            route = getattr(scope.get("route"), "path", "<unmatched>")
+            registry.observe_request(scope["method"], route, status, time.perf_counter() - start, stats)
+
+
+# --- SQLAlchemy 事件：统计所有 Engine 的 SQL 执行 ---
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    registry.queries_total += 1  # 近似计数，不加锁
+    if _current_stats.get() is not None:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats.get()
+    if stats is None:
+        return
+    starts = conn.info.get("query_start")
+    if starts:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - starts.pop()
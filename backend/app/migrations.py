@@ -0,0 +1,380 @@
+"""
+版本化的数据库迁移：MIGRATIONS 按版本号顺序执行，已执行的版本记录在 schema_migrations 表中。
+应用导入与启动时不再建表，部署时在启动 worker 之前执行一次：
+
+    python scripts/migrate.py            # 升级到最新版本
+    python scripts/migrate.py --status   # 查看当前版本与待执行的迁移
+
+每个迁移与其版本记录在同一事务中提交；执行期间持有 advisory lock，多个实例同时执行也只会迁移一次。
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Callable, List, NamedTuple, Optional
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, insert, select, text
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+# sensor_logs 的六项指标 (与 models.SENSOR_METRICS 相同，这里固定下来)
+_METRICS = ("temperature", "salinity", "current_speed", "chlorophyll", "dissolved_oxygen", "jellyfish_density")
+
+# pg_advisory_lock 的键，任意固定值
+MIGRATION_LOCK_KEY = 7_301_001
+
+# 迁移记录表不属于 models.Base，drop_all / create_all 不会影响它
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[Connection], None]
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, description: str):
+    def register(fn):
+        MIGRATIONS.append(Migration(version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return fn
+    return register
+
+
+def head() -> int:
+    return MIGRATIONS[-1].version if MIGRATIONS else 0
+
+
+# 迁移中的 DDL 都写成固定的 SQL，不引用 models：模型以后的改动不会改变已发布迁移的含义，
+# 模型的改动需要新增迁移。IF NOT EXISTS 使迁移在由 create_all 建立的库上也能执行。
+
+# 引入迁移时的表结构 (sensor_logs 尚未分区，由版本 2 转换)
+_BASELINE_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS postgis",
+    """CREATE TABLE IF NOT EXISTS kg_nodes (
+        id SERIAL PRIMARY KEY,
+        name VARCHAR NOT NULL,
+        label VARCHAR NOT NULL,
+        properties JSONB
+    )""",
+    """CREATE TABLE IF NOT EXISTS kg_edges (
+        id SERIAL PRIMARY KEY,
+        source_id INTEGER REFERENCES kg_nodes (id),
+        target_id INTEGER REFERENCES kg_nodes (id),
+        relation VARCHAR NOT NULL,
+        properties JSONB
+    )""",
+    """CREATE TABLE IF NOT EXISTS marine_zones (
+        id SERIAL PRIMARY KEY,
+        name VARCHAR,
+        zone_type VARCHAR,
+        geom geometry(POINT, 4326)
+    )""",
+    """CREATE TABLE IF NOT EXISTS sensor_logs (
+        id BIGSERIAL PRIMARY KEY,
+        zone_id INTEGER REFERENCES marine_zones (id),
+        record_time TIMESTAMP WITHOUT TIME ZONE,
+        temperature FLOAT,
+        salinity FLOAT,
+        current_speed FLOAT,
+        chlorophyll FLOAT,
+        dissolved_oxygen FLOAT,
+        jellyfish_density FLOAT
+    )""",
+    """CREATE TABLE IF NOT EXISTS zone_latest (
+        zone_id INTEGER PRIMARY KEY REFERENCES marine_zones (id),
+        log_id BIGINT NOT NULL REFERENCES sensor_logs (id),
+        record_time TIMESTAMP WITHOUT TIME ZONE NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS zone_features (
+        zone_id INTEGER PRIMARY KEY REFERENCES marine_zones (id),
+        last_log_id BIGINT NOT NULL,
+        state JSONB NOT NULL,
+        updated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS density_forecasts (
+        zone_id INTEGER PRIMARY KEY REFERENCES marine_zones (id),
+        issued_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        base_time TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        density FLOAT[] NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+        name VARCHAR PRIMARY KEY,
+        seq BIGINT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS anomaly_events (
+        id BIGSERIAL PRIMARY KEY,
+        zone_id INTEGER NOT NULL REFERENCES marine_zones (id),
+        log_id BIGINT NOT NULL,
+        record_time TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        metric VARCHAR NOT NULL,
+        value FLOAT NOT NULL,
+        expected FLOAT NOT NULL,
+        zscore FLOAT NOT NULL,
+        detected_at TIMESTAMP WITHOUT TIME ZONE NOT NULL
+    )""",
+] + [
+    f"""CREATE TABLE IF NOT EXISTS {table} (
+        zone_id INTEGER REFERENCES marine_zones (id),
+        bucket TIMESTAMP WITHOUT TIME ZONE,
+        sample_count INTEGER NOT NULL,
+        {", ".join(f"{metric}_{agg} FLOAT" for metric in _METRICS for agg in ("min", "max", "sum"))},
+        PRIMARY KEY (zone_id, bucket)
+    )"""
+    for table in ("sensor_rollups_hourly", "sensor_rollups_daily")
+] + [
+    "CREATE INDEX IF NOT EXISTS ix_kg_nodes_id ON kg_nodes (id)",
+    "CREATE INDEX IF NOT EXISTS ix_kg_edges_id ON kg_edges (id)",
+    "CREATE INDEX IF NOT EXISTS ix_marine_zones_id ON marine_zones (id)",
+    "CREATE INDEX IF NOT EXISTS idx_marine_zones_geom ON marine_zones USING gist (geom)",
+    "CREATE INDEX IF NOT EXISTS ix_sensor_logs_id ON sensor_logs (id)",
+]
+
+
+@migration(1, "baseline schema")
+def _baseline(conn: Connection):
+    for sql in _BASELINE_DDL:
+        conn.execute(text(sql))
+
+
+def _create_sensor_logs(conn: Connection):
+    """按月分区的 sensor_logs (主键必须包含分区键)，没有对应分区的读数落入默认分区"""
+    conn.execute(text(f"""CREATE TABLE sensor_logs (
+        id BIGSERIAL NOT NULL,
+        zone_id INTEGER REFERENCES marine_zones (id),
+        record_time TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        {", ".join(f"{metric} FLOAT" for metric in _METRICS)},
+        PRIMARY KEY (id, record_time)
+    ) PARTITION BY RANGE (record_time)"""))
+    conn.execute(text("CREATE TABLE sensor_logs_default PARTITION OF sensor_logs DEFAULT"))
+    conn.execute(text(
+        "CREATE INDEX ix_sensor_logs_zone_id_record_time ON sensor_logs (zone_id, record_time DESC, id DESC)"
+    ))
+
+
+def _create_month_partition(conn: Connection, month: datetime):
+    """[月初, 下月初) 的分区，命名与 partitions.partition_name 相同 (维护任务按名称识别分区)"""
+    end = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+    conn.execute(text(
+        f"CREATE TABLE sensor_logs_p{month:%Y%m} PARTITION OF sensor_logs "
+        f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+    ))
+
+
+@migration(2, "partition sensor_logs by month")
+def _partition_sensor_logs(conn: Connection):
+    """
+    已有的非分区 sensor_logs 改名后逐月建分区、整表复制、接上原序列值后删除旧表
+    (由 create_all 建立的库已是分区表，跳过)。zone_latest.log_id 的外键随之去掉。
+    当前及未来月份的分区由后台维护任务 (partitions.run_maintenance) 建立，建好之前的读数暂存在默认分区
+    """
+    conn.execute(text("ALTER TABLE zone_latest DROP CONSTRAINT IF EXISTS zone_latest_log_id_fkey"))
+    conn.execute(text("""CREATE TABLE IF NOT EXISTS sensor_log_retention (
+        partition VARCHAR PRIMARY KEY,
+        range_start TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        range_end TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        row_count BIGINT,
+        compacted_at TIMESTAMP WITHOUT TIME ZONE,
+        dropped_at TIMESTAMP WITHOUT TIME ZONE
+    )"""))
+    partitioned = conn.scalar(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('sensor_logs'))"
+    ))
+    if not partitioned:
+        old = "sensor_logs_unpartitioned"
+        conn.execute(text(f"ALTER TABLE sensor_logs RENAME TO {old}"))
+        # 索引与序列名是全局的，让出给新表
+        conn.execute(text(f"ALTER TABLE {old} DROP CONSTRAINT sensor_logs_pkey"))
+        conn.execute(text("DROP INDEX IF EXISTS ix_sensor_logs_id, ix_sensor_logs_zone_id_record_time"))
+        conn.execute(text(f"ALTER SEQUENCE sensor_logs_id_seq RENAME TO {old}_id_seq"))
+        _create_sensor_logs(conn)
+
+        months = conn.scalars(text(
+            f"SELECT DISTINCT date_trunc('month', record_time) FROM {old} WHERE record_time IS NOT NULL"
+        )).all()
+        for month in months:
+            _create_month_partition(conn, month)
+        columns = ", ".join(("id", "zone_id", "record_time") + _METRICS)
+        copied = conn.execute(text(
+            f"INSERT INTO sensor_logs ({columns}) SELECT {columns} FROM {old} WHERE record_time IS NOT NULL"
+        )).rowcount
+        skipped = conn.scalar(text(f"SELECT count(*) FROM {old} WHERE record_time IS NULL"))
+        if skipped:
+            logger.warning("skipped %d sensor logs without record_time", skipped)
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('sensor_logs', 'id'), (SELECT last_value FROM {old}_id_seq))"
+        ))
+        conn.execute(text(f"DROP TABLE {old}"))
+        logger.info("copied %d sensor logs into %d monthly partitions", copied, len(months))
+
+
+@migration(3, "versioned knowledge graph")
+def _version_kg(conn: Connection):
+    for table in ("kg_nodes", "kg_edges"):
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 0"))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_version ON {table} (version)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_kg_nodes_name ON kg_nodes (name)"))
+    conn.execute(text("""CREATE TABLE IF NOT EXISTS kg_versions (
+        version SERIAL PRIMARY KEY,
+        created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        source VARCHAR,
+        nodes_added INTEGER NOT NULL,
+        nodes_updated INTEGER NOT NULL,
+        nodes_deleted INTEGER NOT NULL,
+        edges_added INTEGER NOT NULL,
+        edges_updated INTEGER NOT NULL,
+        edges_deleted INTEGER NOT NULL
+    )"""))
+    conn.execute(text("""CREATE TABLE IF NOT EXISTS kg_deletions (
+        id BIGSERIAL PRIMARY KEY,
+        version INTEGER NOT NULL REFERENCES kg_versions (version),
+        entity VARCHAR NOT NULL,
+        entity_id INTEGER NOT NULL
+    )"""))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_kg_deletions_version ON kg_deletions (version)"))
+
+
+@migration(4, "indexes added before versioned migrations")
+def _series_indexes(conn: Connection):
+    """
+    版本 1 最初由 create_all 执行，已存在的表被整表跳过，之后加到这些表上的索引从未建立；
+    这里逐个补建 (新库在版本 1、2 中已建好的会被跳过)。数据量大时可以先在库上手动
+    CREATE INDEX CONCURRENTLY 同名索引，避免迁移期间长时间阻塞写入
+    """
+    for sql in [
+        "CREATE INDEX IF NOT EXISTS ix_marine_zones_geog ON marine_zones USING gist ((geom::geography))",
+        "CREATE INDEX IF NOT EXISTS ix_sensor_logs_zone_id_record_time "
+        "ON sensor_logs (zone_id, record_time DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS ix_anomaly_events_record_time ON anomaly_events (record_time DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS ix_anomaly_events_zone_id_record_time "
+        "ON anomaly_events (zone_id, record_time DESC, id DESC)",
+    ]:
+        conn.execute(text(sql))
+
+
+@migration(5, "backfill zone_latest")
+def _backfill_zone_latest(conn: Connection):
+    """zone_latest 只在写入时维护，引入之前已有的读数在这里补齐 (与 crud.rebuild_zone_latest 相同)"""
+    conn.execute(text("""
+        INSERT INTO zone_latest (zone_id, log_id, record_time)
+        SELECT DISTINCT ON (zone_id) zone_id, id, record_time FROM sensor_logs
+        WHERE zone_id IS NOT NULL AND record_time IS NOT NULL
+        ORDER BY zone_id, record_time DESC, id DESC
+        ON CONFLICT (zone_id) DO UPDATE SET log_id = excluded.log_id, record_time = excluded.record_time
+    """))
+
+
+@migration(6, "backfill sensor rollups")
+def _backfill_rollups(conn: Connection):
+    """
+    汇总表只在写入时累加，引入之前已有的读数在这里按原始数据重算 (与 crud.rebuild_rollups 相同)；
+    原始分区已被保留策略删除的月份不受影响
+    """
+    aggregates = ", ".join(f"min({m}), max({m}), sum({m})" for m in _METRICS)
+    names = ", ".join(f"{m}_{agg}" for m in _METRICS for agg in ("min", "max", "sum"))
+    updates = ", ".join(f"{n} = excluded.{n}" for n in ["sample_count"] + names.split(", "))
+    for unit, table in (("hour", "sensor_rollups_hourly"), ("day", "sensor_rollups_daily")):
+        conn.execute(text(f"""
+            INSERT INTO {table} (zone_id, bucket, sample_count, {names})
+            SELECT zone_id, date_trunc('{unit}', record_time), count(*), {aggregates} FROM sensor_logs
+            WHERE zone_id IS NOT NULL AND record_time IS NOT NULL
+            GROUP BY zone_id, date_trunc('{unit}', record_time)
+            ON CONFLICT (zone_id, bucket) DO UPDATE SET {updates}
+        """))
+
+
+
+@migration(7, "stamp knowledge graph writes in the database")
+def _kg_version_triggers(conn: Connection):
+    """
+    每个写入 kg_nodes / kg_edges 的事务 (ORM、脚本、手写 SQL、其他 worker) 都由触发器分配一个 kg_versions 版本：
+    插入 / 更新的行带上该版本，删除写入 kg_deletions。分配版本时取事务级 advisory lock，
+    图谱写入事务因此串行提交，版本号与提交顺序一致，按 version > N 读取增量不会漏掉较晚提交的较小版本。
+    kg_import 自行插入版本行后写入 kg.tx_version，触发器沿用同一版本
+    """
+    conn.execute(text("""
+        CREATE OR REPLACE FUNCTION kg_tx_version() RETURNS integer AS $$
+        DECLARE
+            v integer := nullif(current_setting('kg.tx_version', true), '')::integer;
+        BEGIN
+            IF v IS NULL THEN
+                PERFORM pg_advisory_xact_lock(7301005);
+                INSERT INTO kg_versions (created_at, nodes_added, nodes_updated, nodes_deleted,
+                                         edges_added, edges_updated, edges_deleted)
+                VALUES (localtimestamp, 0, 0, 0, 0, 0, 0) RETURNING version INTO v;
+                PERFORM set_config('kg.tx_version', v::text, true);
+            END IF;
+            RETURN v;
+        END
+        $$ LANGUAGE plpgsql
+    """))
+    conn.execute(text("""
+        CREATE OR REPLACE FUNCTION kg_stamp_version() RETURNS trigger AS $$
+        BEGIN
+            NEW.version := kg_tx_version();
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """))
+    conn.execute(text("""
+        CREATE OR REPLACE FUNCTION kg_record_deletion() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO kg_deletions (version, entity, entity_id) VALUES (kg_tx_version(), TG_ARGV[0], OLD.id);
+            RETURN OLD;
+        END
+        $$ LANGUAGE plpgsql
+    """))
+    for table, entity in (("kg_nodes", "node"), ("kg_edges", "edge")):
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {table}_version ON {table}"))
+        conn.execute(text(
+            f"CREATE TRIGGER {table}_version BEFORE INSERT OR UPDATE ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION kg_stamp_version()"
+        ))
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {table}_deletion ON {table}"))
+        conn.execute(text(
+            f"CREATE TRIGGER {table}_deletion AFTER DELETE ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION kg_record_deletion('{entity}')"
+        ))
+
+def current_version(conn: Connection) -> int:
+    """数据库当前的版本，尚未执行过迁移时为 0"""
+    if not conn.dialect.has_table(conn, schema_migrations.name):
+        return 0
+    return conn.scalar(select(func.coalesce(func.max(schema_migrations.c.version), 0)))
+
+
+def pending(conn: Connection) -> List[Migration]:
+    version = current_version(conn)
+    return [m for m in MIGRATIONS if m.version > version]
+
+
+def upgrade(engine: Engine, target: Optional[int] = None) -> List[int]:
+    """执行到 target (默认最新) 版本，返回本次执行的版本号"""
+    applied = []
+    with engine.connect() as lock_conn:
+        lock_conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        try:
+            with engine.begin() as conn:
+                schema_migrations.create(conn, checkfirst=True)
+            with engine.connect() as conn:
+                todo = [m for m in pending(conn) if target is None or m.version <= target]
+            for m in todo:
+                logger.info("applying migration %d: %s", m.version, m.description)
+                with engine.begin() as conn:
+                    m.apply(conn)
+                    conn.execute(insert(schema_migrations).values(
+                        version=m.version, description=m.description, applied_at=datetime.now(),
+                    ))
+                applied.append(m.version)
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+            lock_conn.commit()
+    return applied
@@ -1,15 +1,17 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, BigInteger
-from sqlalchemy.dialects.postgresql import JSONB
-from sqlalchemy.orm import relationship
-from geoalchemy2 import Geometry # 处理 GIS 数据
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, BigInteger, Index, DDL, cast, event, func
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+from sqlalchemy.orm import relationship, column_property
+from geoalchemy2 import Geometry, Geography # 处理 GIS 数据
 from .database import Base
 
 class KGNode(Base):
     __tablename__ = "kg_nodes"
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, nullable=False)
+    name = Column(String, nullable=False, index=True)  # 批量导入按名称匹配节点
     label = Column(String, nullable=False)
     properties = Column(JSONB, default={})
+    # 最后一次由批量导入 (kg_import) 写入的图谱版本，0 表示版本化之前的数据
+    version = Column(Integer, nullable=False, server_default="0", index=True)
 
 class KGEdge(Base):
     __tablename__ = "kg_edges"
@@ -18,20 +20,61 @@ class KGEdge(Base):
     target_id = Column(Integer, ForeignKey("kg_nodes.id"))
     relation = Column(String, nullable=False)
     properties = Column(JSONB, default={})
+    version = Column(Integer, nullable=False, server_default="0", index=True)
+
+class KGVersion(Base):
+    """每次改变了图谱的批量导入生成一个版本"""
+    __tablename__ = "kg_versions"
+    version = Column(Integer, primary_key=True)
+    created_at = Column(DateTime, nullable=False)
+    source = Column(String)  # 导入来源说明 (文件名等)
+    nodes_added = Column(Integer, nullable=False, default=0)
+    nodes_updated = Column(Integer, nullable=False, default=0)
+    nodes_deleted = Column(Integer, nullable=False, default=0)
+    edges_added = Column(Integer, nullable=False, default=0)
+    edges_updated = Column(Integer, nullable=False, default=0)
+    edges_deleted = Column(Integer, nullable=False, default=0)
+
+class KGDeletion(Base):
+    """导入时删除的节点 / 边，供 /api/kg/changes 增量同步"""
+    __tablename__ = "kg_deletions"
+    id = Column(BigInteger, primary_key=True)
+    version = Column(Integer, ForeignKey("kg_versions.version"), nullable=False, index=True)
+    entity = Column(String, nullable=False)  # "node" / "edge"
+    entity_id = Column(Integer, nullable=False)
 
 class MarineZone(Base):
     __tablename__ = "marine_zones"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
     zone_type = Column(String)
-    # 存储经纬度点 SRID 4326 (WGS84)
+    # 存储经纬度点 SRID 4326 (WGS84)，GeoAlchemy2 会自动建 GiST 索引 (idx_marine_zones_geom)
     geom = Column(Geometry('POINT', srid=4326)) 
+    # 服务端解码经纬度，随 MarineZone 一起查询
+    lon = column_property(func.ST_X(geom))
+    lat = column_property(func.ST_Y(geom))
+
+    __table_args__ = (
+        # 按米计算的半径查询使用 geography 表达式索引
+        Index("ix_marine_zones_geog", cast(geom, Geography(srid=4326)), postgresql_using="gist"),
+    )
+
+# SensorLog 中参与统计的六项指标
+SENSOR_METRICS = (
+    "temperature",
+    "salinity",
+    "current_speed",
+    "chlorophyll",
+    "dissolved_oxygen",
+    "jellyfish_density",
+)
 
 class SensorLog(Base):
+    """按 record_time 月度分区 (见 partitions.py)；分区表的主键必须包含分区键"""
     __tablename__ = "sensor_logs"
-    id = Column(BigInteger, primary_key=True, index=True)
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
     zone_id = Column(Integer, ForeignKey("marine_zones.id"))
-    record_time = Column(DateTime)
+    record_time = Column(DateTime, primary_key=True)
     temperature = Column(Float)
     salinity = Column(Float)
     current_speed = Column(Float)
@@ -40,4 +83,105 @@ class SensorLog(Base):
     jellyfish_density = Column(Float)
     
     # 建立反向关系以便查询
-    zone = relationship("MarineZone")
\ No newline at end of file
+    zone = relationship("MarineZone")
+
+    __table_args__ = (
+        # 按站点取最新数据 / 历史数据 (含 (record_time, id) 游标分页) 都走这个复合索引
+        Index("ix_sensor_logs_zone_id_record_time", zone_id, record_time.desc(), id.desc()),
+        {"postgresql_partition_by": "RANGE (record_time)"},
+    )
+
+# 没有对应月度分区的读数落入默认分区，create_all 建表后即可写入
+event.listen(
+    SensorLog.__table__,
+    "after_create",
+    DDL("CREATE TABLE IF NOT EXISTS sensor_logs_default PARTITION OF sensor_logs DEFAULT"),
+)
+
+class ZoneLatest(Base):
+    """每个站点最新一条读数的快照，由 create_sensor_log 写入时 upsert 维护"""
+    __tablename__ = "zone_latest"
+    zone_id = Column(Integer, ForeignKey("marine_zones.id"), primary_key=True)
+    # 分区表上 id 不单独唯一，无法建外键；(log_id, record_time) 即 sensor_logs 的主键
+    log_id = Column(BigInteger, nullable=False)
+    record_time = Column(DateTime, nullable=False)
+
+class ZoneFeatureSnapshot(Base):
+    """特征库 (features.FeatureStore) 的窗口状态快照，重启后从这里恢复"""
+    __tablename__ = "zone_features"
+    zone_id = Column(Integer, ForeignKey("marine_zones.id"), primary_key=True)
+    last_log_id = Column(BigInteger, nullable=False)  # 快照包含的最大读数 id
+    state = Column(JSONB, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+
+class DensityForecast(Base):
+    """后台任务 (forecast.run_forecasts) 生成的密度预测，每个站点保留最新一次"""
+    __tablename__ = "density_forecasts"
+    zone_id = Column(Integer, ForeignKey("marine_zones.id"), primary_key=True)
+    issued_at = Column(DateTime, nullable=False)
+    base_time = Column(DateTime, nullable=False)  # 预测所依据的最新读数时间
+    density = Column(ARRAY(Float), nullable=False)  # base_time 之后逐小时的预测值
+
+class IngestCheckpoint(Base):
+    """写后缓冲 (write_buffer) 已入库的最大日志序号，与数据在同一事务中更新"""
+    __tablename__ = "ingest_checkpoints"
+    name = Column(String, primary_key=True)
+    seq = Column(BigInteger, nullable=False)
+
+class SensorLogRetention(Base):
+    """数据保留任务 (partitions.run_retention) 的进度，每个过期的月度分区一行"""
+    __tablename__ = "sensor_log_retention"
+    partition = Column(String, primary_key=True)
+    range_start = Column(DateTime, nullable=False)
+    range_end = Column(DateTime, nullable=False)
+    row_count = Column(BigInteger)  # 压缩时分区中的原始读数条数
+    compacted_at = Column(DateTime)  # 已重算汇总表
+    dropped_at = Column(DateTime)  # 已分离并删除原始分区
+
+class AnomalyEvent(Base):
+    """写入路径上在线检测到的异常读数 (anomaly.AnomalyDetector)"""
+    __tablename__ = "anomaly_events"
+    id = Column(BigInteger, primary_key=True)
+    zone_id = Column(Integer, ForeignKey("marine_zones.id"), nullable=False)
+    log_id = Column(BigInteger, nullable=False)
+    record_time = Column(DateTime, nullable=False)
+    metric = Column(String, nullable=False)
+    value = Column(Float, nullable=False)
+    expected = Column(Float, nullable=False)  # 检测时的 EWMA 均值
+    zscore = Column(Float, nullable=False)
+    detected_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_anomaly_events_record_time", record_time.desc(), id.desc()),
+        Index("ix_anomaly_events_zone_id_record_time", zone_id, record_time.desc(), id.desc()),
+    )
+
+class _SensorRollupMixin:
+    """按时间桶预聚合的传感器数据，保存 sum 而不是 mean 以便增量累加"""
+    zone_id = Column(Integer, ForeignKey("marine_zones.id"), primary_key=True)
+    bucket = Column(DateTime, primary_key=True)  # 桶起始时间 (date_trunc)
+    sample_count = Column(Integer, nullable=False)
+    temperature_min = Column(Float)
+    temperature_max = Column(Float)
+    temperature_sum = Column(Float)
+    salinity_min = Column(Float)
+    salinity_max = Column(Float)
+    salinity_sum = Column(Float)
+    current_speed_min = Column(Float)
+    current_speed_max = Column(Float)
+    current_speed_sum = Column(Float)
+    chlorophyll_min = Column(Float)
+    chlorophyll_max = Column(Float)
+    chlorophyll_sum = Column(Float)
+    dissolved_oxygen_min = Column(Float)
+    dissolved_oxygen_max = Column(Float)
+    dissolved_oxygen_sum = Column(Float)
+    jellyfish_density_min = Column(Float)
+    jellyfish_density_max = Column(Float)
+    jellyfish_density_sum = Column(Float)
+
+class SensorRollupHourly(_SensorRollupMixin, Base):
+    __tablename__ = "sensor_rollups_hourly"
+
+class SensorRollupDaily(_SensorRollupMixin, Base):
+    __tablename__ = "sensor_rollups_daily"
@@ -0,0 +1,23 @@
+"""基于 (record_time, id) 的游标分页：游标对客户端不透明，只需原样回传"""
+import base64
+import json
+from datetime import datetime
+from typing import Tuple
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(record_time: datetime, row_id: int) -> str:
+    raw = json.dumps([record_time.isoformat(), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        record_time, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(record_time), int(row_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"invalid cursor: {cursor!r}") from e
@@ -0,0 +1,224 @@
+"""
+sensor_logs 的月度分区维护与数据保留 (后台定时执行，也可用 scripts/retention.py 手动执行)
+
+- 分区命名为 sensor_logs_pYYYYMM，范围 [月初, 下月初)；没有对应分区的读数落入 sensor_logs_default
+- 提前建好未来 PARTITION_PREMAKE_MONTHS 个月的分区；默认分区中已有的该月读数在建分区时迁入
+- 早于 SENSOR_RETENTION_MONTHS 个月的整月分区依次：补齐小时/天汇总 (压缩) -> 分离 -> 删除。
+  每一步的进度记录在 sensor_log_retention 表中，中断后从未完成的步骤继续
+- 结构变更与压缩只在 lock_timeout 内等待表锁，拿不到就留到下一轮，不会长时间阻塞写入
+
+删除分区后，长期没有新读数的站点在 zone_latest 中指向的读数也随之删除，不再出现在实时数据中。
+"""
+import logging
+import os
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import OperationalError
+
+from . import crud, models
+
+logger = logging.getLogger(__name__)
+
+# 原始读数保留的月数，0 表示不删除
+SENSOR_RETENTION_MONTHS = int(os.getenv("SENSOR_RETENTION_MONTHS", "0"))
+PARTITION_PREMAKE_MONTHS = int(os.getenv("PARTITION_PREMAKE_MONTHS", "3"))
+PARTITION_MAINTENANCE_SECONDS = int(os.getenv("PARTITION_MAINTENANCE_SECONDS", "3600"))
+# 分区结构变更等待锁的上限
+DDL_LOCK_TIMEOUT = os.getenv("PARTITION_LOCK_TIMEOUT", "2s")
+# 清理默认分区中过期读数时每个事务删除的行数
+PURGE_BATCH_ROWS = 10_000
+# 多个 worker 同时触发维护时只有一个执行
+MAINTENANCE_LOCK_KEY = 7_301_002
+
+PARENT = models.SensorLog.__tablename__
+DEFAULT_PARTITION = f"{PARENT}_default"
+
+
+def month_start(t: datetime) -> datetime:
+    return t.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month: datetime, n: int) -> datetime:
+    years, m = divmod(month.month - 1 + n, 12)
+    return month.replace(year=month.year + years, month=m + 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"{PARENT}_p{month:%Y%m}"
+
+
+def partition_month(name: str) -> datetime:
+    return datetime.strptime(name[len(PARENT) + 2:], "%Y%m")
+
+
+def is_partitioned(conn: Connection) -> bool:
+    return conn.scalar(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:t))"
+    ), {"t": PARENT})
+
+
+def attached_partitions(conn: Connection) -> List[str]:
+    """已挂在 sensor_logs 上的月度分区 (不含默认分区)，按月份排序"""
+    names = conn.scalars(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:t)"
+    ), {"t": PARENT})
+    return sorted(n for n in names if n != DEFAULT_PARTITION)
+
+
+def create_partition(conn: Connection, month: datetime) -> int:
+    """
+    在当前事务中建好一个月的分区，返回从默认分区迁入的读数条数
+    先建普通表并加上范围约束 (ATTACH 时免扫描)，迁入默认分区中的该月数据后再 ATTACH
+    """
+    name = partition_name(month)
+    lo, hi = f"'{month:%Y-%m-%d}'", f"'{add_months(month, 1):%Y-%m-%d}'"
+    conn.execute(text(f"SET LOCAL lock_timeout = '{DDL_LOCK_TIMEOUT}'"))
+    conn.execute(text(f"CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS)"))
+    conn.execute(text(
+        f"ALTER TABLE {name} ADD CONSTRAINT {name}_range CHECK (record_time >= {lo} AND record_time < {hi})"
+    ))
+    moved = conn.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE record_time >= {lo} AND record_time < {hi} "
+        f"RETURNING *) INSERT INTO {name} SELECT * FROM moved"
+    )).rowcount
+    conn.execute(text(f"ALTER TABLE {PARENT} ATTACH PARTITION {name} FOR VALUES FROM ({lo}) TO ({hi})"))
+    conn.execute(text(f"ALTER TABLE {name} DROP CONSTRAINT {name}_range"))
+    return moved
+
+
+def ensure_partitions(engine: Engine, start: datetime, end: datetime) -> List[str]:
+    """建好 [start, end] 覆盖的各月分区 (每个分区一个事务)，返回新建的分区名"""
+    with engine.connect() as conn:
+        existing = set(attached_partitions(conn))
+    created = []
+    month = month_start(start)
+    while month <= end:
+        name = partition_name(month)
+        if name not in existing:
+            try:
+                with engine.begin() as conn:
+                    moved = create_partition(conn, month)
+            except OperationalError:
+                # 锁等待超时等：读数仍写入默认分区，下一轮再建
+                logger.warning("could not create partition %s, will retry", name, exc_info=True)
+            else:
+                logger.info("created partition %s (%d readings moved from default)", name, moved)
+                created.append(name)
+        month = add_months(month, 1)
+    return created
+
+
+# --- 数据保留 ---
+
+
+def _compact(engine: Engine, name: str, month: datetime):
+    """
+    从原始读数重算该月的小时/天汇总；SHARE 锁只阻塞该月的迟到写入，保证汇总不漏数据。
+    锁只等待 lock_timeout，超时抛 OperationalError
+    """
+    with engine.begin() as conn:
+        conn.execute(text(f"SET LOCAL lock_timeout = '{DDL_LOCK_TIMEOUT}'"))
+        conn.execute(text(f"LOCK TABLE {name} IN SHARE MODE"))
+        # 分区按月初对齐，小时桶与天桶都完整落在分区内。写入时已累加进汇总表，重算只补上漏记的桶：
+        # 该月的读数可能已部分删除 (默认分区清理、删除后因迟到数据重建的分区)，不覆盖样本数更多的已有汇总
+        for stmt in crud._rebuild_rollups_stmts(month, add_months(month, 1), merge=True):
+            conn.execute(stmt)
+        stmt = insert(models.SensorLogRetention).values(
+            partition=name, range_start=month, range_end=add_months(month, 1),
+            row_count=conn.scalar(text(f"SELECT count(*) FROM {name}")), compacted_at=datetime.now(),
+        )
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=["partition"],
+            set_={"row_count": stmt.excluded.row_count, "compacted_at": stmt.excluded.compacted_at, "dropped_at": None},
+        ))
+
+
+def _detach(engine: Engine, name: str):
+    with engine.begin() as conn:
+        conn.execute(text(f"SET LOCAL lock_timeout = '{DDL_LOCK_TIMEOUT}'"))
+        conn.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {name}"))
+
+
+def _drop(engine: Engine, name: str):
+    r = models.SensorLogRetention
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+        conn.execute(update(r).where(r.partition == name).values(dropped_at=datetime.now()))
+
+
+def purge_default(engine: Engine, cutoff: datetime, batch: int = PURGE_BATCH_ROWS) -> int:
+    """分批删除默认分区中早于 cutoff 的读数 (写入时已累加进汇总表)"""
+    total = 0
+    while True:
+        with engine.begin() as conn:
+            deleted = conn.execute(text(
+                f"DELETE FROM {DEFAULT_PARTITION} WHERE ctid = ANY(ARRAY("
+                f"SELECT ctid FROM {DEFAULT_PARTITION} WHERE record_time < :cutoff LIMIT :batch))"
+            ), {"cutoff": cutoff, "batch": batch}).rowcount
+        total += deleted
+        if deleted < batch:
+            return total
+
+
+def run_retention(
+    engine: Engine, retention_months: int = SENSOR_RETENTION_MONTHS, now: Optional[datetime] = None
+) -> List[str]:
+    """压缩并删除过期的月度分区，返回本次删除的分区名"""
+    if retention_months <= 0:
+        return []
+    cutoff = add_months(month_start(now or datetime.now()), -retention_months)
+    r = models.SensorLogRetention
+    with engine.connect() as conn:
+        attached = attached_partitions(conn)
+        # 上次中断在分离之后、删除之前的分区
+        detached = set(conn.scalars(select(r.partition).where(r.compacted_at.isnot(None), r.dropped_at.is_(None))))
+    expired = sorted(n for n in set(attached) | detached if add_months(partition_month(n), 1) <= cutoff)
+
+    dropped = []
+    for name in expired:
+        with engine.connect() as conn:
+            state = conn.execute(select(r.compacted_at, r.dropped_at).where(r.partition == name)).first()
+        # 同名分区删除后可能因迟到数据被重新创建，需要重新压缩
+        if state is None or state.compacted_at is None or state.dropped_at is not None:
+            try:
+                _compact(engine, name, partition_month(name))
+            except OperationalError:
+                # 锁等待超时：跳过该分区，下一轮再压缩
+                logger.warning("could not compact partition %s, will retry", name, exc_info=True)
+                continue
+            logger.info("compacted partition %s into rollups", name)
+        if name in attached:
+            try:
+                _detach(engine, name)
+            except OperationalError:
+                logger.warning("could not detach partition %s, will retry", name, exc_info=True)
+                break
+        _drop(engine, name)
+        logger.info("dropped partition %s", name)
+        dropped.append(name)
+
+    purged = purge_default(engine, cutoff)
+    if purged:
+        logger.info("purged %d expired readings from %s", purged, DEFAULT_PARTITION)
+    return dropped
+
+
+def run_maintenance(
+    engine: Engine, retention_months: int = SENSOR_RETENTION_MONTHS, now: Optional[datetime] = None
+) -> Optional[List[str]]:
+    """建未来分区 + 数据保留，返回删除的分区名；其他进程正在执行时直接返回 None"""
+    now = now or datetime.now()
+    with engine.connect() as lock_conn:
+        if not lock_conn.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": MAINTENANCE_LOCK_KEY}):
+            return None
+        try:
+            ensure_partitions(engine, now, add_months(month_start(now), PARTITION_PREMAKE_MONTHS))
+            return run_retention(engine, retention_months, now)
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MAINTENANCE_LOCK_KEY})
+            lock_conn.commit()
@@ -0,0 +1,131 @@
+"""进程内发布/订阅：新读数与预警等级变化推送给 WebSocket / SSE 订阅者"""
+import asyncio
+import json
+import threading
+from itertools import chain
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+
+from . import analysis, schemas
+
+# 每个订阅者最多积压的消息数，超出后丢弃最旧的消息，慢客户端不会拖住整个 hub
+SUBSCRIBER_QUEUE_SIZE = 256
+
+
+class Subscription:
+    def __init__(self, zone_ids: Optional[Set[int]], maxsize: int):
+        self.zone_ids = zone_ids  # None 表示订阅全部站点
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def accepts(self, zone_id: int) -> bool:
+        return self.zone_ids is None or zone_id in self.zone_ids
+
+    def offer(self, message: str):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+
+class RealtimeHub:
+    """
+    publish_logs 可以在任意线程调用 (同步接口跑在线程池中)，
+    每批读数先合并为每个站点最新的一条读数与等级变化，只序列化一次，再投递到事件循环里分发；
+    订阅按站点建索引，分发只访问订阅了该站点的订阅者与订阅全部站点的订阅者
+    """
+
+    def __init__(self, queue_size: int = SUBSCRIBER_QUEUE_SIZE, rules: Optional[schemas.WarningRuleSet] = None):
+        self.queue_size = queue_size
+        self.rules = rules or schemas.WarningRuleSet()
+        self._subscriptions: Set[Subscription] = set()
+        self._all_zones: Set[Subscription] = set()  # 订阅全部站点
+        self._by_zone: Dict[int, Set[Subscription]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        # zone_id -> (最新读数时间, 预警等级)，用于判断等级是否变化
+        self._levels: Dict[int, tuple] = {}
+
+    def subscribe(self, zone_ids: Optional[Set[int]] = None) -> Subscription:
+        self._loop = asyncio.get_running_loop()
+        sub = Subscription(zone_ids, self.queue_size)
+        self._subscriptions.add(sub)
+        if zone_ids is None:
+            self._all_zones.add(sub)
+        else:
+            for zone_id in zone_ids:
+                self._by_zone.setdefault(zone_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        self._subscriptions.discard(sub)
+        self._all_zones.discard(sub)
+        for zone_id in sub.zone_ids or ():
+            subs = self._by_zone.get(zone_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._by_zone[zone_id]
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscriptions)
+
+    def publish_logs(self, rows: List[dict]):
+        warnings = self._warning_changes(rows)
+        if not self._subscriptions or self._loop is None:
+            return
+        latest: Dict[int, dict] = {}
+        for row in rows:
+            current = latest.get(row["zone_id"])
+            if current is None or row["record_time"] >= current["record_time"]:
+                latest[row["zone_id"]] = row
+        # zone_id -> 该站点本批的消息 (最新的等级变化在前，最新读数在后)
+        messages: Dict[int, List[str]] = {zone_id: [message] for zone_id, message in warnings.items()}
+        for zone_id, row in latest.items():
+            messages.setdefault(zone_id, []).append(_reading_message(row))
+        self._loop.call_soon_threadsafe(self._dispatch, messages)
+
+    def _warning_changes(self, rows: List[dict]) -> Dict[int, str]:
+        """整批向量化计算等级，站点最新读数的等级相对本批之前变化时才产生 warning 消息"""
+        temperature = np.fromiter((r["temperature"] for r in rows), dtype=np.float64, count=len(rows))
+        chlorophyll = np.fromiter((r["chlorophyll"] for r in rows), dtype=np.float64, count=len(rows))
+        levels = analysis.evaluate_levels(temperature, chlorophyll, self.rules).tolist()
+
+        messages = {}
+        with self._lock:
+            before = {}  # zone_id -> 本批之前的 (读数时间, 等级)
+            for row, level in zip(rows, levels):
+                zone_id, record_time = row["zone_id"], row["record_time"]
+                previous = self._levels.get(zone_id)
+                if previous is not None and previous[0] > record_time:
+                    continue  # 乱序到达的旧数据不影响当前等级
+                before.setdefault(zone_id, previous)
+                self._levels[zone_id] = (record_time, level)
+            # 只按整批的净变化产生消息
+            for zone_id, previous in before.items():
+                record_time, level = self._levels[zone_id]
+                if previous is None or previous[1] != level:
+                    messages[zone_id] = json.dumps({
+                        "type": "warning",
+                        "zone_id": zone_id,
+                        "level": analysis.LEVEL_NAMES[level],
+                        "previous_level": analysis.LEVEL_NAMES[previous[1]] if previous else None,
+                        "record_time": record_time.isoformat(),
+                    }, ensure_ascii=False)
+        return messages
+
+    def _dispatch(self, messages: Dict[int, List[str]]):
+        for zone_id, zone_messages in messages.items():
+            for sub in chain(self._all_zones, self._by_zone.get(zone_id, ())):
+                for message in zone_messages:
+                    sub.offer(message)
+
+
+def _reading_message(row: dict) -> str:
+    data = dict(row, record_time=row["record_time"].isoformat())
+    return json.dumps({"type": "reading", "zone_id": row["zone_id"], "data": data})
+
+
+hub = RealtimeHub()
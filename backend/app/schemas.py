@@ -1,7 +1,7 @@
 from pydantic import BaseModel
 from typing import Dict, Any, Optional
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Dict, Any, List, Optional
 from datetime import datetime
 
@@ -39,8 +39,9 @@ class MarineZoneResponse(BaseModel):
     id: int
     name: str
     zone_type: str
-    # 简化处理：实际项目中可能需要将 WKT 转为 lat/lon 对象
-    # 这里假设前端能处理或后端暂不返回二进制 geometry
+    # 由数据库从 geom 解码 (ST_Y / ST_X)，不返回二进制 geometry
+    lat: Optional[float] = None
+    lon: Optional[float] = None
 
     class Config:
         from_attributes = True
@@ -70,6 +71,36 @@ class SensorLogResponse(SensorLogBase):
         from_attributes = True
 
 
+class MetricStats(BaseModel):
+    min: Optional[float] = None
+    max: Optional[float] = None
+    mean: Optional[float] = None
+
+
+class SensorRollupResponse(BaseModel):
+    """小时 / 天粒度的预聚合数据，bucket 为时间桶起点"""
+    zone_id: int
+    bucket: datetime
+    sample_count: int
+    temperature: MetricStats
+    salinity: MetricStats
+    current_speed: MetricStats
+    chlorophyll: MetricStats
+    dissolved_oxygen: MetricStats
+    jellyfish_density: MetricStats
+
+
+class BulkRowError(BaseModel):
+    index: int  # 请求中的行号 (从 0 开始)
+    detail: str
+
+
+class BulkUploadResult(BaseModel):
+    accepted: int
+    rejected: int
+    errors: List[BulkRowError] = []
+
+
 # --- 知识图谱模型 ---
 
 
@@ -99,9 +130,131 @@ class GraphData(BaseModel):
     links: List[KGEdgeResponse]
 
 
+class KGPathResponse(GraphData):
+    probability: float  # 路径上各边 weight / prob 的乘积
+
+
+class KGImportEdge(BaseModel):
+    source: str  # 节点名称
+    target: str
+    relation: str
+    properties: Dict[str, Any] = {}
+
+
+class KGImportRequest(BaseModel):
+    """完整图谱；当前图谱中不在其中的节点与边会被删除"""
+    nodes: List[NodeBase]
+    edges: List[KGImportEdge] = []
+    source: Optional[str] = None  # 来源说明，记录在 kg_versions 中
+
+
+class KGImportResult(BaseModel):
+    version: int
+    changed: bool  # 内容没有变化时不生成新版本，version 为当前版本
+    nodes_added: int
+    nodes_updated: int
+    nodes_deleted: int
+    edges_added: int
+    edges_updated: int
+    edges_deleted: int
+
+
+class KGChanges(BaseModel):
+    version: int  # 下一次同步的 since
+    since: int
+    nodes: List[KGNodeResponse]  # since 之后新增或修改的节点
+    links: List[KGEdgeResponse]
+    deleted_nodes: List[int]
+    deleted_links: List[int]
+
+
 # --- 预警模型 ---
+class WarningRuleSet(BaseModel):
+    """预警规则阈值：同时超过 red_* 为 RED，同时超过 orange_* 为 ORANGE，否则 GREEN"""
+    red_temperature: float = 25.0
+    red_chlorophyll: float = 1.5
+    orange_temperature: float = 23.0
+    orange_chlorophyll: float = 1.0
+    # 24 小时水温斜率 (℃/小时) 超过该值时至少为 ORANGE，默认不启用
+    orange_temperature_slope: Optional[float] = None
+
+
+class ZoneFeatureVector(BaseModel):
+    """站点最近 24 小时窗口的滚动特征，窗口内样本不足时趋势类特征为 null"""
+    zone_id: int
+    record_time: datetime
+    sample_count: int
+    temperature_avg_24h: float
+    chlorophyll_avg_24h: float
+    density_avg_24h: float
+    temperature_slope: Optional[float] = None
+    chlorophyll_rate: Optional[float] = None
+    density_growth_ratio: Optional[float] = None
+
+
+class ForecastPoint(BaseModel):
+    time: datetime
+    density: float
+
+
+class DensityForecastResponse(BaseModel):
+    zone_id: int
+    issued_at: datetime
+    base_time: datetime
+    points: List[ForecastPoint]
+
+
+class AnomalyEventResponse(BaseModel):
+    id: int
+    zone_id: int
+    log_id: int
+    record_time: datetime
+    metric: str
+    value: float
+    expected: float
+    zscore: float
+    detected_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class BacktestRequest(BaseModel):
+    """回测配置：对 temperature_thresholds × chlorophyll_thresholds 的每种组合 (水温与叶绿素同时超过即预警) 打分"""
+    zone_ids: Optional[List[int]] = None  # 为空时回测所有有数据的站点
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    outbreak_density: float = 5.0  # 密度达到该值视为爆发
+    horizon_hours: int = Field(24, ge=1, le=24 * 14)  # 预警后多久内出现爆发算命中
+    # 每个列表最多 20 个阈值，规则网格最多 400 组
+    temperature_thresholds: List[float] = Field(default_factory=lambda: [23.0, 25.0], min_length=1, max_length=20)
+    chlorophyll_thresholds: List[float] = Field(default_factory=lambda: [1.0, 1.5], min_length=1, max_length=20)
+    workers: int = Field(1, ge=1, le=8)  # >1 时站点分块到共享进程池，同时最多占用这么多个进程
+
+
+class BacktestRuleScore(BaseModel):
+    temperature: float
+    chlorophyll: float
+    true_positives: int
+    false_positives: int
+    false_negatives: int
+    precision: Optional[float] = None
+    recall: Optional[float] = None
+    detected_outbreaks: int
+    mean_lead_hours: Optional[float] = None
+
+
+class BacktestResult(BaseModel):
+    zones: int
+    readings: int
+    positives: int
+    outbreaks: int
+    results: List[BacktestRuleScore]
+
+
 class WarningResult(BaseModel):
     level: str  # RED, ORANGE, GREEN
+    zone_id: int
     zone_name: str
     message: str
     timestamp: datetime
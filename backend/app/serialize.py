@@ -0,0 +1,68 @@
+"""
+大结果集的快速序列化：查询直接返回列元组，不构造 ORM / Pydantic 对象，用 orjson (可选依赖) 编码
+layout=columns 时按列输出 {"record_time": [...], "temperature": [...]}，图表客户端可直接使用且体积更小
+"""
+import json
+from typing import Iterable, List, Sequence
+
+from fastapi import Response
+
+from .crud import LOG_ROW_FIELDS, ZONE_ROW_FIELDS
+
+try:
+    import orjson
+except ImportError:  # 未安装时退回标准库 json
+    orjson = None
+
+# 按列输出时站点信息展开成独立的列 (站点 id 与 zone_id 重复，省略)
+ZONE_COLUMN_NAMES = ("zone_name", "zone_type", "lat", "lon")
+
+
+def _default(value):
+    # datetime
+    return value.isoformat()
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def log_records(rows: Iterable[Sequence]) -> List[dict]:
+    """(读数列..., 站点列...) 元组 -> 与 SensorLogResponse 结构相同的 dict"""
+    n = len(LOG_ROW_FIELDS)
+    return [dict(zip(LOG_ROW_FIELDS, row[:n]), zone=dict(zip(ZONE_ROW_FIELDS, row[n:]))) for row in rows]
+
+
+def log_columns(rows: Sequence[Sequence]) -> dict:
+    n = len(LOG_ROW_FIELDS)
+    columns = list(zip(*rows)) or [()] * (n + len(ZONE_ROW_FIELDS))
+    result = {name: list(col) for name, col in zip(LOG_ROW_FIELDS, columns[:n])}
+    result.update({name: list(col) for name, col in zip(ZONE_COLUMN_NAMES, columns[n + 1:])})
+    return result
+
+
+def rollup_columns(records: List[dict]) -> dict:
+    """汇总数据按列输出，每个指标展开为 <metric>_min / _max / _mean"""
+    result = {"zone_id": [], "bucket": [], "sample_count": []}
+    for record in records:
+        for key, value in record.items():
+            if isinstance(value, dict):
+                for stat, v in value.items():
+                    result.setdefault(f"{key}_{stat}", []).append(v)
+            else:
+                result[key].append(value)
+    return result
+
+
+def log_response(rows, layout: str, headers=None) -> FastJSONResponse:
+    content = log_columns(rows) if layout == "columns" else log_records(rows)
+    return FastJSONResponse(content, headers=headers)
@@ -0,0 +1,257 @@
+"""
+跨 worker 共享的最新读数快照：固定布局的数组放在 multiprocessing.shared_memory 中，按 zone_id 排序，
+保存每个站点的最新读数、站点信息与当前预警等级。
+
+各 worker 通过文件锁选出唯一的更新者，定时从 zone_latest 读取全量最新数据写入共享内存；
+写入使用顺序锁 (seqlock)：写前写后各把 seq 加一，读者拷贝数据前后 seq 相同且为偶数即为一致的快照，读不加锁。
+快照超过 SNAPSHOT_MAX_AGE 秒未更新 (如更新者退出) 时读者回落到数据库。
+"""
+import fcntl
+import logging
+import os
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from . import analysis, crud, models, schemas
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+SHARED_SNAPSHOT_ENABLED = os.getenv("SHARED_SNAPSHOT", "0") == "1"
+SNAPSHOT_SHM_NAME = os.getenv("SNAPSHOT_SHM_NAME", "jellyfish_latest")
+SNAPSHOT_LOCK_PATH = os.getenv("SNAPSHOT_LOCK_PATH", "/tmp/jellyfish_latest.lock")
+SNAPSHOT_MAX_ZONES = int(os.getenv("SNAPSHOT_MAX_ZONES", "65536"))
+SNAPSHOT_REFRESH_SECONDS = float(os.getenv("SNAPSHOT_REFRESH_SECONDS", "1.0"))
+SNAPSHOT_MAX_AGE = float(os.getenv("SNAPSHOT_MAX_AGE", "10.0"))
+# 固定长度的 UTF-8 字段，超长截断
+NAME_BYTES = 96
+TYPE_BYTES = 16
+
+_METRICS = models.SENSOR_METRICS
+
+
+def _layout(capacity: int):
+    """(字段名, dtype, shape) 列表；每个数组按 8 字节对齐依次排列，header 为 [seq, count, updated_at]"""
+    return [
+        ("header", np.int64, (3,)),
+        ("zone_id", np.int64, (capacity,)),
+        ("log_id", np.int64, (capacity,)),
+        ("record_time", "datetime64[us]", (capacity,)),
+        ("metrics", np.float64, (capacity, len(_METRICS))),
+        ("lat", np.float64, (capacity,)),
+        ("lon", np.float64, (capacity,)),
+        ("level", np.int8, (capacity,)),
+        ("name", f"S{NAME_BYTES}", (capacity,)),
+        ("zone_type", f"S{TYPE_BYTES}", (capacity,)),
+    ]
+
+
+def _size(capacity: int) -> int:
+    total = 0
+    for _name, dtype, shape in _layout(capacity):
+        nbytes = np.dtype(dtype).itemsize * int(np.prod(shape))
+        total += (nbytes + 7) // 8 * 8
+    return total
+
+
+class SharedSnapshot:
+    def __init__(self, shm: shared_memory.SharedMemory, capacity: int):
+        self.shm = shm
+        self.capacity = capacity
+        self.arrays = {}
+        offset = 0
+        for name, dtype, shape in _layout(capacity):
+            arr = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+            self.arrays[name] = arr
+            offset += (arr.nbytes + 7) // 8 * 8
+        header = self.arrays["header"]
+        self._seq = header[0:1]
+        self._count = header[1:2]
+        self._updated_at = header[2:3].view(np.float64)
+
+    @classmethod
+    def create(cls, name: str = SNAPSHOT_SHM_NAME, capacity: int = SNAPSHOT_MAX_ZONES) -> "SharedSnapshot":
+        try:
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()  # 上一次运行遗留的段
+        except FileNotFoundError:
+            pass
+        shm = shared_memory.SharedMemory(name=name, create=True, size=_size(capacity))
+        snapshot = cls(shm, capacity)
+        snapshot.arrays["header"][:] = 0
+        return snapshot
+
+    @classmethod
+    def attach(cls, name: str = SNAPSHOT_SHM_NAME, capacity: int = SNAPSHOT_MAX_ZONES) -> Optional["SharedSnapshot"]:
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            return None
+        # 读者不拥有该段，避免 resource_tracker 在本进程退出时把它删除
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, capacity)
+
+    # --- 写 (只有更新者调用) ---
+
+    def write(self, rows: List[tuple], levels: np.ndarray):
+        """rows 为 crud.get_latest_rows 的列元组 (已按 zone_id 排序)"""
+        n = min(len(rows), self.capacity)
+        if len(rows) > self.capacity:
+            logger.warning("shared snapshot holds %d of %d zones", self.capacity, len(rows))
+        a = self.arrays
+        k = len(crud.LOG_ROW_FIELDS)
+        self._seq[0] += 1  # 奇数：写入中
+        if n:
+            log_id, zone_id, record_time, *metrics = zip(*(r[:k] for r in rows[:n]))
+            _zid, name, zone_type, lat, lon = zip(*(r[k:] for r in rows[:n]))
+            a["zone_id"][:n] = zone_id
+            a["log_id"][:n] = log_id
+            a["record_time"][:n] = np.asarray(record_time, dtype="datetime64[us]")
+            a["metrics"][:n] = np.column_stack([np.asarray(m, dtype=np.float64) for m in metrics])
+            a["lat"][:n] = np.asarray(lat, dtype=np.float64)
+            a["lon"][:n] = np.asarray(lon, dtype=np.float64)
+            a["level"][:n] = levels[:n]
+            a["name"][:n] = [(s or "").encode("utf-8")[:NAME_BYTES] for s in name]
+            a["zone_type"][:n] = [(s or "").encode("utf-8")[:TYPE_BYTES] for s in zone_type]
+        self._count[0] = n
+        self._updated_at[0] = time.time()
+        self._seq[0] += 1  # 偶数：写入完成
+
+    # --- 读 (任意 worker，不加锁) ---
+
+    def read(self, retries: int = 100) -> Optional[dict]:
+        """返回一致的数组拷贝；快照过期或持续读到写入中的状态时返回 None"""
+        a = self.arrays
+        for _ in range(retries):
+            seq = int(self._seq[0])
+            if seq % 2:
+                continue
+            n = int(self._count[0])
+            data = {key: a[key][:n].copy() for key in
+                    ("zone_id", "log_id", "record_time", "metrics", "lat", "lon", "level", "name", "zone_type")}
+            updated_at = float(self._updated_at[0])
+            if int(self._seq[0]) == seq:
+                if seq == 0 or time.time() - updated_at > SNAPSHOT_MAX_AGE:
+                    return None
+                return data
+        return None
+
+    def close(self):
+        self.arrays.clear()
+        self.shm.close()
+
+
+def _decode(values: np.ndarray) -> List[str]:
+    return [v.decode("utf-8", errors="ignore") for v in values.tolist()]
+
+
+def latest_rows(data: dict) -> List[tuple]:
+    """快照 -> 与 crud.get_latest_rows 相同的列元组"""
+    zone_ids = data["zone_id"].tolist()
+    return [
+        (log_id, zone_id, record_time, *metrics, zone_id, name, zone_type, lat, lon)
+        for log_id, zone_id, record_time, metrics, name, zone_type, lat, lon in zip(
+            data["log_id"].tolist(), zone_ids, data["record_time"].astype(object).tolist(),
+            data["metrics"].tolist(), _decode(data["name"]), _decode(data["zone_type"]),
+            data["lat"].tolist(), data["lon"].tolist(),
+        )
+    ]
+
+
+def predict_inputs(data: dict) -> Tuple[list, list, np.ndarray, np.ndarray, np.ndarray]:
+    """快照 -> analysis 需要的 (zone_id, 名称, 水温, 叶绿素, 等级)"""
+    metrics = data["metrics"]
+    return (
+        data["zone_id"].tolist(), _decode(data["name"]),
+        metrics[:, _METRICS.index("temperature")], metrics[:, _METRICS.index("chlorophyll")],
+        data["level"].astype(np.int8),
+    )
+
+
+class SnapshotService:
+    """每个 worker 一个：尝试成为更新者；不论是否为更新者都可读取"""
+
+    def __init__(self):
+        self._snapshot: Optional[SharedSnapshot] = None
+        self._lock_file = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._state_lock = threading.Lock()
+        self.is_updater = False
+
+    def start(self):
+        self._lock_file = open(SNAPSHOT_LOCK_PATH, "a")
+        self._try_become_updater()
+
+    def _try_become_updater(self) -> bool:
+        with self._state_lock:
+            if self.is_updater:
+                return True
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False  # 其他 worker 已是更新者
+            if self._snapshot is not None:
+                self._snapshot.close()
+            self.is_updater = True
+            self._snapshot = SharedSnapshot.create()
+            self._thread = threading.Thread(target=self._run, name="shared-snapshot", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(SNAPSHOT_REFRESH_SECONDS * 5)
+        if self._snapshot is not None:
+            shm = self._snapshot.shm
+            self._snapshot.close()
+            if self.is_updater:
+                shm.unlink()
+            self._snapshot = None
+        if self._lock_file is not None:
+            self._lock_file.close()  # 释放文件锁
+            self._lock_file = None
+
+    def refresh(self, db):
+        rows = crud.get_latest_rows(db)
+        k = len(crud.LOG_ROW_FIELDS)
+        temperature = np.array([r[k - len(_METRICS) + _METRICS.index("temperature")] for r in rows], dtype=np.float64)
+        chlorophyll = np.array([r[k - len(_METRICS) + _METRICS.index("chlorophyll")] for r in rows], dtype=np.float64)
+        levels = analysis.evaluate_levels(temperature, chlorophyll, schemas.WarningRuleSet())
+        self._snapshot.write(rows, levels)
+
+    def _run(self):
+        while not self._stop.is_set():
+            db = SessionLocal()
+            try:
+                self.refresh(db)
+            except Exception:
+                logger.exception("shared snapshot refresh failed")
+            finally:
+                db.close()
+            self._stop.wait(SNAPSHOT_REFRESH_SECONDS)
+
+    def read(self) -> Optional[dict]:
+        if self._snapshot is None:
+            self._snapshot = SharedSnapshot.attach()  # 更新者可能晚于本 worker 启动
+            if self._snapshot is None:
+                return None
+        data = self._snapshot.read()
+        if data is None and not self.is_updater:
+            # 快照过期：原更新者可能已退出 (文件锁随之释放)，尝试接替；否则下次重新挂载新的段
+            with self._state_lock:
+                if self._snapshot is not None and not self.is_updater:
+                    self._snapshot.close()
+                    self._snapshot = None
+            if self._lock_file is not None:
+                self._try_become_updater()
+        return data
+
+
+snapshot_service = SnapshotService()
@@ -0,0 +1,61 @@
+"""站点空间过滤：矩形范围、半径范围与最近 N 个站点，均可命中 marine_zones.geom 上的 GiST 索引"""
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from geoalchemy2 import Geography
+from sqlalchemy import cast, func
+
+from . import models
+
+
+def point(lon: float, lat: float):
+    return func.ST_SetSRID(func.ST_MakePoint(lon, lat), 4326)
+
+
+def geography(geom):
+    # 与 models.MarineZone 上的表达式索引保持同一写法，才能走索引
+    return cast(geom, Geography(srid=4326))
+
+
+@dataclass
+class SpatialFilter:
+    bbox: Optional[Tuple[float, float, float, float]] = None  # minLon, minLat, maxLon, maxLat
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+    radius_km: Optional[float] = None
+    nearest: Optional[int] = None
+
+    @classmethod
+    def parse(cls, bbox: Optional[str] = None, lat: Optional[float] = None, lon: Optional[float] = None,
+              radius_km: Optional[float] = None, nearest: Optional[int] = None) -> Optional["SpatialFilter"]:
+        """解析查询参数，没有任何空间条件时返回 None；参数不合法抛 ValueError"""
+        box = None
+        if bbox is not None:
+            try:
+                box = tuple(float(v) for v in bbox.split(","))
+            except ValueError:
+                raise ValueError("bbox must be minLon,minLat,maxLon,maxLat")
+            if len(box) != 4 or box[0] > box[2] or box[1] > box[3]:
+                raise ValueError("bbox must be minLon,minLat,maxLon,maxLat")
+        if (radius_km is not None or nearest is not None) and (lat is None or lon is None):
+            raise ValueError("radius_km / nearest require lat and lon")
+        if box is None and radius_km is None and nearest is None:
+            return None
+        return cls(bbox=box, lat=lat, lon=lon, radius_km=radius_km, nearest=nearest)
+
+    def apply(self, stmt):
+        """给已 JOIN marine_zones 的查询追加空间条件；nearest 时按距离排序并截断"""
+        geom = models.MarineZone.geom
+        if self.bbox is not None:
+            # && 只比较外包框，由 GiST 索引直接过滤
+            stmt = stmt.where(geom.intersects(func.ST_MakeEnvelope(*self.bbox, 4326)))
+        if self.radius_km is not None:
+            stmt = stmt.where(
+                func.ST_DWithin(geography(geom), geography(point(self.lon, self.lat)), self.radius_km * 1000)
+            )
+        if self.nearest is not None:
+            # <-> 为 KNN 距离运算符，ORDER BY ... LIMIT 由 GiST 索引按距离顺序扫描
+            stmt = stmt.order_by(None).order_by(
+                geom.distance_centroid(point(self.lon, self.lat))
+            ).limit(self.nearest)
+        return stmt
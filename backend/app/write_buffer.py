@@ -0,0 +1,344 @@
+"""
+写后缓冲 (write-behind) 入库模式：上传的数据先追加到本地日志文件并 fsync，随即确认
+(组提交：并发的上传各自在锁内追加，锁外由其中一个线程做一次 fsync，覆盖此前追加的所有记录)；
+后台线程按条数或时间间隔把缓冲区整批写入数据库。
+每批写入与 ingest_checkpoints 中的已提交序号在同一事务中提交，启动时重放日志里序号更大的记录。
+
+每个 worker 通过 flock 独占一个槽位：日志 INGEST_JOURNAL_DIR/ingest-<槽位>.journal、检查点 write_buffer:<槽位>，
+多个 worker 互不覆盖对方的日志与序号。启动时顺带接管锁已释放 (worker 已退出) 的其他槽位，把其中未入库的记录写完。
+"""
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from . import crud, models, schemas
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+INGEST_BUFFER_ENABLED = os.getenv("INGEST_BUFFER", "0") == "1"
+INGEST_JOURNAL_DIR = os.getenv("INGEST_JOURNAL_DIR", "ingest-journal")
+# 缓冲区上限，超出后拒绝新数据 (接口返回 429)
+INGEST_BUFFER_MAX_ROWS = int(os.getenv("INGEST_BUFFER_MAX_ROWS", "50000"))
+INGEST_FLUSH_ROWS = int(os.getenv("INGEST_FLUSH_ROWS", "1000"))
+INGEST_FLUSH_SECONDS = float(os.getenv("INGEST_FLUSH_SECONDS", "0.5"))
+# 持续有数据时缓冲区不会清空，日志超过该大小后只保留未入库部分重写
+JOURNAL_COMPACT_BYTES = 64 * 1024 * 1024
+# 写库失败后的重试间隔
+RETRY_SECONDS = 2.0
+
+CHECKPOINT_PREFIX = "write_buffer"
+# 按槽位拆分之前的单一日志 (检查点名 write_buffer)，启动时作为无主日志写完
+LEGACY_JOURNAL_PATH = "ingest.journal"
+
+
+class BufferFull(Exception):
+    pass
+
+
+def _encode(seq: int, row: dict) -> bytes:
+    data = dict(row, seq=seq, record_time=row["record_time"].isoformat())
+    return (json.dumps(data, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def _decode(line: bytes):
+    data = json.loads(line)
+    seq = data.pop("seq")
+    data["record_time"] = datetime.fromisoformat(data["record_time"])
+    return seq, data
+
+
+def _read_journal(path: str) -> List[tuple]:
+    entries = []
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    entries.append(_decode(line))
+                except (ValueError, KeyError):
+                    break  # 崩溃时写了一半的最后一行
+    return entries
+
+
+def _try_lock(lock_path: str):
+    """非阻塞地独占锁文件，成功返回打开的文件 (关闭即释放)，否则返回 None
+
+    锁加在单独的文件上：日志压缩时 os.replace 会换掉日志文件本身
+    """
+    f = open(lock_path, "a")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        return None
+    return f
+
+
+class WriteBuffer:
+    def __init__(self, journal_dir: str = INGEST_JOURNAL_DIR, max_rows: int = INGEST_BUFFER_MAX_ROWS,
+                 flush_rows: int = INGEST_FLUSH_ROWS, flush_seconds: float = INGEST_FLUSH_SECONDS,
+                 session_factory=SessionLocal):
+        self.journal_dir = journal_dir
+        self.journal_path: Optional[str] = None  # start 时按认领的槽位确定
+        self.checkpoint_name: Optional[str] = None
+        self.max_rows = max_rows
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.session_factory = session_factory
+
+        self._cond = threading.Condition()
+        self._pending: List[tuple] = []  # (seq, row)，按 seq 递增
+        self._in_flight = 0  # 已被取出、正在写库的条数 (仍计入缓冲上限)
+        self._next_seq = 1
+        self._written_seq = 0  # 已追加到日志的最大序号
+        self._synced_seq = 0  # 已 fsync 的最大序号
+        self._sync_lock = threading.Lock()  # 同一时刻只有一个线程在 fsync
+        self._journal = None
+        self._slot_lock = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+        # 指标
+        self.rejected_total = 0
+        self.flushed_total = 0
+        self.flush_failures = 0
+        self.last_flush_seconds = 0.0
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending) + self._in_flight
+
+    # --- 生命周期 ---
+
+    def start(self):
+        """认领槽位并重放其日志中未提交的记录，写完无主的日志，然后启动后台刷写线程"""
+        if self._thread is not None:
+            return  # 预热重试时已启动
+        os.makedirs(self.journal_dir, exist_ok=True)
+        if self._slot_lock is None:  # 上一次启动在写库时失败，沿用已认领的槽位
+            self._claim_slot()
+        checkpoint = self._load_checkpoint(self.checkpoint_name)
+        entries = _read_journal(self.journal_path)
+        replay = [(seq, row) for seq, row in entries if seq > checkpoint]
+        self._next_seq = max([checkpoint] + [seq for seq, _row in entries]) + 1
+        # 只保留未提交的记录重写日志，丢弃已入库的部分
+        self._rewrite_journal(replay)
+        self._pending = replay
+        self._written_seq = self._synced_seq = self._next_seq - 1
+        if replay:
+            logger.info("replaying %d buffered readings from %s", len(replay), self.journal_path)
+        self._drain_orphans()
+
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="ingest-write-buffer", daemon=True)
+        self._thread.start()
+
+    def _slot_paths(self, slot: int):
+        base = os.path.join(self.journal_dir, f"ingest-{slot}")
+        return base + ".journal", base + ".lock", f"{CHECKPOINT_PREFIX}:{slot}"
+
+    def _claim_slot(self):
+        slot = 0
+        while True:
+            journal_path, lock_path, name = self._slot_paths(slot)
+            lock = _try_lock(lock_path)
+            if lock is not None:
+                self._slot_lock = lock
+                self.journal_path, self.checkpoint_name = journal_path, name
+                return
+            slot += 1
+
+    def _drain_orphans(self):
+        """其他槽位的锁能拿到说明其 worker 已退出：把日志中未入库的记录直接写库后清空"""
+        orphans = []
+        for lock_path in sorted(glob.glob(os.path.join(self.journal_dir, "ingest-*.lock"))):
+            slot = int(os.path.basename(lock_path)[len("ingest-"):-len(".lock")])
+            if self._slot_paths(slot)[0] != self.journal_path:
+                orphans.append(self._slot_paths(slot))
+        if os.path.exists(LEGACY_JOURNAL_PATH):
+            orphans.append((LEGACY_JOURNAL_PATH, LEGACY_JOURNAL_PATH + ".lock", CHECKPOINT_PREFIX))
+        for journal_path, lock_path, name in orphans:
+            lock = _try_lock(lock_path)
+            if lock is None:
+                continue  # 仍在运行的 worker
+            try:
+                checkpoint = self._load_checkpoint(name)
+                entries = [(seq, row) for seq, row in _read_journal(journal_path) if seq > checkpoint]
+                for i in range(0, len(entries), self.flush_rows):
+                    self._flush(entries[i:i + self.flush_rows], name)
+                if entries:
+                    logger.info("recovered %d buffered readings from %s", len(entries), journal_path)
+                if os.path.exists(journal_path):
+                    open(journal_path, "wb").close()
+            finally:
+                lock.close()
+
+    def stop(self, timeout: float = 30.0):
+        """
+        停止接收并尽量把缓冲区写完；没写完的记录留在日志里，下次启动重放。
+        刷写线程在 timeout 内没有退出 (如正在写库) 时不释放槽位，由线程退出时释放，
+        避免其他 worker 在本线程仍在写库时接管同一份日志
+        """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is None:
+            self._release()
+            return
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.warning("write buffer flush still running after %ss, slot is released when it finishes", timeout)
+
+    def _release(self):
+        """关闭日志并释放槽位 (刷写线程退出时调用)"""
+        with self._cond:
+            self._thread = None
+            if self._journal is not None:
+                self._journal.flush()
+                os.fsync(self._journal.fileno())
+                self._journal.close()
+                self._journal = None
+            if self._slot_lock is not None:
+                self._slot_lock.close()  # 释放槽位
+                self._slot_lock = None
+
+    # --- 写入 ---
+
+    def submit(self, log: schemas.SensorLogCreate) -> int:
+        """追加到日志，等到 fsync 覆盖这条记录后返回序号；缓冲区满时抛 BufferFull"""
+        row = log.model_dump()
+        if row["record_time"] is None:
+            row["record_time"] = datetime.now()
+        with self._cond:
+            # 未启动 (预热尚未完成) 时同样返回 429，客户端稍后重试
+            if self._thread is None or self._stopping or self.depth >= self.max_rows:
+                self.rejected_total += 1
+                raise BufferFull()
+            seq = self._next_seq
+            self._next_seq += 1
+            self._journal.write(_encode(seq, row))
+            self._written_seq = seq
+            self._pending.append((seq, row))
+            if len(self._pending) >= self.flush_rows:
+                self._cond.notify()
+        self._sync(seq)
+        return seq
+
+    def _sync(self, seq: int):
+        """组提交：排在 fsync 后面的线程醒来时，如果前一次 fsync 已覆盖自己的记录就直接返回"""
+        with self._sync_lock:
+            if self._synced_seq >= seq:
+                return
+            with self._cond:
+                if self._journal is None:
+                    return  # 已停止，_release 关闭日志前做过 fsync
+                self._journal.flush()
+                target = self._written_seq
+                # 复制文件描述符：fsync 期间日志可能被压缩替换 (新文件写入时已 fsync)
+                fd = os.dup(self._journal.fileno())
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            self._synced_seq = target
+
+    # --- 后台刷写 ---
+
+    def _run(self):
+        try:
+            self._flush_loop()
+        finally:
+            self._release()
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                if len(self._pending) < self.flush_rows and not self._stopping:
+                    self._cond.wait(self.flush_seconds)
+                if not self._pending:
+                    if self._stopping:
+                        return
+                    continue
+                batch = self._pending[:self.flush_rows]
+                del self._pending[:len(batch)]
+                self._in_flight = len(batch)
+
+            try:
+                self._flush(batch, self.checkpoint_name)
+            except Exception:
+                self.flush_failures += 1
+                logger.exception("write buffer flush of %d rows failed, retrying", len(batch))
+                with self._cond:
+                    self._pending[:0] = batch  # 放回队首，保持序号顺序
+                    self._in_flight = 0
+                    if self._stopping:
+                        return  # 留在日志中，下次启动重放
+                time.sleep(RETRY_SECONDS)
+                continue
+
+            with self._cond:
+                self._in_flight = 0
+                # 缓冲区已全部入库或日志过大时压缩日志 (submit 持有同一把锁，不会并发追加)
+                if not self._pending or self._journal.tell() > JOURNAL_COMPACT_BYTES:
+                    self._rewrite_journal(self._pending)
+
+    def _flush(self, batch: List[tuple], checkpoint_name: str):
+        start = time.perf_counter()
+        last_seq = batch[-1][0]
+        rows = [row for _seq, row in batch]
+        db = self.session_factory()
+        try:
+            # 站点不存在的数据无法写入 (外键)，丢弃而不是阻塞整个缓冲区
+            existing = crud.get_existing_zone_ids(db, {r["zone_id"] for r in rows})
+            valid = [r for r in rows if r["zone_id"] in existing]
+            if len(valid) < len(rows):
+                logger.warning("dropping %d buffered readings for unknown zones", len(rows) - len(valid))
+            inserted = crud._insert_sensor_rows(db, valid)
+            stmt = insert(models.IngestCheckpoint).values(name=checkpoint_name, seq=last_seq)
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=[models.IngestCheckpoint.name], set_={"seq": stmt.excluded.seq}
+            ))
+            db.commit()
+        finally:
+            db.close()
+        self.flushed_total += len(batch)
+        self.last_flush_seconds = time.perf_counter() - start
+        crud._notify_ingest(inserted)
+
+    # --- 日志文件与检查点 ---
+
+    def _load_checkpoint(self, checkpoint_name: str) -> int:
+        db = self.session_factory()
+        try:
+            seq = db.scalar(
+                select(models.IngestCheckpoint.seq).where(models.IngestCheckpoint.name == checkpoint_name)
+            )
+            return seq or 0
+        finally:
+            db.close()
+
+    def _rewrite_journal(self, entries: List[tuple]):
+        """原子替换日志文件 (写临时文件 + fsync + rename)，再以追加模式打开"""
+        if self._journal is not None:
+            self._journal.close()
+        tmp_path = self.journal_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            for seq, row in entries:
+                f.write(_encode(seq, row))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.journal_path)
+        self._journal = open(self.journal_path, "ab")
+
+
+write_buffer = WriteBuffer()
@@ -0,0 +1,97 @@
+"""
+同步 (psycopg2 + 线程池) 与异步 (asyncpg + 事件循环) 数据访问层的并发吞吐对比
+
+用法:
+    python scripts/bench_db.py --requests 2000 --concurrency 64
+结果以 JSON 输出到 stdout
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from app import crud, crud_async
+from app.database import SessionLocal, get_async_engine, get_async_sessionmaker, engine
+
+# 每种压测场景：(同步实现, 异步实现)
+SCENARIOS = {
+    "realtime": (crud.get_latest_logs, crud_async.get_latest_logs),
+    "zones": (crud.get_zones, crud_async.get_zones),
+}
+
+
+def _summary(mode, scenario, latencies, elapsed, concurrency):
+    lat_ms = np.asarray(latencies) * 1000
+    return {
+        "mode": mode,
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(float(np.percentile(lat_ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(lat_ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(lat_ms, 99)), 3),
+    }
+
+
+def run_sync(scenario, requests, concurrency):
+    fn = SCENARIOS[scenario][0]
+
+    def one(_):
+        t0 = time.perf_counter()
+        db = SessionLocal()
+        try:
+            fn(db)
+        finally:
+            db.close()
+        return time.perf_counter() - t0
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(concurrency)))  # 预热连接池
+        start = time.perf_counter()
+        latencies = list(pool.map(one, range(requests)))
+        elapsed = time.perf_counter() - start
+    return _summary("sync", scenario, latencies, elapsed, concurrency)
+
+
+async def run_async(scenario, requests, concurrency):
+    fn = SCENARIOS[scenario][1]
+    session_factory = get_async_sessionmaker()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            t0 = time.perf_counter()
+            async with session_factory() as db:
+                await fn(db)
+            return time.perf_counter() - t0
+
+    await asyncio.gather(*(one() for _ in range(concurrency)))  # 预热连接池
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    await get_async_engine().dispose()
+    return _summary("async", scenario, latencies, elapsed, concurrency)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), action="append")
+    args = parser.parse_args()
+
+    results = []
+    for scenario in args.scenario or sorted(SCENARIOS):
+        results.append(run_sync(scenario, args.requests, args.concurrency))
+        results.append(asyncio.run(run_async(scenario, args.requests, args.concurrency)))
+    engine.dispose()
+    print(json.dumps(results, indent=2))
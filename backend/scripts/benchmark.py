@@ -0,0 +1,199 @@
+"""
+接口压测套件：生成 N 个站点 × M 小时的合成数据 (复用 init_data 的 normal / outbreak 场景)，
+然后以指定并发压测主要接口，输出各接口的延迟分位数与吞吐 (JSON)
+
+用法:
+    # 先启动服务: uvicorn app.main:app --workers 4
+    python scripts/benchmark.py --zones 1000 --hours 168 --concurrency 32 --output bench.json
+    python scripts/benchmark.py --skip-load --requests 5000   # 复用已加载的数据
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from app import crud, models, partitions
+from app.database import SessionLocal, engine
+from scripts.init_data import copy_sensor_frame, generate_sensor_dataframe, validate_sensor_frame
+
+# 压测站点使用独立的 id 段，避免与演示数据冲突
+BENCH_ZONE_ID_START = 100_000
+OUTBREAK_RATIO = 0.2
+
+
+def bench_zones(n_zones):
+    rng = random.Random(42)
+    return [
+        {
+            "id": BENCH_ZONE_ID_START + i,
+            "scenario": "outbreak" if rng.random() < OUTBREAK_RATIO else "normal",
+        }
+        for i in range(n_zones)
+    ]
+
+
+def load_dataset(zones, hours):
+    """写入站点与合成时序数据，返回写入的传感器记录数"""
+    db = SessionLocal()
+    try:
+        existing = crud.get_existing_zone_ids(db, [z["id"] for z in zones])
+        rng = random.Random(7)
+        db.bulk_save_objects([
+            models.MarineZone(
+                id=z["id"],
+                name=f"压测站点-{z['id']} ({z['scenario']})",
+                zone_type="Buoy",
+                # 随机落在渤海 / 黄海范围内
+                geom=f"POINT({rng.uniform(118.0, 124.0):.4f} {rng.uniform(33.0, 40.0):.4f})",
+            )
+            for z in zones if z["id"] not in existing
+        ])
+        db.commit()
+
+        df, _ = validate_sensor_frame(generate_sensor_dataframe(zones=zones, hours=hours))
+        # 先建好数据覆盖的月度分区，COPY 直接写入对应分区而不是堆积在默认分区
+        partitions.ensure_partitions(engine, df["record_time"].min(), df["record_time"].max())
+        copy_sensor_frame(db, df)
+        db.commit()
+        crud.rebuild_zone_latest(db)
+        crud.rebuild_rollups(db)
+        return len(df)
+    finally:
+        db.close()
+
+
+class Endpoint:
+    def __init__(self, name, method, path_fn, body_fn=None):
+        self.name = name
+        self.method = method
+        self.path_fn = path_fn
+        self.body_fn = body_fn
+
+
+def _upload_body(zone_ids):
+    return {
+        "zone_id": random.choice(zone_ids),
+        "record_time": datetime.now().isoformat(),
+        "temperature": round(random.uniform(15, 28), 2),
+        "salinity": round(random.uniform(29, 32), 2),
+        "current_speed": round(random.uniform(0, 1.5), 2),
+        "chlorophyll": round(random.uniform(0.2, 3.0), 2),
+        "dissolved_oxygen": round(random.uniform(5, 9), 2),
+        "jellyfish_density": round(random.uniform(0, 5), 2),
+    }
+
+
+def build_endpoints(zone_ids):
+    return [
+        Endpoint("realtime", "GET", lambda: "/api/monitor/realtime"),
+        Endpoint("history", "GET", lambda: f"/api/monitor/history/{random.choice(zone_ids)}"),
+        Endpoint("upload", "POST", lambda: "/api/monitor/upload", lambda: _upload_body(zone_ids)),
+        Endpoint("kg_graph", "GET", lambda: "/api/kg/graph"),
+        Endpoint("predict", "POST", lambda: "/api/analysis/predict"),
+    ]
+
+
+def _request(base_url, endpoint, timeout):
+    data = None
+    headers = {}
+    if endpoint.body_fn is not None:
+        data = json.dumps(endpoint.body_fn()).encode()
+        headers["Content-Type"] = "application/json"
+    req = urllib.request.Request(base_url + endpoint.path_fn(), data=data, headers=headers, method=endpoint.method)
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            resp.read()
+            ok = resp.status < 400
+    except (urllib.error.URLError, OSError):
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+def run_endpoint(base_url, endpoint, requests, concurrency, timeout):
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(_):
+        nonlocal errors
+        elapsed, ok = _request(base_url, endpoint, timeout)
+        with lock:
+            latencies.append(elapsed)
+            errors += not ok
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(min(concurrency, requests))))  # 预热
+        latencies.clear()
+        errors = 0
+        start = time.perf_counter()
+        list(pool.map(one, range(requests)))
+        wall = time.perf_counter() - start
+
+    lat_ms = np.asarray(latencies) * 1000
+    return {
+        "requests": requests,
+        "errors": errors,
+        "seconds": round(wall, 3),
+        "throughput_rps": round(requests / wall, 1),
+        "p50_ms": round(float(np.percentile(lat_ms, 50)), 3),
+        "p90_ms": round(float(np.percentile(lat_ms, 90)), 3),
+        "p99_ms": round(float(np.percentile(lat_ms, 99)), 3),
+        "max_ms": round(float(lat_ms.max()), 3),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--zones", type=int, default=100)
+    parser.add_argument("--hours", type=int, default=24 * 7)
+    parser.add_argument("--requests", type=int, default=1000, help="每个接口的请求数")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--endpoint", action="append", help="只压测指定接口，可重复")
+    parser.add_argument("--skip-load", action="store_true", help="跳过数据生成与写入")
+    parser.add_argument("--output", help="结果 JSON 文件路径，默认输出到 stdout")
+    args = parser.parse_args()
+
+    zones = bench_zones(args.zones)
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "load": None,
+        "endpoints": {},
+    }
+
+    if not args.skip_load:
+        start = time.perf_counter()
+        rows = load_dataset(zones, args.hours)
+        elapsed = time.perf_counter() - start
+        report["load"] = {"rows": rows, "seconds": round(elapsed, 3), "rows_per_second": round(rows / elapsed, 1)}
+        print(f"已写入 {rows} 条记录，用时 {elapsed:.1f}s", file=sys.stderr)
+
+    zone_ids = [z["id"] for z in zones]
+    for endpoint in build_endpoints(zone_ids):
+        if args.endpoint and endpoint.name not in args.endpoint:
+            continue
+        print(f"压测 {endpoint.name} ...", file=sys.stderr)
+        report["endpoints"][endpoint.name] = run_endpoint(
+            args.base_url, endpoint, args.requests, args.concurrency, args.timeout
+        )
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
@@ -0,0 +1,40 @@
+"""
+导出传感器数据为 Arrow IPC / Parquet 文件 (或 csv / ndjson)，按服务端游标分批写出，内存占用恒定
+
+用法:
+    python scripts/export_data.py --zone 101 --zone 102 --start 2025-01-01 --format parquet -o logs.parquet
+    # pandas 读取: pyarrow.ipc.open_stream("logs.arrows").read_pandas() / pandas.read_parquet("logs.parquet")
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from app import export
+from app.database import SessionLocal
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--zone", type=int, action="append", required=True, help="站点 id，可重复")
+    parser.add_argument("--start", type=datetime.fromisoformat)
+    parser.add_argument("--end", type=datetime.fromisoformat)
+    parser.add_argument("--format", choices=sorted(export.EXPORTERS), default="parquet")
+    parser.add_argument("-o", "--output", help="输出文件，默认 sensor_logs.<扩展名>")
+    args = parser.parse_args()
+
+    output = args.output or f"sensor_logs.{export.FILE_EXTENSIONS[args.format]}"
+    db = SessionLocal()
+    start = time.perf_counter()
+    written = 0
+    try:
+        with open(output, "wb") as f:
+            for chunk in export.EXPORTERS[args.format](db, args.zone, args.start, args.end):
+                f.write(chunk)
+                written += len(chunk)
+    finally:
+        db.close()
+    print(f"已写入 {output} ({written / 1e6:.1f} MB)，用时 {time.perf_counter() - start:.1f}s", file=sys.stderr)
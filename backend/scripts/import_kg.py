@@ -0,0 +1,60 @@
+"""
+批量导入知识图谱 (完整图谱，当前图谱中不在其中的节点与边会被删除)
+
+用法:
+    python scripts/import_kg.py --nodes nodes.csv --edges edges.csv
+    python scripts/import_kg.py --json graph.json   # {"nodes": [...], "edges": [...]}，同 POST /api/kg/import
+
+CSV 格式:
+    nodes.csv: name,label,<其他列作为 properties>     例: 海月水母,Species,15-25,High
+    edges.csv: source,target,relation,<其他列>        例: 海水温度,海月水母,AFFECTS,0.9
+    数字 / 布尔值按 JSON 解析；也可以用一列 properties 直接给出 JSON 对象
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from app import kg_import
+from app.database import SessionLocal
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", help="节点 CSV")
+    parser.add_argument("--edges", help="边 CSV")
+    parser.add_argument("--json", help="JSON 图谱文件")
+    args = parser.parse_args()
+
+    if args.json:
+        with open(args.json, encoding="utf-8") as f:
+            graph = json.load(f)
+        nodes, edges, source = graph["nodes"], graph.get("edges", []), args.json
+    elif args.nodes:
+        with open(args.nodes, encoding="utf-8-sig", newline="") as f:
+            nodes = kg_import.read_nodes_csv(f)
+        edges = []
+        if args.edges:
+            with open(args.edges, encoding="utf-8-sig", newline="") as f:
+                edges = kg_import.read_edges_csv(f)
+        source = args.nodes
+    else:
+        parser.error("需要 --json 或 --nodes")
+
+    errors = kg_import.validate_graph(nodes, edges)
+    if errors:
+        print("\n".join(errors), file=sys.stderr)
+        sys.exit(1)
+
+    db = SessionLocal()
+    start = time.perf_counter()
+    try:
+        result = kg_import.import_graph(db, nodes, edges, source=source)
+    finally:
+        db.close()
+    counts = ", ".join(f"{name} {result[name]}" for name in kg_import.COUNTERS)
+    status = f"版本 {result['version']}" if result["changed"] else f"无变化 (当前版本 {result['version']})"
+    print(f"{status}: {counts}，用时 {time.perf_counter() - start:.2f}s")
@@ -1,27 +1,24 @@
+import io
 import sys
 import os
-import random
 import pandas as pd
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-from sqlalchemy import text
 
 # 将 backend 目录加入路径，以便导入 app 模块
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 from app.database import SessionLocal, engine, Base
-from app import models, schemas
+from app import models, crud, forecast, migrations, partitions, kg_import
 
 # 1. 重置数据库 (危险操作，Demo专用)
 def reset_db():
     print("正在重置数据库...")
-    # 确保 PostGIS 扩展存在
-    with engine.connect() as conn:
-        conn.execute(text("CREATE EXTENSION IF NOT EXISTS postgis;"))
-        conn.commit()
-    
     Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
+    migrations.schema_migrations.drop(bind=engine, checkfirst=True)
+    # 按迁移从头建表 (含 PostGIS 扩展)
+    migrations.upgrade(engine)
     print("数据库表已重新创建。")
 
 # 2. 生成知识图谱静态数据
@@ -41,29 +38,17 @@ def create_kg_data(db):
         {"name": "滨海旅游业受损", "label": "Consequence", "properties": {"severity": "Medium"}}
     ]
     
-    # 插入节点并保存对象以便获取 ID
-    db_nodes = []
-    for n in nodes_data:
-        node = models.KGNode(**n)
-        db.add(node)
-        db_nodes.append(node)
-    db.commit()
-    
-    # 刷新以获取 ID
-    for n in db_nodes: db.refresh(n)
-    node_map = {n.name: n.id for n in db_nodes}
-
-    # 定义边 (关系)
+    # 定义边 (关系)，两端按节点名称引用
     edges_data = [
-        {"source_id": node_map["海水温度"], "target_id": node_map["海月水母"], "relation": "AFFECTS", "properties": {"weight": 0.9}},
-        {"source_id": node_map["富营养化"], "target_id": node_map["海月水母"], "relation": "PROMOTES", "properties": {"weight": 0.85}},
-        {"source_id": node_map["海月水母"], "target_id": node_map["核电站冷源堵塞"], "relation": "CAUSES", "properties": {"prob": 0.8}},
-        {"source_id": node_map["海月水母"], "target_id": node_map["滨海旅游业受损"], "relation": "CAUSES", "properties": {"prob": 0.6}}
+        {"source": "海水温度", "target": "海月水母", "relation": "AFFECTS", "properties": {"weight": 0.9}},
+        {"source": "富营养化", "target": "海月水母", "relation": "PROMOTES", "properties": {"weight": 0.85}},
+        {"source": "海月水母", "target": "核电站冷源堵塞", "relation": "CAUSES", "properties": {"prob": 0.8}},
+        {"source": "海月水母", "target": "滨海旅游业受损", "relation": "CAUSES", "properties": {"prob": 0.6}}
     ]
-    
-    for e in edges_data:
-        db.add(models.KGEdge(**e))
-    db.commit()
+
+    # 批量导入：名称解析与写入都在数据库端一次完成
+    result = kg_import.import_graph(db, nodes_data, edges_data, source="init_data")
+    print(f"知识图谱版本 {result['version']}：{result['nodes_added']} 个节点，{result['edges_added']} 条边")
 
 # 3. 生成 GIS 区域数据
 def create_zones(db):
@@ -85,90 +70,109 @@ def create_zones(db):
     db.commit()
 
 # 4. 生成时序 Mock 数据 (复用之前的逻辑)
-def generate_sensor_dataframe():
-    START_TIME = datetime.now() - timedelta(days=7)
-    HOURS = 24 * 7 
-    ZONES = [
-        {"id": 101, "scenario": "normal"},
-        {"id": 102, "scenario": "outbreak"}
-    ]
-    all_data = []
-
-    for zone in ZONES:
-        timestamps = [START_TIME + timedelta(hours=i) for i in range(HOURS)]
-        t_idx = np.arange(HOURS)
-        noise = np.random.normal(0, 0.2, HOURS)
-        
-        if zone['scenario'] == 'normal':
-            base_temp = 18.0
-            temp_trend = 0  
-            chl_base = 0.5
-        elif zone['scenario'] == 'outbreak':
-            base_temp = 19.0
-            temp_trend = np.linspace(0, 5.0, HOURS) # 显著升温
-            chl_base = 2.0
-
-        temperature = base_temp + temp_trend + 0.5 * np.sin(2 * np.pi * t_idx / 24) + noise
-        salinity = 31.0 + np.random.normal(0, 0.1, HOURS)
-        current_speed = np.abs(np.random.normal(0.5, 0.2, HOURS))
-        chlorophyll = chl_base + np.random.normal(0, 0.1, HOURS) + (temp_trend * 0.2)
-        dissolved_oxygen = 8.0 - (temperature - 18) * 0.2 + np.random.normal(0, 0.1, HOURS)
-
-        # 密度计算逻辑
-        density = []
-        current_density = 0.1 if zone['scenario'] == 'normal' else 0.5
-        for i in range(HOURS):
-            T = temperature[i]
-            Chl = chlorophyll[i]
-            growth_factor = 1.05 if (18 < T < 26 and Chl > 1.5) else random.uniform(0.98, 1.02)
-            if T > 28: growth_factor = 0.90
-            current_density = current_density * growth_factor
-            density.append(max(0, current_density + random.uniform(-0.1, 0.1)))
-
-        # 转为 Dict List
-        for i in range(HOURS):
-            all_data.append({
-                "zone_id": zone['id'],
-                "record_time": timestamps[i],
-                "temperature": round(temperature[i], 2),
-                "salinity": round(salinity[i], 2),
-                "current_speed": round(current_speed[i], 2),
-                "chlorophyll": round(chlorophyll[i], 2),
-                "dissolved_oxygen": round(dissolved_oxygen[i], 2),
-                "jellyfish_density": round(density[i], 2)
-            })
-            
-    return all_data
-
-def insert_sensor_data(db):
-    print("正在生成并插入时序数据 (使用 Pydantic 校验)...")
-    raw_data_list = generate_sensor_dataframe()
-    
-    # 批量处理以提高性能
-    batch_size = 100
-    buffer = []
-    
-    for row in raw_data_list:
-        # 1. 使用 Pydantic 校验数据
-        try:
-            valid_data = schemas.SensorLogCreate(**row)
-        except Exception as e:
-            print(f"数据校验失败: {e}")
-            continue
-            
-        # 2. 转换为 ORM 模型
-        db_log = models.SensorLog(**valid_data.model_dump())
-        buffer.append(db_log)
-        
-        if len(buffer) >= batch_size:
-            db.bulk_save_objects(buffer)
-            buffer = []
-            
-    if buffer:
-        db.bulk_save_objects(buffer)
-        
+DEFAULT_ZONES = [
+    {"id": 101, "scenario": "normal"},
+    {"id": 102, "scenario": "outbreak"}
+]
+
+SENSOR_COLUMNS = ["zone_id", "record_time", *models.SENSOR_METRICS]
+# 每次 COPY 的行数，控制内存中 CSV 缓冲区的大小
+COPY_CHUNK_ROWS = 200_000
+
+
+def _zone_frame(zone, hours, start_time, seed):
+    """单个站点的全部逐时数据，全程数组运算 (在进程池中执行)"""
+    rng = np.random.default_rng(seed)
+    t_idx = np.arange(hours)
+
+    if zone['scenario'] == 'outbreak':
+        base_temp = 19.0
+        temp_trend = np.linspace(0, 5.0, hours)  # 显著升温
+        chl_base = 2.0
+        initial_density = 0.5
+    else:
+        base_temp = 18.0
+        temp_trend = np.zeros(hours)
+        chl_base = 0.5
+        initial_density = 0.1
+
+    temperature = base_temp + temp_trend + 0.5 * np.sin(2 * np.pi * t_idx / 24) + rng.normal(0, 0.2, hours)
+    salinity = 31.0 + rng.normal(0, 0.1, hours)
+    current_speed = np.abs(rng.normal(0.5, 0.2, hours))
+    chlorophyll = chl_base + rng.normal(0, 0.1, hours) + temp_trend * 0.2
+    dissolved_oxygen = 8.0 - (temperature - 18) * 0.2 + rng.normal(0, 0.1, hours)
+
+    # 逐时的乘性增长 => 累乘 (与 forecast 共用增长模型，其余情况随机波动)
+    growth = forecast.growth_factors(temperature, chlorophyll, neutral=rng.uniform(0.98, 1.02, hours))
+    density = initial_density * np.cumprod(growth)
+    density = np.maximum(density + rng.uniform(-0.1, 0.1, hours), 0)
+
+    return pd.DataFrame({
+        "zone_id": np.full(hours, zone['id'], dtype=np.int64),
+        "record_time": pd.date_range(start_time, periods=hours, freq="h"),
+        "temperature": temperature,
+        "salinity": salinity,
+        "current_speed": current_speed,
+        "chlorophyll": chlorophyll,
+        "dissolved_oxygen": dissolved_oxygen,
+        "jellyfish_density": density,
+    }).round({metric: 2 for metric in models.SENSOR_METRICS})
+
+
+def generate_sensor_dataframe(zones=None, hours=24 * 7, start_time=None, workers=None, seed=None):
+    """按场景 (normal / outbreak) 为每个站点生成 hours 小时的逐时数据，站点分散到进程池并行生成"""
+    zones = zones or DEFAULT_ZONES
+    start_time = start_time or datetime.now() - timedelta(hours=hours)
+    # 每个站点一个独立的随机流，结果与进程数无关
+    seeds = np.random.SeedSequence(seed).spawn(len(zones))
+    args = [(zone, hours, start_time, s) for zone, s in zip(zones, seeds)]
+
+    if workers == 1 or len(zones) < 2:
+        frames = [_zone_frame(*a) for a in args]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            frames = list(pool.map(_zone_frame, *zip(*args), chunksize=max(1, len(args) // 64)))
+    return pd.concat(frames, ignore_index=True)
+
+
+def validate_sensor_frame(df):
+    """整列校验：缺失、非有限数值、负的流速/密度行被剔除，返回 (有效数据, 剔除行数)"""
+    metrics = df[list(models.SENSOR_METRICS)].to_numpy(dtype=np.float64)
+    ok = np.isfinite(metrics).all(axis=1)
+    ok &= df["zone_id"].notna().to_numpy() & df["record_time"].notna().to_numpy()
+    ok &= (df[["current_speed", "jellyfish_density"]].to_numpy() >= 0).all(axis=1)
+    return df[ok], int((~ok).sum())
+
+
+def copy_sensor_frame(db, df, chunk_rows=COPY_CHUNK_ROWS):
+    """用 COPY FROM STDIN 把 DataFrame 分块写入 sensor_logs (在当前事务内，不提交)"""
+    cursor = db.connection().connection.cursor()
+    sql = f"COPY sensor_logs ({', '.join(SENSOR_COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+    try:
+        for i in range(0, len(df), chunk_rows):
+            buf = io.StringIO()
+            df.iloc[i:i + chunk_rows].to_csv(buf, columns=SENSOR_COLUMNS, header=False, index=False)
+            buf.seek(0)
+            cursor.copy_expert(sql, buf)
+    finally:
+        cursor.close()
+    return len(df)
+
+
+def insert_sensor_data(db, zones=None, hours=24 * 7):
+    print("正在生成并插入时序数据 (COPY 批量导入)...")
+    df, rejected = validate_sensor_frame(generate_sensor_dataframe(zones=zones, hours=hours))
+    if rejected:
+        print(f"数据校验失败，已剔除 {rejected} 条记录")
+
+    # 先建好数据覆盖的月度分区，COPY 直接写入对应分区
+    partitions.ensure_partitions(engine, df["record_time"].min(), df["record_time"].max())
+    copy_sensor_frame(db, df)
     db.commit()
-    print(f"成功插入 {len(raw_data_list)} 条传感器记录。")
+    # 批量写入绕过了 create_sensor_log，需要重建最新读数快照与预聚合表
+    crud.rebuild_zone_latest(db)
+    crud.rebuild_rollups(db)
+    print(f"成功插入 {len(df)} 条传感器记录。")
 
 if __name__ == "__main__":
     db = SessionLocal()
@@ -0,0 +1,34 @@
+"""
+执行数据库迁移 (部署时在启动 worker 之前运行)
+
+用法:
+    python scripts/migrate.py              # 升级到最新版本
+    python scripts/migrate.py --status     # 查看当前版本与待执行的迁移
+    python scripts/migrate.py --target 1   # 只升级到指定版本
+"""
+import argparse
+import logging
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from app import migrations
+from app.database import engine
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--status", action="store_true", help="只显示状态，不执行")
+    parser.add_argument("--target", type=int, help="目标版本，默认最新")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.status:
+        with engine.connect() as conn:
+            print(f"当前版本: {migrations.current_version(conn)}，最新版本: {migrations.head()}")
+            for m in migrations.pending(conn):
+                print(f"  待执行 {m.version}: {m.description}")
+    else:
+        applied = migrations.upgrade(engine, args.target)
+        print(f"已执行 {len(applied)} 个迁移" + (f": {applied}" if applied else "，数据库已是最新"))
@@ -0,0 +1,42 @@
+"""
+sensor_logs 分区维护与数据保留 (服务运行时已在后台定时执行，此脚本用于 cron 或手动执行)
+
+用法:
+    python scripts/retention.py                       # 建未来分区，按 SENSOR_RETENTION_MONTHS 删除过期分区
+    python scripts/retention.py --retention-months 12 # 压缩并删除 12 个月之前的分区
+    python scripts/retention.py --status              # 查看分区与保留进度
+"""
+import argparse
+import logging
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import select
+
+from app import models, partitions
+from app.database import engine
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--retention-months", type=int, default=partitions.SENSOR_RETENTION_MONTHS,
+                        help="原始读数保留的月数，0 表示不删除")
+    parser.add_argument("--status", action="store_true", help="只显示状态，不执行")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.status:
+        r = models.SensorLogRetention
+        with engine.connect() as conn:
+            print("分区:", ", ".join(partitions.attached_partitions(conn)) or "无")
+            for row in conn.execute(select(r).order_by(r.range_start)):
+                print(f"  {row.partition}: {row.row_count} 条，压缩于 {row.compacted_at}，删除于 {row.dropped_at}")
+        sys.exit(0)
+
+    dropped = partitions.run_maintenance(engine, args.retention_months)
+    if dropped is None:
+        print("其他进程正在执行分区维护，已跳过")
+    else:
+        print(f"已删除 {len(dropped)} 个过期分区" + (f": {dropped}" if dropped else ""))
@@ -1,3 +1,6 @@
+def _zone_result(results, zone_name="Test Zone"):
+    return next(r for r in results if r["zone_name"] == zone_name)
+
 def test_predict_red_alert(client):
     """测试红色预警逻辑"""
     # 1. 先上传一条必定触发预警的数据 (Temp > 25, Chl > 1.5)
@@ -16,9 +19,9 @@ def test_predict_red_alert(client):
     # 2. 调用预测接口
     response = client.post("/api/analysis/predict")
     assert response.status_code == 200
-    data = response.json()
+    data = _zone_result(response.json())
     
-    # 3. 验证结果
+    # 3. 验证结果 (返回真实的站点名称)
     assert data["level"] == "RED"
     assert "高温" in data["message"]
 
@@ -39,7 +42,102 @@ def test_predict_green_status(client):
 
     # 2. 调用预测接口
     response = client.post("/api/analysis/predict")
-    data = response.json()
+    data = _zone_result(response.json())
     
     # 3. 验证结果
-    assert data["level"] == "GREEN"
\ No newline at end of file
+    assert data["level"] == "GREEN"
+
+def test_predict_custom_rules(client):
+    """测试自定义阈值: 降低橙色阈值后当前数据 (18℃, 0.5) 应为橙色预警"""
+    rules = {
+        "red_temperature": 25.0,
+        "red_chlorophyll": 1.5,
+        "orange_temperature": 15.0,
+        "orange_chlorophyll": 0.2
+    }
+    response = client.post("/api/analysis/predict", json=rules)
+    assert response.status_code == 200
+    data = _zone_result(response.json())
+    assert data["level"] == "ORANGE"
+
+def test_predict_slope_only_message(client):
+    """只由水温斜率触发的橙色预警，说明中不出现未触发的水温/叶绿素阈值"""
+    rules = {"orange_temperature": 40.0, "orange_chlorophyll": 10.0, "orange_temperature_slope": -100.0}
+    response = client.post("/api/analysis/predict", json=rules)
+    assert response.status_code == 200
+    data = _zone_result(response.json())
+    assert data["level"] == "ORANGE"
+    assert data["zone_id"] == 999
+    assert "斜率" in data["message"] and "叶绿素" not in data["message"]
+
+def test_zone_features(client):
+    """上传的读数增量更新特征库: 13:00 比 12:00 降温 10℃，斜率为负"""
+    response = client.get("/api/analysis/features/999")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["sample_count"] >= 2
+    assert data["temperature_slope"] < 0
+    assert data["density_growth_ratio"] is not None
+
+def test_feature_snapshot_from_db(client, test_db, monkeypatch):
+    """快照由数据库中的读数推进，与本进程内的特征状态无关"""
+    from app import features, models
+
+    monkeypatch.setattr(features.feature_store, "_zones", {})
+    assert features.refresh_snapshot(test_db)
+    snapshot = test_db.get(models.ZoneFeatureSnapshot, 999)
+    assert snapshot is not None and len(snapshot.state["buckets"]) >= 2
+
+    # 其他 worker 用 reload 把快照换入自己的特征库
+    store = features.FeatureStore()
+    store.load(test_db)
+    assert store.get(999)["sample_count"] == features.feature_store.get(999)["sample_count"]
+
+def test_density_forecast(client, test_db):
+    """后台任务生成预测后，接口按 hours 截取逐小时结果"""
+    from app import forecast
+    assert forecast.run_forecasts(test_db) > 0
+
+    response = client.get("/api/analysis/forecast/999?hours=24")
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data["points"]) == 24
+    assert all(p["density"] >= 0 for p in data["points"])
+
+def test_anomaly_alerts(client, test_db):
+    """溶解氧骤降被在线检测为异常，并可通过告警接口分页查询"""
+    from datetime import datetime, timedelta
+    from app.anomaly import AnomalyDetector, record_events
+
+    detector = AnomalyDetector(warmup=5)
+    start = datetime(2032, 1, 1)
+    events = []
+    for i in range(10):
+        events += detector.observe([{
+            "id": i, "zone_id": 999, "record_time": start + timedelta(hours=i),
+            "temperature": 20.0, "salinity": 31.0, "current_speed": 0.5, "chlorophyll": 1.0,
+            "dissolved_oxygen": 8.0 if i < 9 else 2.0, "jellyfish_density": 0.5,
+        }])
+    assert [e["metric"] for e in events] == ["dissolved_oxygen"]
+    assert events[0]["zscore"] < 0
+    record_events(test_db, events)
+
+    response = client.get("/api/analysis/alerts", params={"zone_id": 999, "metric": "dissolved_oxygen", "limit": 1})
+    assert response.status_code == 200
+    assert response.json()[0]["value"] == 2.0
+    assert "X-Next-Cursor" in response.headers
+
+def test_backtest(client):
+    """回测接口: 每组阈值一条结果，计数自洽"""
+    config = {
+        "zone_ids": [999],
+        "outbreak_density": 5.0,
+        "temperature_thresholds": [20.0, 25.0],
+        "chlorophyll_thresholds": [1.0],
+    }
+    response = client.post("/api/analysis/backtest", json=config)
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data["results"]) == 2
+    for result in data["results"]:
+        assert result["true_positives"] + result["false_negatives"] == data["positives"]
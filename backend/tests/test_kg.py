@@ -0,0 +1,139 @@
+from app import models
+
+
+def test_graph_etag_not_modified(client):
+    """测试图谱未变化时带 If-None-Match 返回 304"""
+    response = client.get("/api/kg/graph")
+    assert response.status_code == 200
+    assert "nodes" in response.json()
+    etag = response.headers["etag"]
+
+    response = client.get("/api/kg/graph", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+
+def test_graph_cache_invalidated_on_write(client, test_db):
+    """测试写入节点后缓存失效，ETag 随之变化"""
+    etag = client.get("/api/kg/graph").headers["etag"]
+
+    test_db.add(models.KGNode(name="测试节点", label="Factor", properties={}))
+    test_db.commit()
+
+    response = client.get("/api/kg/graph", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert "测试节点" in [n["name"] for n in response.json()["nodes"]]
+
+
+def test_graph_cache_sees_external_writes(client, test_db):
+    """其他进程或手写 SQL 的写入由触发器生成图谱版本，缓存据此失效"""
+    from sqlalchemy import text
+    from app import kg_cache
+
+    etag = client.get("/api/kg/graph").headers["etag"]
+    with test_db.get_bind().begin() as conn:
+        conn.execute(text("INSERT INTO kg_nodes (name, label, properties) VALUES ('外部节点', 'Factor', '{}')"))
+    kg_cache.graph_cache.expire()  # 不等待版本检查间隔
+
+    response = client.get("/api/kg/graph", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert "外部节点" in [n["name"] for n in response.json()["nodes"]]
+    assert int(response.headers["x-kg-version"]) > 0
+
+
+def _create_chain(db):
+    """创建 温度 -> 水母 -> 后果 的测试链路，返回节点 id"""
+    nodes = [
+        models.KGNode(name="路径测试-温度", label="Factor", properties={}),
+        models.KGNode(name="路径测试-水母", label="Species", properties={}),
+        models.KGNode(name="路径测试-后果", label="Consequence", properties={}),
+    ]
+    db.add_all(nodes)
+    db.flush()
+    t, j, c = (n.id for n in nodes)
+    db.add_all([
+        models.KGEdge(source_id=t, target_id=j, relation="AFFECTS", properties={"weight": 0.9}),
+        models.KGEdge(source_id=j, target_id=c, relation="CAUSES", properties={"prob": 0.5}),
+    ])
+    db.commit()
+    return t, j, c
+
+
+def test_graph_traversal(client, test_db):
+    """测试邻居、k 跳子图与加权路径查询"""
+    t, j, c = _create_chain(test_db)
+
+    neighbors = client.get(f"/api/kg/nodes/{t}/neighbors").json()
+    assert {n["id"] for n in neighbors["nodes"]} == {t, j}
+
+    subgraph = client.get(f"/api/kg/nodes/{t}/subgraph", params={"depth": 2}).json()
+    assert {n["id"] for n in subgraph["nodes"]} == {t, j, c}
+    assert len(subgraph["links"]) == 2
+
+    path = client.get("/api/kg/path", params={"source": t, "target": c}).json()
+    assert [n["id"] for n in path["nodes"]] == [t, j, c]
+    assert abs(path["probability"] - 0.45) < 1e-9
+
+    assert client.get("/api/kg/path", params={"source": c, "target": t}).status_code == 404
+
+
+def test_graph_index_patched_incrementally(test_db, monkeypatch):
+    """索引版本落后时只读取增量打补丁，不重新读取全量图谱"""
+    from app import crud, kg_cache, kg_index
+
+    t, j, c = _create_chain(test_db)
+    kg_cache.graph_cache.expire()
+    index = kg_index.graph_index.get(test_db)
+
+    def full_load(db):
+        raise AssertionError("index rebuilt from scratch")
+
+    monkeypatch.setattr(crud, "get_all_nodes", full_load)
+    monkeypatch.setattr(crud, "get_all_edges", full_load)
+    edge = models.KGEdge(source_id=c, target_id=t, relation="FEEDS_BACK", properties={"weight": 0.2})
+    test_db.add(edge)
+    test_db.commit()
+
+    patched = kg_index.graph_index.get(test_db)
+    assert patched.version > index.version
+    assert {n["id"] for n in patched.neighbors(c)["nodes"]} == {c, t}
+    assert {n["id"] for n in index.neighbors(c)["nodes"]} == {c}  # 原索引不受影响
+
+    test_db.delete(edge)
+    test_db.commit()
+    assert {n["id"] for n in kg_index.graph_index.get(test_db).neighbors(c)["nodes"]} == {c}
+
+
+def test_kg_import_diff_and_changes(client):
+    """测试批量导入按差异生效、重复导入不生成新版本，以及按版本增量同步"""
+    graph = {
+        "nodes": [
+            {"name": "导入-温度", "label": "Factor", "properties": {"unit": "℃"}},
+            {"name": "导入-水母", "label": "Species"},
+            {"name": "导入-后果", "label": "Consequence"},
+        ],
+        "edges": [
+            {"source": "导入-温度", "target": "导入-水母", "relation": "AFFECTS", "properties": {"weight": 0.9}},
+            {"source": "导入-水母", "target": "导入-后果", "relation": "CAUSES", "properties": {"prob": 0.5}},
+        ],
+    }
+    first = client.post("/api/kg/import", json=graph).json()
+    assert first["changed"] and first["nodes_added"] == 3 and first["edges_added"] == 2
+    ids = {n["name"]: n["id"] for n in client.get("/api/kg/graph").json()["nodes"]}
+    assert set(ids) == {"导入-温度", "导入-水母", "导入-后果"}
+
+    again = client.post("/api/kg/import", json=graph).json()
+    assert not again["changed"] and again["version"] == first["version"]
+
+    graph["nodes"][1]["properties"] = {"danger_level": "High"}
+    graph["edges"].pop()
+    second = client.post("/api/kg/import", json=graph).json()
+    assert (second["nodes_updated"], second["nodes_deleted"], second["edges_deleted"]) == (1, 0, 1)
+
+    changes = client.get("/api/kg/changes", params={"since": first["version"]}).json()
+    assert changes["version"] == second["version"]
+    assert [n["id"] for n in changes["nodes"]] == [ids["导入-水母"]]
+    assert changes["links"] == [] and len(changes["deleted_links"]) == 1
+
+    bad = {"nodes": [{"name": "a", "label": "Factor"}], "edges": [{"source": "a", "target": "b", "relation": "R"}]}
+    assert client.post("/api/kg/import", json=bad).status_code == 400
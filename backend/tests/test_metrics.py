@@ -0,0 +1,71 @@
+def test_metrics_endpoint(client):
+    """测试 /metrics 输出 Prometheus 格式的路由延迟"""
+    client.get("/api/monitor/zones")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/monitor/zones"}' in response.text
+
+def test_sampled_request_sql_stats(client, monkeypatch):
+    """被抽样的请求统计 SQL 次数，开启 SERVER_TIMING 时写入 Server-Timing 响应头"""
+    import re
+    from app import metrics
+
+    monkeypatch.setattr(metrics, "METRICS_SAMPLE_RATE", 1.0)
+    monkeypatch.setattr(metrics, "SERVER_TIMING", True)
+    response = client.get("/api/kg/changes", params={"since": 0})
+    assert response.status_code == 200
+    timing = response.headers["Server-Timing"]
+    assert timing.startswith("app;dur=")
+    queries = int(re.search(r'desc="(\d+) queries"', timing).group(1))
+    assert queries > 0
+
+    text = client.get("/metrics").text
+    labels = 'method="GET",route="/api/kg/changes"'
+    sampled = re.search(rf"http_sampled_requests_total{{{labels}}} (\d+)", text)
+    total = re.search(rf"http_request_db_queries_total{{{labels}}} (\d+)", text)
+    assert int(sampled.group(1)) >= 1
+    assert int(total.group(1)) >= queries
+
+def test_server_error_recorded(client, monkeypatch):
+    """处理中抛出异常的请求记为 500"""
+    from fastapi.testclient import TestClient
+    from app import features
+    from app.main import app
+
+    def fail():
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(features.feature_store, "all", fail)
+    response = TestClient(app, raise_server_exceptions=False).get("/api/analysis/features")
+    assert response.status_code == 500
+    text = client.get("/metrics").text
+    assert 'http_responses_total{method="GET",route="/api/analysis/features",status="500"}' in text
+
+def test_health_probes(client):
+    """存活探针不依赖预热；TestClient 未进入 lifespan，就绪探针返回 503"""
+    assert client.get("/healthz").json() == {"status": "ok"}
+    assert client.get("/readyz").status_code == 503
+
+def test_migrations_idempotent(test_db):
+    """迁移到最新版本后再次执行不做任何事"""
+    from app import migrations
+
+    engine = test_db.get_bind()
+    migrations.upgrade(engine)
+    assert migrations.upgrade(engine) == []
+    with engine.connect() as conn:
+        assert migrations.current_version(conn) == migrations.head()
+        assert migrations.pending(conn) == []
+
+def test_migration_creates_missing_indexes(test_db):
+    """表已存在但缺少索引的库，版本 4 补建索引"""
+    from sqlalchemy import text
+    from app import migrations
+
+    engine = test_db.get_bind()
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX IF EXISTS ix_marine_zones_geog"))
+        migrations.MIGRATIONS[3].apply(conn)
+        assert conn.scalar(text("SELECT to_regclass('ix_marine_zones_geog')")) is not None
@@ -33,4 +33,293 @@ def test_get_history_data(client):
     response = client.get("/api/monitor/history/999")
     assert response.status_code == 200
     data = response.json()
-    assert isinstance(data, list)
\ No newline at end of file
+    assert isinstance(data, list)
+
+def test_realtime_ignores_older_upload(client):
+    """测试乱序上传的旧数据不会覆盖最新快照"""
+    payload = {
+        "zone_id": 999,
+        "record_time": "2000-01-01T00:00:00",  # 远早于已有数据
+        "temperature": 10.0,
+        "salinity": 30.0,
+        "current_speed": 1.0,
+        "chlorophyll": 0.1,
+        "dissolved_oxygen": 9.0,
+        "jellyfish_density": 123.0
+    }
+    client.post("/api/monitor/upload", json=payload)
+
+    response = client.get("/api/monitor/realtime")
+    data = [d for d in response.json() if d["zone_id"] == 999]
+    assert len(data) == 1
+    assert data[0]["jellyfish_density"] != 123.0
+
+def test_bulk_upload_json_array(client):
+    """测试批量上传: 逐行报错且不影响合法数据写入"""
+    row = {
+        "zone_id": 999,
+        "record_time": "2025-12-09T11:00:00",
+        "temperature": 20.0,
+        "salinity": 30.0,
+        "current_speed": 1.0,
+        "chlorophyll": 1.0,
+        "dissolved_oxygen": 7.0,
+        "jellyfish_density": 0.5
+    }
+    bad_row = {k: v for k, v in row.items() if k != "temperature"}
+    unknown_zone = dict(row, zone_id=-1)
+
+    response = client.post("/api/monitor/upload/bulk", json=[row, bad_row, unknown_zone])
+    assert response.status_code == 200
+    data = response.json()
+    assert data["accepted"] == 1
+    assert data["rejected"] == 2
+    assert [e["index"] for e in data["errors"]] == [1, 2]
+
+def test_bulk_upload_ndjson(client):
+    """测试 NDJSON 流式上传"""
+    line = '{"zone_id": 999, "record_time": "2025-12-09T11:30:00", "temperature": 20.0, "salinity": 30.0, "current_speed": 1.0, "chlorophyll": 1.0, "dissolved_oxygen": 7.0, "jellyfish_density": 0.5}'
+    body = "\n".join([line, "not json", line]) + "\n"
+    response = client.post(
+        "/api/monitor/upload/bulk",
+        content=body,
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["accepted"] == 2
+    assert data["rejected"] == 1
+    assert data["errors"][0]["index"] == 1
+
+def test_bulk_upload_too_large(client, monkeypatch):
+    """超过上限的上传在解析之前被拒绝"""
+    from app import ingest
+
+    monkeypatch.setattr(ingest, "MAX_BULK_BYTES", 16)
+    response = client.post("/api/monitor/upload/bulk", content="[" + "{}," * 10 + "{}]",
+                           headers={"Content-Type": "application/json"})
+    assert response.status_code == 413
+
+def test_get_history_hourly_rollup(client):
+    """测试按小时预聚合的历史数据"""
+    payload = {
+        "zone_id": 999,
+        "record_time": "2025-11-01T08:15:00",
+        "temperature": 20.0,
+        "salinity": 30.0,
+        "current_speed": 1.0,
+        "chlorophyll": 1.0,
+        "dissolved_oxygen": 7.0,
+        "jellyfish_density": 0.5
+    }
+    client.post("/api/monitor/upload", json=payload)
+    client.post("/api/monitor/upload", json=dict(payload, record_time="2025-11-01T08:45:00", temperature=22.0))
+
+    response = client.get(
+        "/api/monitor/history/999",
+        params={"start": "2025-11-01T08:00:00", "end": "2025-11-01T09:00:00", "resolution": "hour"},
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data) == 1
+    assert data[0]["bucket"] == "2025-11-01T08:00:00"
+    assert data[0]["sample_count"] >= 2
+    assert data[0]["temperature"]["max"] >= 22.0
+
+def test_history_keyset_pagination(client):
+    """测试游标分页: 两页数据不重叠且按时间倒序"""
+    first = client.get("/api/monitor/history/999", params={"resolution": "raw", "limit": 2})
+    assert first.status_code == 200
+    cursor = first.headers["x-next-cursor"]
+
+    second = client.get("/api/monitor/history/999", params={"cursor": cursor, "limit": 2})
+    assert second.status_code == 200
+    first_ids = {d["id"] for d in first.json()}
+    second_data = second.json()
+    assert first_ids.isdisjoint(d["id"] for d in second_data)
+    assert second_data[0]["record_time"] <= first.json()[-1]["record_time"]
+
+def test_history_columns_layout(client):
+    """测试按列返回的历史数据: 每个字段一个等长数组"""
+    response = client.get("/api/monitor/history/999", params={"resolution": "raw", "layout": "columns", "limit": 5})
+    assert response.status_code == 200
+    data = response.json()
+    assert set(data["zone_id"]) == {999}
+    assert len(data["record_time"]) == len(data["temperature"]) > 0
+    assert data["record_time"] == sorted(data["record_time"], reverse=True)
+
+def test_history_export_ndjson(client):
+    """测试流式导出"""
+    response = client.get("/api/monitor/history/999/export", params={"format": "ndjson"})
+    assert response.status_code == 200
+    lines = [line for line in response.text.splitlines() if line]
+    assert len(lines) > 0
+    assert '"zone_id":999' in lines[0]
+
+def test_export_arrow(client):
+    """测试 Arrow IPC 列式导出可直接被 pyarrow 读取"""
+    import pyarrow as pa
+
+    response = client.get("/api/monitor/export", params={"zone_id": 999, "format": "arrow"})
+    assert response.status_code == 200
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.num_rows > 0
+    assert set(table.column("zone_id").to_pylist()) == {999}
+
+def test_realtime_websocket_push(client):
+    """测试 WebSocket 订阅后能收到指定站点的新读数"""
+    payload = {
+        "zone_id": 999,
+        "record_time": "2030-01-01T00:00:00",
+        "temperature": 20.0,
+        "salinity": 30.0,
+        "current_speed": 1.0,
+        "chlorophyll": 1.0,
+        "dissolved_oxygen": 7.0,
+        "jellyfish_density": 0.5
+    }
+    with client.websocket_connect("/ws/monitor/realtime?zone_id=999") as ws:
+        client.post("/api/monitor/upload", json=payload)
+        # 等级变化时会先收到 warning 消息
+        message = ws.receive_json()
+        while message["type"] != "reading":
+            message = ws.receive_json()
+
+    assert message["zone_id"] == 999
+    assert message["data"]["record_time"] == "2030-01-01T00:00:00"
+
+def test_zones_spatial_filter(client):
+    """测试按矩形范围 / 半径过滤，并返回经纬度"""
+    # 测试站点位于 POINT(0 0)
+    response = client.get("/api/monitor/zones", params={"bbox": "-1,-1,1,1"})
+    assert response.status_code == 200
+    zones = {z["id"]: z for z in response.json()}
+    assert zones[999]["lat"] == 0.0 and zones[999]["lon"] == 0.0
+
+    response = client.get("/api/monitor/zones", params={"bbox": "10,10,11,11"})
+    assert 999 not in {z["id"] for z in response.json()}
+
+    response = client.get("/api/monitor/realtime", params={"lat": 0.1, "lon": 0.1, "radius_km": 50})
+    assert [d["zone_id"] for d in response.json()] == [999]
+
+    # nearest 需要同时提供 lat / lon
+    assert client.get("/api/monitor/zones", params={"nearest": 3}).status_code == 400
+
+def _buffered_row(record_time):
+    return {"zone_id": 999, "record_time": record_time, "temperature": 20.0, "salinity": 30.0,
+            "current_speed": 1.0, "chlorophyll": 1.0, "dissolved_oxygen": 7.0, "jellyfish_density": 0.3}
+
+def test_write_buffer_replays_journal(test_db, tmp_path):
+    """写后缓冲: 日志中未入库的记录在启动时重放并写入数据库，随后日志被清空"""
+    from datetime import datetime, timedelta
+    from sqlalchemy.orm import sessionmaker
+    from app import crud
+    from app.write_buffer import WriteBuffer, _encode
+
+    session_factory = sessionmaker(bind=test_db.get_bind())
+    first = WriteBuffer(str(tmp_path), flush_rows=10, session_factory=session_factory)
+    journal, _lock, name = first._slot_paths(0)
+    checkpoint = first._load_checkpoint(name)
+    record_time = datetime(2031, 1, 1) + timedelta(minutes=checkpoint + 1)  # 重复运行时不与旧数据重叠
+    with open(journal, "wb") as f:
+        f.write(_encode(checkpoint + 1, _buffered_row(record_time)))
+
+    first.start()
+    assert first.journal_path == journal
+    first.stop()
+
+    logs = crud.get_history_logs(test_db, 999, start=record_time, end=record_time + timedelta(seconds=1))
+    assert len(logs) == 1
+    with open(journal, "rb") as f:
+        assert f.read() == b""
+    assert first._load_checkpoint(name) == checkpoint + 1
+
+def test_write_buffer_replays_interleaved_journals(test_db, tmp_path):
+    """两个 worker 的日志各有独立的序号与检查点：一个重启的 worker 重放自己的日志并写完另一个已退出 worker 的日志，
+    每条记录恰好写入一次"""
+    from datetime import datetime, timedelta
+    from sqlalchemy.orm import sessionmaker
+    from app import crud
+    from app.write_buffer import WriteBuffer, _encode
+
+    session_factory = sessionmaker(bind=test_db.get_bind())
+    buffer = WriteBuffer(str(tmp_path), flush_rows=2, session_factory=session_factory)
+    slots = [buffer._slot_paths(0), buffer._slot_paths(1)]
+    checkpoints = [buffer._load_checkpoint(name) for _journal, _lock, name in slots]
+    base = datetime(2032, 1, 1) + timedelta(hours=max(checkpoints) + 1)  # 重复运行时不与旧数据重叠
+    times = []
+    for slot, (journal, _lock, _name) in enumerate(slots):
+        with open(journal, "wb") as f:
+            for k in range(3):
+                # 两个日志的读数时间交错：slot 0 为 0,2,4 分钟，slot 1 为 1,3,5 分钟
+                record_time = base + timedelta(minutes=2 * k + slot)
+                times.append(record_time)
+                f.write(_encode(checkpoints[slot] + k + 1, _buffered_row(record_time)))
+        open(_lock, "a").close()
+
+    buffer.start()
+    buffer.stop()
+
+    logs = crud.get_history_logs(test_db, 999, start=base, end=base + timedelta(minutes=10))
+    assert sorted(log.record_time for log in logs) == sorted(times)
+    assert [buffer._load_checkpoint(name) for _journal, _lock, name in slots] == [c + 3 for c in checkpoints]
+    for journal, _lock, _name in slots:
+        with open(journal, "rb") as f:
+            assert f.read() == b""
+
+def test_hot_window_history_matches_keyset_order():
+    """热窗口: 窗口内的查询由内存按 (record_time, id) 倒序回答，超出窗口返回 None 回落数据库"""
+    from datetime import datetime, timedelta
+    from app.hot_window import ZoneRing, _MIN_TIME, _dt64
+
+    ring = ZoneRing(capacity=10, covered_from=_MIN_TIME)
+    t0 = datetime(2025, 1, 1)
+    for i in range(15):
+        ring.append(i + 1, _dt64(t0 + timedelta(hours=i)), [0.0] * 6)
+
+    ids, times, _ = ring.history(limit=3)
+    assert ids.tolist() == [15, 14, 13]
+    ids, _, _ = ring.history(limit=3, after=(t0 + timedelta(hours=12), 13))
+    assert ids.tolist() == [12, 11, 10]
+    # 最早的 5 条已被挤出，窗口不能完整回答
+    assert ring.history(start=t0, limit=100) is None
+
+def test_shared_snapshot_roundtrip():
+    """共享内存快照: 写入后读出与 crud.get_latest_rows 相同结构的行，等级一并保存"""
+    import os
+    from datetime import datetime
+    import numpy as np
+    from app.shared_snapshot import SharedSnapshot, latest_rows
+
+    snapshot = SharedSnapshot.create(name=f"jellyfish_test_{os.getpid()}", capacity=4)
+    try:
+        rows = [(1, 999, datetime(2025, 1, 1), 26.0, 31.0, 0.5, 2.0, 7.0, 3.0, 999, "Test Zone", "Buoy", 0.0, 0.0)]
+        snapshot.write(rows, np.array([2], dtype=np.int8))
+        data = snapshot.read()
+        assert latest_rows(data) == rows
+        assert data["level"].tolist() == [2]
+    finally:
+        snapshot.close()
+        snapshot.shm.unlink()
+
+def test_partition_retention(client, test_db):
+    """默认分区中的读数在建月度分区时迁入；过期分区压缩进汇总表后删除"""
+    from datetime import datetime
+    from app import partitions
+
+    payload = {"zone_id": 999, "record_time": "2001-01-15T10:20:00", "temperature": 20.0, "salinity": 30.0,
+               "current_speed": 1.0, "chlorophyll": 2.0, "dissolved_oxygen": 6.0, "jellyfish_density": 0.5}
+    assert client.post("/api/monitor/upload", json=payload).status_code == 200
+    test_db.close()
+
+    engine = test_db.get_bind()
+    assert partitions.ensure_partitions(engine, datetime(2001, 1, 1), datetime(2001, 1, 1)) == ["sensor_logs_p200101"]
+    params = {"start": "2001-01-15T00:00:00", "end": "2001-01-16T00:00:00"}
+    raw = client.get("/api/monitor/history/999", params=dict(params, resolution="raw")).json()
+    assert [r["temperature"] for r in raw] == [20.0]
+
+    assert partitions.run_retention(engine, retention_months=1, now=datetime(2001, 3, 1)) == ["sensor_logs_p200101"]
+    assert client.get("/api/monitor/history/999", params=dict(params, resolution="raw")).json() == []
+    hourly = client.get("/api/monitor/history/999", params=dict(params, resolution="hour")).json()
+    assert hourly[0]["sample_count"] == 1
+    assert hourly[0]["temperature"]["mean"] == 20.0